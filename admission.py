@@ -0,0 +1,174 @@
+"""
+Admission control for the PDF rendering routes
+
+Rendering is CPU bound, so each worker only renders a few PDFs at once
+(RENDER_CONCURRENCY), with a separate cap per kind so one big report can't
+take every slot (INVOICE_RENDER_CONCURRENCY, REPORT_RENDER_CONCURRENCY).
+
+Requests beyond that wait in a bounded queue ordered by priority: invoice
+renders (small, someone waiting at the counter) go ahead of reports. When the
+queue is full, or a request has waited ADMISSION_MAX_WAIT seconds, it gets
+an immediate 503 with a Retry-After estimate instead of sitting in gunicorn
+until the worker timeout kills it.
+"""
+
+import functools
+from contextlib import contextmanager
+import itertools
+import math
+import os
+import threading
+import time
+
+import metrics
+
+RENDER_CONCURRENCY = int(os.environ.get('RENDER_CONCURRENCY', 2))
+INVOICE_RENDER_CONCURRENCY = int(os.environ.get('INVOICE_RENDER_CONCURRENCY', RENDER_CONCURRENCY))
+REPORT_RENDER_CONCURRENCY = int(os.environ.get('REPORT_RENDER_CONCURRENCY', 1))
+ADMISSION_QUEUE_SIZE = int(os.environ.get('ADMISSION_QUEUE_SIZE', 16))
+ADMISSION_MAX_WAIT = float(os.environ.get('ADMISSION_MAX_WAIT', 30))
+
+# Lower runs first
+PRIORITIES = {'invoice': 0, 'report': 1}
+
+QUEUE_DEPTH = metrics.Gauge('admission_queue_depth', 'Requests waiting for a render slot', labels=('kind',))
+IN_FLIGHT = metrics.Gauge('admission_in_flight', 'Requests holding a render slot', labels=('kind',))
+REJECTED = metrics.Counter('admission_rejected_total', 'Requests turned away with 503', labels=('kind', 'reason'))
+WAIT_SECONDS = metrics.Histogram(
+    'admission_wait_seconds', 'Time spent queued for a render slot', labels=('kind',),
+    buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+)
+
+
+class Overloaded(Exception):
+    """No render slot could be had; retry_after is a hint in seconds"""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Priority-ordered slots with a total budget and per-kind caps"""
+
+    def __init__(self, total, limits, queue_size, max_wait):
+        self.total = total
+        self.limits = dict(limits)
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self.running = {kind: 0 for kind in self.limits}
+        # Smoothed render time per kind, for Retry-After estimates
+        self.service_seconds = {kind: 1.0 for kind in self.limits}
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+    def _can_run(self, kind):
+        return sum(self.running.values()) < self.total and self.running[kind] < self.limits[kind]
+
+    def _dispatch(self):
+        """Admit queued requests in priority order while slots allow"""
+        for entry in sorted(self._waiters):
+            _, _, kind, event = entry
+            if self._can_run(kind):
+                self._waiters.remove(entry)
+                self.running[kind] += 1
+                event.set()
+        for kind in self.limits:
+            QUEUE_DEPTH.set(sum(1 for entry in self._waiters if entry[2] == kind), kind=kind)
+            IN_FLIGHT.set(self.running[kind], kind=kind)
+
+    def retry_after(self, kind):
+        """Rough seconds until a slot frees up for a new request of this kind"""
+        queued = len(self._waiters) + self.running[kind]
+        slots = max(1, min(self.total, self.limits[kind]))
+        return max(1, math.ceil(self.service_seconds[kind] * queued / slots))
+
+    def acquire(self, kind):
+        """Wait for a slot; raises Overloaded when the queue is full or the wait too long"""
+        started = time.monotonic()
+        event = threading.Event()
+        entry = (PRIORITIES.get(kind, len(PRIORITIES)), next(self._sequence), kind, event)
+        with self._lock:
+            if len(self._waiters) >= self.queue_size and not self._can_run(kind):
+                REJECTED.inc(kind=kind, reason='queue_full')
+                raise Overloaded('queue_full', self.retry_after(kind))
+            self._waiters.append(entry)
+            self._dispatch()
+
+        if not event.wait(self.max_wait):
+            with self._lock:
+                if not event.is_set():
+                    self._waiters.remove(entry)
+                    self._dispatch()
+                    REJECTED.inc(kind=kind, reason='timeout')
+                    raise Overloaded('timeout', self.retry_after(kind))
+        WAIT_SECONDS.observe(time.monotonic() - started, kind=kind)
+
+    def release(self, kind, seconds):
+        with self._lock:
+            self.running[kind] -= 1
+            self.service_seconds[kind] = 0.8 * self.service_seconds[kind] + 0.2 * seconds
+            self._dispatch()
+
+
+controller = AdmissionController(
+    RENDER_CONCURRENCY,
+    {'invoice': INVOICE_RENDER_CONCURRENCY, 'report': REPORT_RENDER_CONCURRENCY},
+    ADMISSION_QUEUE_SIZE,
+    ADMISSION_MAX_WAIT
+)
+
+
+def overloaded_response(error):
+    """503 response for an Overloaded error"""
+    from flask import jsonify
+    response = jsonify({
+        'error': 'Server is busy rendering other documents, please retry shortly',
+        'reason': error.reason
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+
+@contextmanager
+def slot(kind):
+    """Hold a `kind` render slot for the duration of a block (raises Overloaded)"""
+    controller.acquire(kind)
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        controller.release(kind, time.monotonic() - started)
+
+
+def limit(kind):
+    """Route decorator: run the view only once a `kind` render slot is free"""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            from flask import make_response
+            try:
+                controller.acquire(kind)
+            except Overloaded as e:
+                return overloaded_response(e)
+            started = time.monotonic()
+
+            def release():
+                controller.release(kind, time.monotonic() - started)
+
+            try:
+                response = make_response(view(*args, **kwargs))
+            except Exception:
+                release()
+                raise
+            # Streamed bodies (e.g. bulk ZIP export) render while being sent
+            if response.is_streamed:
+                response.call_on_close(release)
+            else:
+                release()
+            return response
+        return wrapper
+    return decorator
@@ -1,18 +1,40 @@
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, Response, render_template, request, jsonify, send_file
 import json
 import pandas as pd
 from datetime import datetime
 import os
 from reportlab.lib.pagesizes import letter, A4
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image
+from reportlab.platypus import SimpleDocTemplate, Table, LongTable, TableStyle, Paragraph, Spacer
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
 from reportlab.lib import colors
 from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
 import io
+import logging
+import threading
+import uuid
+from collections import OrderedDict
 from database import db
+import admission
+import analytics
+import compression
+from invoice_pdf import create_invoice_pdf, invoice_record_to_pdf_data, invoice_totals_text
+import logging_config
+import metrics
+import money
+import profiling
+import singleflight
+import timeseries
+import tracing
+
+logging_config.configure_logging()
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
+metrics.init_app(app)
+tracing.init_app(app)
+profiling.init_app(app)
+compression.init_app(app)
 
 # Debug: Print all routes when app starts
 def print_routes():
@@ -52,16 +74,29 @@ schools_data = None
 
 def get_books_data():
     global books_data
+    metrics.record_cache('books', books_data is not None)
     if books_data is None:
         books_data = load_books()
     return books_data
 
 def get_schools_data():
     global schools_data
+    metrics.record_cache('schools', schools_data is not None)
     if schools_data is None:
         schools_data = load_schools()
     return schools_data
 
+def reset_process_state():
+    """Reset per-process caches and locks after a gunicorn worker forks"""
+    global books_data, schools_data, _invoice_pdf_cache_lock
+    logging_config.configure_logging()
+    metrics.after_fork()
+    db.after_fork()
+    books_data = None
+    schools_data = None
+    _invoice_pdf_cache_lock = threading.Lock()
+    _invoice_pdf_cache.clear()
+
 @app.route('/')
 def index():
     try:
@@ -181,8 +216,7 @@ def test_api():
 def database_status():
     """Check database status"""
     try:
-        import sqlite3
-        conn = sqlite3.connect('invoices.db')
+        conn = db.get_connection()
         cursor = conn.cursor()
         
         # Check if tables exist
@@ -216,6 +250,13 @@ def database_status():
             'database_exists': False
         })
 
+@app.route('/api/debug/queries')
+def query_statistics():
+    """Top SQL statements in this worker by total time, with plan warnings"""
+    import query_log
+    top = request.args.get('top', 20, type=int)
+    return jsonify({'success': True, 'pid': os.getpid(), 'queries': query_log.query_stats(top)})
+
 @app.route('/api/database/import-schools', methods=['POST'])
 def import_schools():
     """Manually import schools from CSV"""
@@ -237,57 +278,61 @@ def import_schools():
 def add_sample_data():
     """Add sample schools and invoice for testing"""
     try:
-        import sqlite3
-        conn = sqlite3.connect('invoices.db')
-        cursor = conn.cursor()
-        
-        # Add sample schools
-        sample_schools = [
-            ('FEDERAL GOVERNMENT COLLEGE', '08012345678', 'Abuja', 'DANIEL MMEYENE'),
-            ('APOSTOLIC DIVINE TOUCH SCHOOL', '08087654321', 'Lagos', 'NDIFON ISAIAH NTUI'),
-            ('THE GRACE AND GOLD SCHOOL', '08011111111', 'Kano', 'NDIFON ISAIAH NTUI')
-        ]
-        
-        schools_added = 0
-        for school_name, phone, address, sales_manager in sample_schools:
-            cursor.execute('SELECT id FROM schools WHERE school_name = ?', (school_name,))
-            if not cursor.fetchone():
-                cursor.execute('''
-                    INSERT INTO schools (school_name, phone_number, address, sales_manager)
-                    VALUES (?, ?, ?, ?)
-                ''', (school_name, phone, address, sales_manager))
-                schools_added += 1
-        
-        # Add sample invoice
-        cursor.execute('''
-            INSERT INTO invoices (
-                invoice_number, invoice_type, customer_name, customer_phone,
-                customer_address, sales_manager, bank_name, account_number,
-                total_quantity, gross_total, discount_percent, discount_amount, net_total
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            'HO/IN/2510081430', 'credit', 'FEDERAL GOVERNMENT COLLEGE', '08012345678',
-            'Abuja', 'DANIEL MMEYENE', 'ZENITH BANK', '1229600064',
-            5, 25000.0, 10.0, 2500.0, 22500.0
-        ))
-        
-        invoice_id = cursor.lastrowid
-        
-        # Add sample items
-        sample_items = [
-            (invoice_id, 'MATH/P1/ADDITI/M', 'PRIMARY MATHS BK 1', 'Primary 1', 'Mathematics', 5000.0, 3, 15000.0),
-            (invoice_id, 'ENG/P1/READIN/E', 'PRIMARY ENGLISH BK 1', 'Primary 1', 'English', 5000.0, 2, 10000.0)
-        ]
-        
-        for item in sample_items:
+        conn = db.begin_write()
+        try:
+            cursor = conn.cursor()
+            
+            # Add sample schools
+            sample_schools = [
+                ('FEDERAL GOVERNMENT COLLEGE', '08012345678', 'Abuja', 'DANIEL MMEYENE'),
+                ('APOSTOLIC DIVINE TOUCH SCHOOL', '08087654321', 'Lagos', 'NDIFON ISAIAH NTUI'),
+                ('THE GRACE AND GOLD SCHOOL', '08011111111', 'Kano', 'NDIFON ISAIAH NTUI')
+            ]
+            
+            schools_added = 0
+            for school_name, phone, address, sales_manager in sample_schools:
+                cursor.execute('SELECT id FROM schools WHERE school_name = ?', (school_name,))
+                if not cursor.fetchone():
+                    cursor.execute('''
+                        INSERT INTO schools (school_name, phone_number, address, sales_manager)
+                        VALUES (?, ?, ?, ?)
+                    ''', (school_name, phone, address, sales_manager))
+                    schools_added += 1
+            
+            # Add sample invoice
             cursor.execute('''
-                INSERT INTO invoice_items (
-                    invoice_id, book_code, book_title, book_grade, book_subject, rate, quantity, gross_amount
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', item)
-        
-        conn.commit()
-        conn.close()
+                INSERT INTO invoices (
+                    invoice_number, invoice_type, customer_name, customer_phone,
+                    customer_address, sales_manager, bank_name, account_number,
+                    total_quantity, gross_total_kobo, discount_percent, discount_amount_kobo, net_total_kobo
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                'HO/IN/2510081430', 'credit', 'FEDERAL GOVERNMENT COLLEGE', '08012345678',
+                'Abuja', 'DANIEL MMEYENE', 'ZENITH BANK', '1229600064',
+                5, 2500000, 10.0, 250000, 2250000
+            ))
+            
+            invoice_id = cursor.lastrowid
+            
+            # Add sample items
+            sample_items = [
+                ('MATH/P1/ADDITI/M', 'PRIMARY MATHS BK 1', 'Primary 1', 'Mathematics', 500000, 3, 1500000),
+                ('ENG/P1/READIN/E', 'PRIMARY ENGLISH BK 1', 'Primary 1', 'English', 500000, 2, 1000000)
+            ]
+            
+            for book_code, title, grade, subject, rate_kobo, quantity, gross_amount_kobo in sample_items:
+                cursor.execute('''
+                    INSERT INTO invoice_items (
+                        invoice_id, book_id, rate_kobo, quantity, gross_amount_kobo
+                    ) VALUES (?, ?, ?, ?, ?)
+                ''', (invoice_id, db.book_id(cursor, book_code, title, grade, subject), rate_kobo, quantity, gross_amount_kobo))
+            
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            db.end_write(conn)
         
         return jsonify({
             'success': True,
@@ -317,11 +362,11 @@ def get_school_history(school_name):
                 'date': invoice['created_at'],
                 'sales_manager': invoice['sales_manager'],
                 'total_quantity': invoice['total_quantity'],
-                'gross_total': invoice['gross_total'],
+                'gross_total': money.naira(invoice['gross_total_kobo']),
                 'discount_percent': invoice['discount_percent'],
-                'net_total': invoice['net_total'],
+                'net_total': money.naira(invoice['net_total_kobo']),
                 'item_count': invoice['item_count'],
-                'items': invoice['items']
+                'items': money.as_naira(invoice['items'])
             })
         
         return jsonify({
@@ -336,10 +381,9 @@ def get_school_history(school_name):
 @app.route('/api/invoices/<invoice_number>')
 def get_invoice_details(invoice_number):
     """Get full details of a specific invoice by invoice number"""
-    print(f"Searching for invoice: {invoice_number}")
     try:
         invoice = db.get_invoice_by_number(invoice_number)
-        print(f"Invoice found: {invoice is not None}")
+        logger.info("Invoice lookup", extra={'invoice_number': invoice_number, 'found': invoice is not None, 'sample_rate': 0.01})
         
         if not invoice:
             return jsonify({'error': 'Invoice not found'}), 404
@@ -352,9 +396,9 @@ def get_invoice_details(invoice_number):
                 'title': item['book_title'],
                 'grade': item.get('book_grade', ''),
                 'subject': item.get('book_subject', ''),
-                'price': float(item['rate']),
+                'price': money.naira(item['rate_kobo']),
                 'quantity': int(item['quantity']),
-                'gross_amount': float(item['gross_amount'])
+                'gross_amount': money.naira(item['gross_amount_kobo'])
             })
         
         return jsonify({
@@ -370,10 +414,10 @@ def get_invoice_details(invoice_number):
                 'account_number': invoice['account_number'],
                 'date': invoice['created_at'],
                 'total_quantity': invoice['total_quantity'],
-                'gross_total': invoice['gross_total'],
+                'gross_total': money.naira(invoice['gross_total_kobo']),
                 'discount_percent': invoice['discount_percent'],
-                'discount_amount': invoice['discount_amount'],
-                'net_total': invoice['net_total'],
+                'discount_amount': money.naira(invoice['discount_amount_kobo']),
+                'net_total': money.naira(invoice['net_total_kobo']),
                 'items': formatted_items
             }
         })
@@ -381,6 +425,7 @@ def get_invoice_details(invoice_number):
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/invoices/reprint/<invoice_number>', methods=['POST'])
+@admission.limit('invoice')
 def reprint_invoice(invoice_number):
     """Reprint an existing invoice"""
     try:
@@ -389,33 +434,12 @@ def reprint_invoice(invoice_number):
         if not invoice:
             return jsonify({'error': 'Invoice not found'}), 404
         
-        # Format items for PDF generation
-        formatted_items = []
-        for item in invoice.get('items', []):
-            formatted_items.append({
-                'book_code': item['book_code'],
-                'title': item['book_title'],
-                'grade': item.get('book_grade', ''),
-                'subject': item.get('book_subject', ''),
-                'price': float(item['rate']),
-                'quantity': int(item['quantity'])
-            })
-        
         # Prepare invoice data for PDF
-        invoice_data = {
-            'customer_name': invoice['customer_name'],
-            'customer_phone': invoice.get('customer_phone', ''),
-            'customer_address': invoice.get('customer_address', ''),
-            'sales_manager': invoice['sales_manager'],
-            'bank_name': invoice['bank_name'],
-            'account_number': invoice['account_number'],
-            'discount_percent': invoice['discount_percent'],
-            'invoice_type': invoice['invoice_type'],
-            'items': formatted_items
-        }
+        invoice_data = invoice_record_to_pdf_data(invoice)
         
         # Generate PDF
         pdf_buffer = create_invoice_pdf(invoice_data, invoice['invoice_number'])
+        cache_invoice_pdf(invoice['invoice_number'], pdf_buffer.getvalue())
         
         # Return as base64
         import base64
@@ -429,6 +453,60 @@ def reprint_invoice(invoice_number):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/invoices/bulk-export', methods=['POST'])
+@admission.limit('report')
+def bulk_export_invoices():
+    """Export many invoices as one merged PDF or a ZIP of PDFs"""
+    data = request.json or {}
+    start_date = data.get('start_date')
+    end_date = data.get('end_date')
+    sales_manager = data.get('sales_manager')
+    export_format = data.get('format', 'pdf')
+    
+    if not (start_date and end_date) and not sales_manager:
+        return jsonify({'error': 'A date range or a sales manager is required'}), 400
+    
+    if export_format not in ('pdf', 'zip'):
+        return jsonify({'error': 'Format must be pdf or zip'}), 400
+    
+    try:
+        invoice_numbers = db.get_invoice_numbers(start_date, end_date, sales_manager)
+        if not invoice_numbers:
+            return jsonify({'error': 'No invoices match the selection'}), 404
+        
+        import bulk_export
+        # Progress goes to the structured log, tagged so one export's lines can be followed
+        request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+        
+        def log_progress(done, total):
+            if done == total or done % bulk_export.PROGRESS_EVERY == 0:
+                logger.info("Bulk export progress", extra={
+                    'request_id': request_id, 'format': export_format, 'rendered': done, 'total': total
+                })
+        
+        if export_format == 'zip':
+            return Response(
+                bulk_export.stream_zip(invoice_numbers, progress=log_progress),
+                mimetype='application/zip',
+                headers={
+                    'Content-Disposition': 'attachment; filename=invoices.zip',
+                    'X-Invoice-Count': str(len(invoice_numbers)),
+                    'X-Request-ID': request_id
+                }
+            )
+        
+        pdf_bytes = bulk_export.merge_pdfs(invoice_numbers, progress=log_progress)
+        response = send_file(
+            io.BytesIO(pdf_bytes),
+            mimetype='application/pdf',
+            as_attachment=True,
+            download_name='invoices.pdf'
+        )
+        response.headers['X-Request-ID'] = request_id
+        return response
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/reports')
 def reports_page():
     """Reports page"""
@@ -450,7 +528,10 @@ def get_report_summary():
         return jsonify({'error': 'Start date and end date are required'}), 400
     
     try:
-        summary = db.get_invoice_summary(start_date, end_date)
+        summary = singleflight.cached_report(
+            'summary', start_date, end_date, db.get_range_version(start_date, end_date),
+            lambda: money.as_naira(analytics.invoice_summary(db, start_date, end_date))
+        )
         return jsonify(summary)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -466,138 +547,344 @@ def get_report_invoices():
         return jsonify({'error': 'Start date and end date are required'}), 400
     
     try:
-        invoices = db.get_invoices_by_date_range(start_date, end_date)
+        invoices = singleflight.cached_report(
+            'invoices', start_date, end_date, db.get_range_version(start_date, end_date),
+            lambda: money.as_naira(db.get_invoices_by_date_range(start_date, end_date))
+        )
         return jsonify(invoices)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/reports/books', methods=['POST'])
+def get_report_books():
+    """Quantity and revenue per book for date range, optionally drilled down by sales manager"""
+    data = request.json or {}
+    start_date = data.get('start_date')
+    end_date = data.get('end_date')
+    sales_manager = data.get('sales_manager') or None
+    by_sales_manager = bool(data.get('by_sales_manager'))
+
+    if not start_date or not end_date:
+        return jsonify({'error': 'Start date and end date are required'}), 400
+
+    try:
+        books = singleflight.cached_report(
+            f"books:{sales_manager or ''}:{int(by_sales_manager)}", start_date, end_date,
+            db.get_range_version(start_date, end_date),
+            lambda: money.as_naira(db.get_book_sales(start_date, end_date, sales_manager, by_sales_manager))
+        )
+        return jsonify({
+            'start_date': start_date,
+            'end_date': end_date,
+            'sales_manager': sales_manager,
+            'books': books
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/reports/sales-managers', methods=['POST'])
+def get_report_sales_managers():
+    """Sales manager leaderboard and per-manager series (day, week or month) for date range"""
+    data = request.json or {}
+    start_date = data.get('start_date')
+    end_date = data.get('end_date')
+    interval = data.get('interval') or 'day'
+    sales_manager = data.get('sales_manager') or None
+
+    if not start_date or not end_date:
+        return jsonify({'error': 'Start date and end date are required'}), 400
+
+    if interval not in timeseries.INTERVALS:
+        return jsonify({'error': f"Interval must be one of {', '.join(timeseries.INTERVALS)}"}), 400
+
+    try:
+        performance = singleflight.cached_report(
+            f"sales-managers:{interval}:{sales_manager or ''}", start_date, end_date,
+            db.get_range_version(start_date, end_date),
+            lambda: money.as_naira(db.get_sales_manager_performance(start_date, end_date, interval, sales_manager))
+        )
+        return jsonify(dict(performance, start_date=start_date, end_date=end_date, interval=interval))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/reports/series', methods=['POST'])
+def get_report_series():
+    """Totals per day, week or month for date range, by invoice type, zero-filled"""
+    data = request.json or {}
+    start_date = data.get('start_date')
+    end_date = data.get('end_date')
+    interval = data.get('interval') or 'day'
+    invoice_type = data.get('invoice_type') or None
+
+    if not start_date or not end_date:
+        return jsonify({'error': 'Start date and end date are required'}), 400
+
+    if interval not in timeseries.INTERVALS:
+        return jsonify({'error': f"Interval must be one of {', '.join(timeseries.INTERVALS)}"}), 400
+
+    try:
+        series = singleflight.cached_report(
+            f"series:{interval}:{invoice_type or ''}", start_date, end_date,
+            db.get_range_version(start_date, end_date),
+            lambda: money.as_naira(db.get_revenue_series(start_date, end_date, interval, invoice_type))
+        )
+        return jsonify(dict(series, start_date=start_date, end_date=end_date, interval=interval))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/reports/export')
+def export_report():
+    """Stream invoices and line items for a date range as CSV or XLSX"""
+    start_date = request.args.get('start_date')
+    end_date = request.args.get('end_date')
+    export_format = request.args.get('format', 'csv')
+
+    if not start_date or not end_date:
+        return jsonify({'error': 'Start date and end date are required'}), 400
+
+    if export_format not in ('csv', 'xlsx'):
+        return jsonify({'error': 'Format must be csv or xlsx'}), 400
+
+    import report_export
+    rows = db.iter_report_line_items(start_date, end_date)
+    filename = f"invoice_report_{start_date}_to_{end_date}.{export_format}"
+
+    if export_format == 'csv':
+        body = report_export.stream_csv(db.REPORT_EXPORT_COLUMNS, rows)
+        mimetype = 'text/csv'
+    else:
+        # SQL aggregates rather than analytics.invoice_summary, whose DataFrame
+        # of the whole range would undo the streamed rows' constant memory
+        summary_rows = analytics.summary_rows(db.get_invoice_summary(start_date, end_date))
+        body = report_export.stream_xlsx(db.REPORT_EXPORT_COLUMNS, rows, summary_rows=summary_rows)
+        mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+    return Response(body, mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename={filename}'
+    })
+
+def render_report_pdf(start_date, end_date):
+    """Query and render a report PDF, holding a report render slot"""
+    with admission.slot('report'):
+        # Invoice headers are streamed from a cursor on another read connection,
+        # which starts fetching now, alongside the summary; line items are never loaded
+        invoices = db.stream_in_background(
+            lambda conn: db.invoice_header_rows(conn, start_date, end_date)
+        )
+        
+        try:
+            with tracing.span('invoice_summary'):
+                summary = analytics.invoice_summary(db, start_date, end_date)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Report summary", extra={'summary': summary})
+            
+            with tracing.span('create_report_pdf'):
+                pdf_bytes = create_report_pdf(summary, invoices, start_date, end_date).getvalue()
+        finally:
+            invoices.close()
+    
+    logger.info("Report PDF generated", extra={
+        'start_date': start_date, 'end_date': end_date,
+        'invoice_count': summary['total_invoices'], 'pdf_bytes': len(pdf_bytes)
+    })
+    return pdf_bytes
+
 @app.route('/api/reports/generate-pdf', methods=['POST'])
 def generate_report_pdf():
     """Generate PDF report for date range"""
-    print("PDF generation request received")
     data = request.json
-    print(f"Received data: {data}")
     
     # Handle both camelCase and snake_case
     start_date = data.get('start_date') or data.get('startDate')
     end_date = data.get('end_date') or data.get('endDate')
     
-    print(f"Date range: {start_date} to {end_date}")
-    
     if not start_date or not end_date:
         return jsonify({'error': 'Start date and end date are required'}), 400
     
     try:
-        # Get data
-        print("Getting summary data...")
-        summary = db.get_invoice_summary(start_date, end_date)
-        print(f"Summary: {summary}")
-        
-        print("Getting invoice data...")
-        invoices = db.get_invoices_by_date_range(start_date, end_date)
-        print(f"Invoices count: {len(invoices)}")
-        
-        # Create PDF
-        print("Creating PDF...")
-        pdf_buffer = create_report_pdf(summary, invoices, start_date, end_date)
-        print("PDF created successfully")
+        # Identical concurrent requests share one render (and its render slot).
+        # The PDF's footer carries its generation time, so even a closed
+        # month's PDF is only reused briefly, never kept indefinitely
+        pdf_bytes = singleflight.cached_report(
+            'report_pdf', start_date, end_date, db.get_range_version(start_date, end_date),
+            lambda: render_report_pdf(start_date, end_date), keep_closed=False
+        )
         
         # Return as base64
         import base64
-        pdf_base64 = base64.b64encode(pdf_buffer.getvalue()).decode('utf-8')
-        print(f"PDF encoded, size: {len(pdf_base64)} characters")
+        with tracing.span('base64_encode'):
+            pdf_base64 = base64.b64encode(pdf_bytes).decode('utf-8')
         
         return jsonify({
             'success': True,
             'pdf_data': pdf_base64
         })
+    except admission.Overloaded as e:
+        return admission.overloaded_response(e)
     except Exception as e:
-        print(f"Error generating PDF: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error generating report PDF", extra={'start_date': start_date, 'end_date': end_date})
         return jsonify({'error': str(e)}), 500
 
+# Idempotency-Key handling for /api/generate-invoice
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', 24 * 60 * 60))
+IDEMPOTENCY_WAIT_SECONDS = float(os.environ.get('IDEMPOTENCY_WAIT_SECONDS', 60))
+# How long a pending claim holds its key; past this (about gunicorn's worker
+# timeout) its request is presumed dead and a retry may claim the key
+IDEMPOTENCY_LEASE_SECONDS = int(os.environ.get('IDEMPOTENCY_LEASE_SECONDS', 150))
+IDEMPOTENCY_POLL_SECONDS = 0.2
+
+def idempotency_request_hash(data):
+    """Fingerprint of a request body, so a key can't be reused for a different invoice"""
+    import hashlib
+    return hashlib.sha256(json.dumps(data, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+def idempotent_replay(record):
+    """Response for a request whose key already completed"""
+    import base64
+    response = jsonify({
+        'success': True,
+        'invoice_number': record['invoice_number'],
+        'pdf_data': base64.b64encode(record['pdf_data']).decode('utf-8')
+    })
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+def claim_or_replay(idempotency_key, request_hash):
+    """Claim the key for this request (returns None) or return the response to send instead
+
+    A duplicate that arrives while the first request is still running waits
+    for it and replays its result. If the first request fails, its key is
+    released and the duplicate claims it and does the work itself; if the
+    first request's worker died, the duplicate takes the key over once the
+    claim's lease has run out. Called before taking a render slot, so a
+    waiting duplicate doesn't hold one.
+    """
+    import time
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+    while True:
+        record = db.claim_idempotency_key(
+            idempotency_key, request_hash, IDEMPOTENCY_TTL_SECONDS, IDEMPOTENCY_LEASE_SECONDS
+        )
+        if record is None:
+            return None
+        if record['request_hash'] != request_hash:
+            return jsonify({'error': 'Idempotency-Key was already used for a different request'}), 422
+
+        while record is not None and record['status'] == 'pending':
+            if time.monotonic() > deadline:
+                response = jsonify({'error': 'A request with this Idempotency-Key is still in progress'})
+                response.headers['Retry-After'] = '5'
+                return response, 409
+            time.sleep(IDEMPOTENCY_POLL_SECONDS)
+            record = db.get_idempotency_key(idempotency_key)
+
+        if record is not None:
+            return idempotent_replay(record)
+        # The first request failed and released the key, or its lease ran
+        # out; try to claim it again
+
 @app.route('/api/generate-invoice', methods=['POST'])
 def generate_invoice():
     try:
-        print("=== INVOICE GENERATION REQUEST ===")
-        data = request.json
-        print(f"Received data: {data}")
+        with tracing.span('parse_json'):
+            data = request.json
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Invoice generation request", extra={'request_body': data})
         
         if not data:
             return jsonify({'error': 'No data received'}), 400
         
+        # A retried request with the same key gets the first request's result
+        idempotency_key = request.headers.get('Idempotency-Key')
+        if idempotency_key is not None:
+            if not idempotency_key or len(idempotency_key) > 255:
+                return jsonify({'error': 'Idempotency-Key must be 1-255 characters'}), 400
+            with tracing.span('idempotency_claim'):
+                replay = claim_or_replay(idempotency_key, idempotency_request_hash(data))
+            if replay is not None:
+                return replay
+        
         # Generate invoice number
         invoice_number = f"HO/IN/{datetime.now().strftime('%y%m%d%H%M')}"
-        print(f"Generated invoice number: {invoice_number}")
     except Exception as e:
-        print(f"Error in invoice generation setup: {e}")
+        logger.exception("Error in invoice generation setup")
         return jsonify({'error': f'Setup error: {str(e)}'}), 500
     
     try:
-        # Calculate totals
-        total_quantity = sum(item['quantity'] for item in data['items'])
-        gross_total = sum(item['quantity'] * item['price'] for item in data['items'])
-        discount_amount = gross_total * (data['discount_percent'] / 100)
-        net_total = gross_total - discount_amount
-        
-        print(f"Calculated totals: quantity={total_quantity}, gross={gross_total}, discount={discount_amount}, net={net_total}")
-        
-        # Prepare invoice data for database
-        invoice_data = {
-            'invoice_number': invoice_number,
-            'invoice_type': data['invoice_type'],
-            'customer_name': data['customer_name'],
-            'customer_phone': data.get('customer_phone', ''),
-            'customer_address': data.get('customer_address', ''),
-            'sales_manager': data['sales_manager'],
-            'bank_name': data['bank_name'],
-            'account_number': data['account_number'],
-            'total_quantity': total_quantity,
-            'gross_total': gross_total,
-            'discount_percent': data['discount_percent'],
-            'discount_amount': discount_amount,
-            'net_total': net_total,
-            'items': data['items']
-        }
-        
-        # Save to database
-        print("Attempting to save invoice to database...")
-        print(f"Invoice data: {invoice_data}")
-        invoice_id = db.save_invoice(invoice_data)
-        print(f"Invoice saved to database with ID: {invoice_id}")
-        
-        # Automatically create a 20% discounted version
-        try:
-            discounted_invoice_id = db.create_discounted_invoice(invoice_id, 20.0)
-            print(f"Discounted invoice created with ID: {discounted_invoice_id}")
-        except Exception as e:
-            print(f"Error creating discounted invoice: {e}")
-            # Continue even if discounted version fails
-        
-        # Create PDF
-        print("Creating PDF...")
-        pdf_buffer = create_invoice_pdf(data, invoice_number)
-        print("PDF created successfully")
-        
-        # For Vercel, return the PDF directly as base64
-        import base64
-        pdf_base64 = base64.b64encode(pdf_buffer.getvalue()).decode('utf-8')
-        print(f"PDF encoded, size: {len(pdf_base64)} characters")
-        
-        return jsonify({
-            'success': True,
-            'invoice_number': invoice_number,
-            'pdf_data': pdf_base64
-        })
+        # The render slot is taken only now: a duplicate waiting in
+        # claim_or_replay above doesn't hold one
+        with admission.slot('invoice'):
+            # Calculate totals in integer kobo
+            total_quantity, gross_kobo, discount_kobo, net_kobo = money.invoice_totals(
+                data['items'], data['discount_percent']
+            )
+            
+            # Prepare invoice data for database
+            invoice_data = {
+                'invoice_number': invoice_number,
+                'invoice_type': data['invoice_type'],
+                'customer_name': data['customer_name'],
+                'customer_phone': data.get('customer_phone', ''),
+                'customer_address': data.get('customer_address', ''),
+                'sales_manager': data['sales_manager'],
+                'bank_name': data['bank_name'],
+                'account_number': data['account_number'],
+                'total_quantity': total_quantity,
+                'gross_total_kobo': gross_kobo,
+                'discount_percent': data['discount_percent'],
+                'discount_amount_kobo': discount_kobo,
+                'net_total_kobo': net_kobo,
+                'items': data['items']
+            }
+            
+            # Save to database
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Saving invoice", extra={'invoice': invoice_data})
+            with tracing.span('save_invoice'):
+                invoice_id = db.save_invoice(invoice_data)
+            
+            # The 20% discounted copy is created on demand by
+            # /api/generate-discounted-invoice, not duplicated here up front
+            
+            # Create PDF
+            with tracing.span('create_invoice_pdf'):
+                pdf_buffer = create_invoice_pdf(data, invoice_number)
+            cache_invoice_pdf(invoice_number, pdf_buffer.getvalue())
+            
+            # For Vercel, return the PDF directly as base64
+            import base64
+            with tracing.span('base64_encode'):
+                pdf_base64 = base64.b64encode(pdf_buffer.getvalue()).decode('utf-8')
+            logger.info("Invoice generated", extra={
+                'invoice_number': invoice_number, 'invoice_id': invoice_id, 'line_count': len(data['items']),
+                'net_total_kobo': net_kobo, 'pdf_bytes': pdf_buffer.getbuffer().nbytes
+            })
+            
+            if idempotency_key:
+                db.complete_idempotency_key(idempotency_key, invoice_number, pdf_buffer.getvalue())
+            
+            return jsonify({
+                'success': True,
+                'invoice_number': invoice_number,
+                'pdf_data': pdf_base64
+            })
         
+    except admission.Overloaded as e:
+        if idempotency_key:
+            db.release_idempotency_key(idempotency_key)
+        return admission.overloaded_response(e)
     except Exception as e:
-        print(f"Error in invoice processing: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error in invoice processing", extra={'invoice_number': invoice_number})
+        if idempotency_key:
+            db.release_idempotency_key(idempotency_key)
         return jsonify({'error': f'Invoice processing error: {str(e)}'}), 500
 
 @app.route('/api/generate-discounted-invoice', methods=['POST'])
+@admission.limit('invoice')
 def generate_discounted_invoice():
     """Generate a 20% discounted version of an existing invoice"""
     data = request.json
@@ -612,7 +899,7 @@ def generate_discounted_invoice():
         if not original_invoice:
             return jsonify({'error': 'Original invoice not found'}), 404
         
-        # Create discounted version
+        # Create the discounted copy on first request (later requests reuse it)
         discounted_invoice_id = db.create_discounted_invoice(original_invoice['id'], 20.0)
         
         # Get the discounted invoice data
@@ -621,31 +908,8 @@ def generate_discounted_invoice():
         if not discounted_invoice_data:
             return jsonify({'error': 'Failed to retrieve discounted invoice data'}), 500
         
-        # Get items for the discounted invoice
-        conn = sqlite3.connect('invoices.db')
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM invoice_items WHERE invoice_id = ?', (discounted_invoice_id,))
-        item_columns = [description[0] for description in cursor.description]
-        items = [dict(zip(item_columns, row)) for row in cursor.fetchall()]
-        conn.close()
-        
-        # Format items for PDF generation
-        formatted_items = []
-        for item in items:
-            formatted_items.append({
-                'book_code': item['book_code'],
-                'title': item['book_title'],
-                'grade': item.get('book_grade', ''),
-                'subject': item.get('book_subject', ''),
-                'price': float(item['rate']),
-                'quantity': int(item['quantity'])
-            })
-        
-        # Add items to invoice data
-        discounted_invoice_data['items'] = formatted_items
-        
-        # Generate PDF for the discounted invoice
-        pdf_data = generate_invoice_pdf(discounted_invoice_data)
+        # Derive the discounted PDF from the original's rendering
+        pdf_data = create_discounted_invoice_pdf(original_invoice, discounted_invoice_data)
         
         # Return as base64
         import base64
@@ -683,365 +947,97 @@ def not_found(error):
         "requested_path": request.path
     }), 404
 
-def create_invoice_pdf(data, invoice_number):
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=0.3*inch, bottomMargin=0.3*inch)
-    
-    # Styles
-    styles = getSampleStyleSheet()
-    
-    # Custom styles to match the original design
-    title_style = ParagraphStyle(
-        'InvoiceTitle',
-        parent=styles['Heading1'],
-        fontSize=28,
-        textColor=colors.black,
-        alignment=TA_CENTER,
-        spaceAfter=15,
-        fontName='Helvetica-Bold'
-    )
-    
-    company_style = ParagraphStyle(
-        'CompanyInfo',
-        parent=styles['Normal'],
-        fontSize=11,
-        textColor=colors.black,
-        alignment=TA_LEFT,
-        fontName='Helvetica-Bold'
-    )
-    
-    normal_style = ParagraphStyle(
-        'NormalText',
-        parent=styles['Normal'],
-        fontSize=10,
-        textColor=colors.black,
-        alignment=TA_LEFT,
-        fontName='Helvetica'
-    )
-    
-    # Story (content)
-    story = []
-    
-    # Logo and Company Header
-    logo_path = "WhatsApp_Image_2025-08-01_at_12.46.28_e1c96073-removebg-preview.png"
-    if os.path.exists(logo_path):
-        logo = Image(logo_path, width=1.5*inch, height=0.8*inch)
-        story.append(logo)
-        story.append(Spacer(1, 5))
-    
-    # Company Slogan
-    slogan_style = ParagraphStyle(
-        'Slogan',
-        parent=styles['Normal'],
-        fontSize=9,
-        textColor=colors.grey,
-        alignment=TA_CENTER,
-        fontName='Helvetica-Oblique',
-        spaceAfter=10
-    )
-    story.append(Paragraph("...global positioning for the african child", slogan_style))
-    
-    # Invoice Title
-    story.append(Paragraph("INVOICE", title_style))
-    story.append(Spacer(1, 15))
-    
-    # Company Information Table
-    company_data = [
-        ["EDUWAVES PUBLISHERS LTD", "", f"Date: {datetime.now().strftime('%d-%b-%Y')}"],
-        ["14 Onitsha Crescent, Area 11", "", f"Invoice No.: {invoice_number}"],
-        ["Garki, Abuja-FCT, Nigeria", "", f"Order No.: HO/OR/{datetime.now().strftime('%y%m%d')}"]
-    ]
-    
-    company_table = Table(company_data, colWidths=[3.5*inch, 0.5*inch, 2.5*inch])
-    company_table.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (0, -1), 'LEFT'),
-        ('ALIGN', (2, 0), (2, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTNAME', (2, 0), (2, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('LEFTPADDING', (0, 0), (-1, -1), 0),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 0),
-        ('TOPPADDING', (0, 0), (-1, -1), 2),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 2),
-    ]))
-    
-    story.append(company_table)
-    story.append(Spacer(1, 15))
-    
-    # Sales Manager (top right)
-    sm_name = data.get('sales_manager', 'DANIEL MMEYENE')
-    sm_para = Paragraph(f"<para align='right'><b>{sm_name}</b></para>", normal_style)
-    story.append(sm_para)
-    story.append(Spacer(1, 10))
-    
-    # Customer Information
-    customer_name = data.get('customer_name', '')
-    customer_address = data.get('customer_address', '')
-    customer_phone = data.get('customer_phone', '')
-    
-    customer_data = [
-        ["To:", f"{customer_name}"],
-        ["", f"{customer_address}"],
-        ["", f"{customer_phone}"]
-    ]
-    
-    customer_table = Table(customer_data, colWidths=[0.8*inch, 5.5*inch])
-    customer_table.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('LEFTPADDING', (0, 0), (-1, -1), 0),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 0),
-        ('TOPPADDING', (0, 0), (-1, -1), 2),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 2),
-    ]))
-    
-    story.append(customer_table)
-    story.append(Spacer(1, 20))
-    
-    # Items Table
-    items_data = [["S.No.", "TITLE", "RATE", "QTY.", "GROSS AMT.", "NET AMOUNT"]]
-    
-    total_gross = 0
-    total_quantity = 0
-    
-    for i, item in enumerate(data.get('items', []), 1):
-        gross_amount = item['quantity'] * item['price']
-        total_gross += gross_amount
-        total_quantity += item['quantity']
-        items_data.append([
-            str(i),
-            item['title'],
-            f"N{item['price']:,.2f}",
-            str(item['quantity']),
-            f"N{gross_amount:,.2f}",
-            f"N{gross_amount:,.2f}"
-        ])
-    
-    # Add discount row if applicable
-    discount_percent = data.get('discount_percent', 0)
-    discount_amount = total_gross * (discount_percent / 100)
-    net_total = total_gross - discount_amount
-    
-    if discount_percent > 0:
-        # Add total before discount
-        items_data.append([
-            "", "", "", "", f"N{total_gross:,.2f}", f"N{total_gross:,.2f}"
-        ])
-        # Add discount line
-        items_data.append([
-            "", f"LESS DISCOUNT {discount_percent}%", "", "", f"N{discount_amount:,.2f}", f"N{net_total:,.2f}"
-        ])
-    
-    # Add final total row
-    items_data.append([
-        "", "Total:", "", str(total_quantity), f"N{total_gross:,.2f}", f"N{net_total:,.2f}"
-    ])
-    
-    items_table = Table(items_data, colWidths=[0.5*inch, 3.8*inch, 0.8*inch, 0.5*inch, 1*inch, 1*inch])
-    items_table.setStyle(TableStyle([
-        # Header row
-        ('BACKGROUND', (0, 0), (-1, 0), colors.black),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-        ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
-        ('TOPPADDING', (0, 0), (-1, 0), 8),
-        
-        # Data rows
-        ('ALIGN', (0, 1), (-1, -1), 'CENTER'),
-        ('ALIGN', (1, 1), (1, -1), 'LEFT'),  # Title column left-aligned
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 1), (-1, -1), 9),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('LEFTPADDING', (0, 0), (-1, -1), 4),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 4),
-        ('TOPPADDING', (0, 0), (-1, -1), 4),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
+# Recently rendered invoice PDFs keyed by invoice number, so discounted
+# copies can be stamped from them instead of re-rendered
+INVOICE_PDF_CACHE_SIZE = 64
+_invoice_pdf_cache = OrderedDict()
+_invoice_pdf_cache_lock = threading.Lock()
+
+def cache_invoice_pdf(invoice_number, pdf_bytes):
+    """Remember a rendered invoice PDF, evicting the least recently used"""
+    with _invoice_pdf_cache_lock:
+        _invoice_pdf_cache[invoice_number] = pdf_bytes
+        _invoice_pdf_cache.move_to_end(invoice_number)
+        while len(_invoice_pdf_cache) > INVOICE_PDF_CACHE_SIZE:
+            _invoice_pdf_cache.popitem(last=False)
+
+def get_cached_invoice_pdf(invoice_number):
+    """Return a cached invoice PDF or None"""
+    with _invoice_pdf_cache_lock:
+        pdf_bytes = _invoice_pdf_cache.get(invoice_number)
+        if pdf_bytes is not None:
+            _invoice_pdf_cache.move_to_end(invoice_number)
+    metrics.record_cache('invoice_pdf', pdf_bytes is not None)
+    return pdf_bytes
+
+def create_discounted_invoice_pdf(original_invoice, discounted_invoice):
+    """Build the discounted copy's PDF, stamping the original's rendering when possible
+
+    The copy has the same items and gross total, so only the invoice number
+    and totals text are replaced. Originals without discount rows have a
+    different layout and are rendered in full instead.
+    """
+    invoice_data = invoice_record_to_pdf_data(original_invoice)
+    gross_kobo = original_invoice['gross_total_kobo']
+    discounted_number = discounted_invoice['invoice_number']
+    
+    if invoice_data['discount_percent'] > 0:
+        original_pdf = get_cached_invoice_pdf(original_invoice['invoice_number'])
+        if original_pdf is None:
+            original_pdf = create_invoice_pdf(invoice_data, original_invoice['invoice_number']).getvalue()
+            cache_invoice_pdf(original_invoice['invoice_number'], original_pdf)
         
-        # Total row styling
-        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, -1), (-1, -1), 10),
-    ]))
-    
-    story.append(items_table)
-    story.append(Spacer(1, 20))
-    
-    # Net Amount Payable
-    net_amount_text = f"NET Amount Payable (Naira): N{net_total:,.2f}"
-    net_para = Paragraph(f"<para><b>{net_amount_text}</b></para>", normal_style)
-    story.append(net_para)
-    story.append(Spacer(1, 10))
-    
-    # Amount in words
-    amount_words = number_to_words(int(net_total))
-    words_para = Paragraph(f"Naira: {amount_words}", normal_style)
-    story.append(words_para)
-    story.append(Spacer(1, 20))
-    
-    # Bank Details
-    bank_text = "Please make your payment into any of the designated account details below."
-    bank_para = Paragraph(bank_text, normal_style)
-    story.append(bank_para)
-    story.append(Spacer(1, 10))
-    
-    # Get bank details from form data
-    bank_name = data.get('bank_name', 'ZENITH BANK')
-    account_number = data.get('account_number', '1229600064')
-    
-    bank_data = [
-        ["ACCOUNT NAME:", "EDUWAVES PUBLISHERS LTD"],
-        ["BANK NAME:", bank_name],
-        ["ACCOUNT NUMBER:", account_number]
-    ]
-    
-    bank_table = Table(bank_data, colWidths=[1.5*inch, 3*inch])
-    bank_table.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('LEFTPADDING', (0, 0), (-1, -1), 0),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 0),
-        ('TOPPADDING', (0, 0), (-1, -1), 2),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 2),
-    ]))
-    
-    story.append(bank_table)
-    story.append(Spacer(1, 20))
-    
-    # Terms and Conditions
-    terms_text = "I/We have received the above books in good condition and promise to pay the bill within a month, failing which I/We will be liable to pay an interest of 20% per annum."
-    terms_style = ParagraphStyle(
-        'TermsStyle',
-        parent=normal_style,
-        fontSize=10,
-        textColor=colors.black,
-        alignment=TA_LEFT,
-        fontName='Helvetica',
-        spaceAfter=10,
-        leftIndent=0,
-        rightIndent=0
-    )
-    terms_para = Paragraph(terms_text, terms_style)
-    story.append(terms_para)
-    story.append(Spacer(1, 10))
-    
-    # Customer Signature
-    signature_text = "Customer's Signature."
-    signature_para = Paragraph(signature_text, normal_style)
-    story.append(signature_para)
-    story.append(Spacer(1, 10))
-    
-    # Note
-    note_text = "Note: The delivery should be taken after checking the Books, we shall not be responsible for any shortage."
-    note_para = Paragraph(note_text, normal_style)
-    story.append(note_para)
-    story.append(Spacer(1, 20))
-    
-    # Contact Information Footer - Beautiful Design
-    contact_footer_style = ParagraphStyle(
-        'ContactFooter',
-        parent=styles['Normal'],
-        fontSize=9,
-        textColor=colors.black,
-        alignment=TA_CENTER,
-        fontName='Helvetica',
-        spaceAfter=5
-    )
-    
-    # Create a horizontal line separator
-    story.append(Spacer(1, 10))
-    line = Table([['']], colWidths=[7*inch])
-    line.setStyle(TableStyle([
-        ('LINEABOVE', (0, 0), (0, 0), 1, colors.grey),
-        ('LINEBELOW', (0, 0), (0, 0), 1, colors.grey),
-    ]))
-    story.append(line)
-    story.append(Spacer(1, 10))
-    
-    # Contact information in a neat table layout
-    contact_data = []
-    contact_row = []
-    
-    # WhatsApp
-    whatsapp_path = "images/whatsapp.png"
-    if os.path.exists(whatsapp_path):
-        whatsapp_icon = Image(whatsapp_path, width=0.2*inch, height=0.2*inch)
-        contact_row.append([whatsapp_icon, Paragraph("09025977776", contact_footer_style)])
-    else:
-        contact_row.append([Paragraph("📱", contact_footer_style), Paragraph("09025977776", contact_footer_style)])
-    
-    # Phone
-    contact_row.append([Paragraph("📞", contact_footer_style), Paragraph("+234 803 086 7910<br/>07066483007", contact_footer_style)])
-    
-    # Website
-    web_path = "images/web.png"
-    if os.path.exists(web_path):
-        web_icon = Image(web_path, width=0.2*inch, height=0.2*inch)
-        contact_row.append([web_icon, Paragraph("www.eduwavespublishers.com", contact_footer_style)])
-    else:
-        contact_row.append([Paragraph("Web", contact_footer_style), Paragraph("www.eduwavespublishers.com", contact_footer_style)])
-    
-    # Email
-    gmail_path = "images/gmail-logo.png"
-    if os.path.exists(gmail_path):
-        gmail_icon = Image(gmail_path, width=0.2*inch, height=0.2*inch)
-        contact_row.append([gmail_icon, Paragraph("eduwavespl@gmail.com", contact_footer_style)])
-    else:
-        contact_row.append([Paragraph("Email", contact_footer_style), Paragraph("eduwavespl@gmail.com", contact_footer_style)])
-    
-    contact_data.append(contact_row)
-    
-    # Create contact table
-    contact_table = Table(contact_data, colWidths=[1.75*inch, 1.75*inch, 1.75*inch, 1.75*inch])
-    contact_table.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('FONTSIZE', (0, 0), (-1, -1), 9),
-        ('LEFTPADDING', (0, 0), (-1, -1), 5),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 5),
-        ('TOPPADDING', (0, 0), (-1, -1), 5),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 5),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.lightgrey),
-    ]))
-    
-    story.append(contact_table)
-    story.append(Spacer(1, 15))
-    
-    # Footer
-    footer_data = [
-        ["Prepared By", "", "Checked By", "", f"Page No.: Page 1 of 1"]
-    ]
-    
-    footer_table = Table(footer_data, colWidths=[1.5*inch, 1*inch, 1.5*inch, 1*inch, 1.5*inch])
-    footer_table.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('LEFTPADDING', (0, 0), (-1, -1), 0),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 0),
-        ('TOPPADDING', (0, 0), (-1, -1), 2),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 2),
-    ]))
-    
-    story.append(footer_table)
-    
-    # Build PDF
-    doc.build(story)
-    buffer.seek(0)
-    return buffer
+        import invoice_stamp
+        pdf_bytes = invoice_stamp.stamp_invoice_text(
+            original_pdf,
+            invoice_totals_text(original_invoice['invoice_number'], gross_kobo, invoice_data['discount_percent']),
+            invoice_totals_text(discounted_number, gross_kobo, discounted_invoice['discount_percent'])
+        )
+        if pdf_bytes is not None:
+            metrics.record_pdf('stamped', len(pdf_bytes))
+            cache_invoice_pdf(discounted_number, pdf_bytes)
+            return pdf_bytes
+    
+    invoice_data['discount_percent'] = discounted_invoice['discount_percent']
+    pdf_bytes = create_invoice_pdf(invoice_data, discounted_number).getvalue()
+    cache_invoice_pdf(discounted_number, pdf_bytes)
+    return pdf_bytes
+
+# Rows per detailed-invoice table chunk; roughly one A4 page at 8pt
+REPORT_ROWS_PER_CHUNK = 40
+
+class StreamingStory(list):
+    """Flowable list that is refilled lazily from a generator.
+
+    ReportLab consumes the story from the front, so only a couple of
+    flowables are ever held in memory instead of the whole report.
+    """
+
+    def __init__(self, flowables):
+        super().__init__()
+        self._source = iter(flowables)
+
+    def _refill(self):
+        while list.__len__(self) < 2:
+            try:
+                self.append(next(self._source))
+            except StopIteration:
+                break
+
+    def __len__(self):
+        self._refill()
+        return list.__len__(self)
+
+    def __getitem__(self, index):
+        self._refill()
+        return list.__getitem__(self, index)
 
 def create_report_pdf(summary, invoices, start_date, end_date):
-    """Create PDF report for invoice summary"""
-    print(f"Creating PDF with {len(invoices)} invoices")
+    """Create PDF report for invoice summary
+
+    ``invoices`` may be any iterable of invoice dicts (e.g. a database
+    cursor stream); it is consumed once, chunk by chunk.
+    """
     buffer = io.BytesIO()
     doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=0.5*inch, bottomMargin=0.5*inch)
     
@@ -1077,27 +1073,44 @@ def create_report_pdf(summary, invoices, start_date, end_date):
         spaceAfter=5
     )
     
-    story = []
+    story = StreamingStory(_report_flowables(
+        summary, invoices, start_date, end_date, title_style, heading_style, normal_style
+    ))
     
+    # Build PDF
+    doc.build(story)
+    metrics.record_pdf('report', buffer.tell())
+    buffer.seek(0)
+    return buffer
+
+def _report_flowables(summary, invoices, start_date, end_date, title_style, heading_style, normal_style):
+    """Yield the report flowables, chunking the detailed invoice table"""
     # Title
     title = Paragraph("EDUwaves Publishers - Invoice Report", title_style)
-    story.append(title)
+    yield title
     
     # Date range
     date_range = Paragraph(f"Report Period: {start_date} to {end_date}", normal_style)
-    story.append(date_range)
-    story.append(Spacer(1, 20))
+    yield date_range
+    yield Spacer(1, 20)
     
     # Summary section
-    story.append(Paragraph("Summary", heading_style))
+    yield Paragraph("Summary", heading_style)
     
     summary_data = [
         ["Total Invoices", str(summary.get('total_invoices', 0))],
         ["Total Quantity", str(summary.get('total_quantity', 0))],
-        ["Gross Total (N)", f"N{summary.get('total_gross', 0):,.2f}"],
-        ["Total Discount (N)", f"N{summary.get('total_discount', 0):,.2f}"],
-        ["Net Total (N)", f"N{summary.get('total_net', 0):,.2f}"]
+        ["Gross Total (N)", money.format_naira(summary.get('total_gross_kobo'))],
+        ["Total Discount (N)", money.format_naira(summary.get('total_discount_kobo'))],
+        ["Net Total (N)", money.format_naira(summary.get('total_net_kobo'))]
     ]
+    if summary.get('total_invoices'):
+        percentiles = summary['net_percentiles']
+        summary_data += [
+            ["Average Invoice (N)", money.format_naira(summary['average_net_kobo'])],
+            ["Median Invoice (N)", money.format_naira(percentiles['p50_kobo'])],
+            ["90th Percentile Invoice (N)", money.format_naira(percentiles['p90_kobo'])],
+        ]
     
     summary_table = Table(summary_data, colWidths=[2*inch, 2*inch])
     summary_table.setStyle(TableStyle([
@@ -1111,19 +1124,19 @@ def create_report_pdf(summary, invoices, start_date, end_date):
         ('GRID', (0, 0), (-1, -1), 1, colors.black)
     ]))
     
-    story.append(summary_table)
-    story.append(Spacer(1, 20))
+    yield summary_table
+    yield Spacer(1, 20)
     
     # Breakdown by type
     if summary.get('by_type'):
-        story.append(Paragraph("Breakdown by Invoice Type", heading_style))
+        yield Paragraph("Breakdown by Invoice Type", heading_style)
         
         type_data = [["Invoice Type", "Count", "Total Amount (N)"]]
         for item in summary['by_type']:
             type_data.append([
                 item['invoice_type'].title(),
                 str(item['count']),
-                f"N{item['total_amount']:,.2f}"
+                money.format_naira(item['total_amount_kobo'])
             ])
         
         type_table = Table(type_data, colWidths=[2*inch, 1*inch, 2*inch])
@@ -1138,19 +1151,19 @@ def create_report_pdf(summary, invoices, start_date, end_date):
             ('GRID', (0, 0), (-1, -1), 1, colors.black)
         ]))
         
-        story.append(type_table)
-        story.append(Spacer(1, 20))
+        yield type_table
+        yield Spacer(1, 20)
     
     # Top customers
     if summary.get('top_customers'):
-        story.append(Paragraph("Top Customers", heading_style))
+        yield Paragraph("Top Customers", heading_style)
         
         customer_data = [["Customer Name", "Invoice Count", "Total Amount (N)"]]
         for item in summary['top_customers']:
             customer_data.append([
                 item['customer_name'],
                 str(item['invoice_count']),
-                f"N{item['total_amount']:,.2f}"
+                money.format_naira(item['total_amount_kobo'])
             ])
         
         customer_table = Table(customer_data, colWidths=[3*inch, 1*inch, 2*inch])
@@ -1165,89 +1178,55 @@ def create_report_pdf(summary, invoices, start_date, end_date):
             ('GRID', (0, 0), (-1, -1), 1, colors.black)
         ]))
         
-        story.append(customer_table)
-        story.append(Spacer(1, 20))
+        yield customer_table
+        yield Spacer(1, 20)
     
-    # Detailed invoices
-    if invoices:
-        story.append(Paragraph("Detailed Invoices", heading_style))
-        
-        # Create detailed table
-        invoice_data = [["Invoice #", "Date", "Customer", "Type", "Net Amount (N)"]]
-        for invoice in invoices:
-            invoice_data.append([
-                invoice['invoice_number'],
-                invoice['created_at'][:10],  # Just the date part
-                invoice['customer_name'][:30],  # Truncate long names
-                invoice['invoice_type'].title(),
-                f"N{invoice['net_total']:,.2f}"
-            ])
-        
-        invoice_table = Table(invoice_data, colWidths=[1.5*inch, 1*inch, 2*inch, 1*inch, 1.5*inch])
-        invoice_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 8),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('FONTSIZE', (0, 1), (-1, -1), 8),
-            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.lightgrey])
-        ]))
-        
-        story.append(invoice_table)
+    # Detailed invoices, emitted as page-sized LongTable chunks with repeated headers
+    header_row = ["Invoice #", "Date", "Customer", "Type", "Net Amount (N)"]
+    invoice_table_style = TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 8),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ('FONTSIZE', (0, 1), (-1, -1), 8),
+        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.lightgrey])
+    ])
+    
+    invoice_data = []
+    has_invoices = False
+    for invoice in invoices:
+        if not has_invoices:
+            has_invoices = True
+            yield Paragraph("Detailed Invoices", heading_style)
+        invoice_data.append([
+            invoice['invoice_number'],
+            invoice['created_at'][:10],  # Just the date part
+            invoice['customer_name'][:30],  # Truncate long names
+            invoice['invoice_type'].title(),
+            money.format_naira(invoice['net_total_kobo'])
+        ])
+        if len(invoice_data) >= REPORT_ROWS_PER_CHUNK:
+            yield _invoice_chunk_table(header_row, invoice_data, invoice_table_style)
+            invoice_data = []
+    
+    if invoice_data:
+        yield _invoice_chunk_table(header_row, invoice_data, invoice_table_style)
     
     # Footer
-    story.append(Spacer(1, 20))
+    yield Spacer(1, 20)
     footer_text = f"Report generated on {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
     footer = Paragraph(footer_text, normal_style)
-    story.append(footer)
-    
-    # Build PDF
-    print("Building PDF document...")
-    doc.build(story)
-    print("PDF document built successfully")
-    buffer.seek(0)
-    print(f"PDF buffer size: {len(buffer.getvalue())} bytes")
-    return buffer
+    yield footer
 
-def number_to_words(num):
-    """Convert number to words (simplified version)"""
-    ones = ["", "ONE", "TWO", "THREE", "FOUR", "FIVE", "SIX", "SEVEN", "EIGHT", "NINE"]
-    tens = ["", "", "TWENTY", "THIRTY", "FORTY", "FIFTY", "SIXTY", "SEVENTY", "EIGHTY", "NINETY"]
-    teens = ["TEN", "ELEVEN", "TWELVE", "THIRTEEN", "FOURTEEN", "FIFTEEN", "SIXTEEN", "SEVENTEEN", "EIGHTEEN", "NINETEEN"]
-    
-    if num == 0:
-        return "ZERO"
-    
-    def convert_hundreds(n):
-        result = ""
-        if n >= 100:
-            result += ones[n // 100] + " HUNDRED "
-            n %= 100
-        if n >= 20:
-            result += tens[n // 10] + " "
-            n %= 10
-        elif n >= 10:
-            result += teens[n - 10] + " "
-            return result
-        if n > 0:
-            result += ones[n] + " "
-        return result
-    
-    result = ""
-    if num >= 1000000:
-        result += convert_hundreds(num // 1000000) + "MILLION "
-        num %= 1000000
-    if num >= 1000:
-        result += convert_hundreds(num // 1000) + "THOUSAND "
-        num %= 1000
-    if num > 0:
-        result += convert_hundreds(num)
-    
-    return result.strip() + " NAIRA ONLY"
+def _invoice_chunk_table(header_row, rows, table_style):
+    """Build one detailed-invoice LongTable chunk with a repeating header"""
+    invoice_table = LongTable([header_row] + rows, colWidths=[1.5*inch, 1*inch, 2*inch, 1*inch, 1.5*inch], repeatRows=1)
+    invoice_table.setStyle(table_style)
+    return invoice_table
 
 # Railway deployment configuration - Only run Flask dev server locally
 if __name__ == '__main__':
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Benchmark the vectorised report summary against get_invoice_summary
+
+For each size, fills a throwaway database with a year of synthetic
+invoices, then times the SQL summary (one scan per section) against
+analytics.invoice_summary (one bulk fetch, summarised with pandas/NumPy),
+split into the fetch and the computation, and checks they agree.
+
+Usage:
+    python bench_analytics.py
+    python bench_analytics.py --invoices 100000 1000000 --repeat 3
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import date, timedelta
+
+import analytics
+from database import InvoiceDatabase
+
+INVOICE_TYPES = ['credit', 'cash', 'special_market']
+
+
+def build_database(path, invoices):
+    """A year of invoices spread over 5,000 customers and 20 sales managers"""
+    database = InvoiceDatabase(path)
+    rng = random.Random(42)
+    start = date(2025, 1, 1)
+
+    def rows():
+        for index in range(invoices):
+            quantity = rng.randint(1, 600)
+            gross_kobo = quantity * rng.choice([210000, 230000, 250000])
+            discount_kobo = gross_kobo // 10
+            yield (f"HO/IN/BENCH{index:08d}", rng.choice(INVOICE_TYPES), f"BENCH SCHOOL {rng.randint(0, 4999)}",
+                   f"SALES MANAGER {rng.randint(0, 19)}", quantity, gross_kobo, discount_kobo,
+                   gross_kobo - discount_kobo, f"{(start + timedelta(days=index * 365 // invoices)).isoformat()} 10:00:00")
+
+    conn = sqlite3.connect(path)
+    conn.executemany('''
+        INSERT INTO invoices (
+            invoice_number, invoice_type, customer_name, sales_manager, bank_name, account_number,
+            total_quantity, gross_total_kobo, discount_percent, discount_amount_kobo, net_total_kobo, created_at
+        ) VALUES (?, ?, ?, ?, 'ZENITH BANK', '1229600064', ?, ?, 10.0, ?, ?, ?)
+    ''', rows())
+    conn.commit()
+    conn.close()
+    return database
+
+
+def timed(fn, repeat):
+    samples = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the vectorised report summary')
+    parser.add_argument('--invoices', type=int, nargs='+', default=[100000, 1000000], help='Database sizes')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per measurement')
+    args = parser.parse_args()
+
+    ranges = [('one month', '2025-03-01', '2025-03-31'), ('full year', '2025-01-01', '2025-12-31')]
+    print(f"{'invoices':>9} {'range':10} {'sql ms':>8} {'fetch ms':>9} {'numpy ms':>9} {'total ms':>9} {'speedup':>8}")
+
+    for size in args.invoices:
+        with tempfile.TemporaryDirectory() as workdir:
+            database = build_database(os.path.join(workdir, 'analytics.db'), size)
+            for label, start_date, end_date in ranges:
+                sql_ms, expected = timed(lambda: database.get_invoice_summary(start_date, end_date), args.repeat)
+                fetch_ms, frame = timed(lambda: analytics.load_invoices(database, start_date, end_date), args.repeat)
+                numpy_ms, summary = timed(lambda: analytics.summarize(frame), args.repeat)
+                total_ms = fetch_ms + numpy_ms
+                print(f"{size:>9,} {label:10} {sql_ms:>8.0f} {fetch_ms:>9.0f} {numpy_ms:>9.0f} "
+                      f"{total_ms:>9.0f} {sql_ms / total_ms:>7.2f}x")
+
+                for key in ('total_invoices', 'total_quantity', 'total_gross_kobo', 'total_net_kobo', 'by_type'):
+                    assert summary[key] == expected[key], key
+                # Customers tied on amount may be listed in either order
+                assert [row['total_amount_kobo'] for row in summary['top_customers']] == \
+                    [row['total_amount_kobo'] for row in expected['top_customers']]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Benchmark the per-book sales report at millions of line items
+
+Fills a throwaway database with a year of synthetic invoices using the real
+book catalog (line items are inserted through the normal triggers, so the
+book_sales_daily rollup is maintained as it would be in production), then
+times get_book_sales against the same aggregate computed straight from
+invoice_items joined to invoices.
+
+Usage:
+    python bench_book_sales.py
+    python bench_book_sales.py --items 5000000 --lines 20
+"""
+
+import argparse
+import json
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import date, timedelta
+
+from database import InvoiceDatabase
+
+MANAGERS = [f"SALES MANAGER {index}" for index in range(20)]
+
+DIRECT_QUERY = '''
+    SELECT b.book_code, b.grade, b.subject, SUM(ii.quantity), SUM(ii.gross_amount_kobo)
+    FROM invoices i
+    JOIN invoice_items ii ON ii.invoice_id = i.id
+    JOIN books b ON b.id = ii.book_id
+    WHERE DATE(i.created_at) BETWEEN ? AND ? AND COALESCE(i.is_discounted_version, 0) = 0
+    GROUP BY b.book_code, b.grade, b.subject
+'''
+
+
+def build_database(path, items, lines_per_invoice):
+    """A year of invoices with catalog books; returns (database, seconds spent inserting)"""
+    database = InvoiceDatabase(path)
+    database.sync_book_catalog('books_database.json')
+    with open('books_database.json', 'r', encoding='utf-8') as f:
+        catalog_size = len(json.load(f))
+
+    conn = sqlite3.connect(path)
+    book_ids = [row[0] for row in conn.execute('SELECT id FROM books ORDER BY id')][:catalog_size]
+    rng = random.Random(42)
+    start = date(2025, 1, 1)
+    started = time.perf_counter()
+
+    for index in range(items // lines_per_invoice):
+        day = start + timedelta(days=index * 365 * lines_per_invoice // items)
+        cursor = conn.execute('''
+            INSERT INTO invoices (
+                invoice_number, invoice_type, customer_name, sales_manager, bank_name, account_number,
+                total_quantity, gross_total_kobo, discount_percent, discount_amount_kobo, net_total_kobo, created_at
+            ) VALUES (?, 'credit', ?, ?, 'ZENITH BANK', '1229600064', 0, 0, 10.0, 0, 0, ?)
+        ''', (f"HO/IN/BENCH{index:08d}", f"BENCH SCHOOL {index % 2000}", rng.choice(MANAGERS),
+              f"{day.isoformat()} 10:00:00"))
+        invoice_id = cursor.lastrowid
+        quantities = [rng.randint(1, 60) for _ in range(lines_per_invoice)]
+        conn.executemany('''
+            INSERT INTO invoice_items (invoice_id, book_id, catalog_version, rate_kobo, quantity, gross_amount_kobo)
+            VALUES (?, ?, 1, 230000, ?, ?)
+        ''', [
+            (invoice_id, book_id, quantity, quantity * 230000)
+            for book_id, quantity in zip(rng.sample(book_ids, lines_per_invoice), quantities)
+        ])
+        if index % 1000 == 0:
+            conn.commit()
+
+    conn.commit()
+    elapsed = time.perf_counter() - started
+    conn.close()
+    return database, elapsed
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the per-book sales report')
+    parser.add_argument('--items', type=int, default=1000000, help='Line items to generate')
+    parser.add_argument('--lines', type=int, default=12, help='Line items per invoice')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed runs per query')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, 'books.db')
+        database, insert_seconds = build_database(path, args.items, args.lines)
+        print(f"{args.items:,} line items inserted in {insert_seconds:.1f}s (rollup maintained by triggers)")
+
+        conn = sqlite3.connect(path)
+        for table in database.BOOK_SALES_ROLLUPS:
+            rollup_rows = conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+            print(f"{table} holds {rollup_rows:,} rows")
+
+        ranges = [('one month', '2025-03-01', '2025-03-31'), ('full year', '2025-01-01', '2025-12-31')]
+        print(f"{'range':12} {'rollup ms':>10} {'manager ms':>11} {'direct ms':>10}")
+        for label, start_date, end_date in ranges:
+            rollup = timed(lambda: database.get_book_sales(start_date, end_date), args.repeat)
+            manager = timed(lambda: database.get_book_sales(start_date, end_date, MANAGERS[0]), args.repeat)
+            direct = timed(lambda: conn.execute(DIRECT_QUERY, (start_date, end_date)).fetchall(), args.repeat)
+            print(f"{label:12} {rollup:>10.1f} {manager:>11.1f} {direct:>10.1f}")
+
+            expected = {(row[0], row[1], row[2]): (row[3], row[4]) for row in conn.execute(DIRECT_QUERY, (start_date, end_date))}
+            actual = {(book['book_code'], book['grade'], book['subject']): (book['quantity'], book['gross_revenue_kobo'])
+                      for book in database.get_book_sales(start_date, end_date)}
+            assert actual == expected, "rollup disagrees with the line items"
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Measure response compression on realistic report payloads
+
+Fills a throwaway database with invoices built from the real book catalog
+and school list, then requests /api/reports/invoices and
+/api/schools/history/<school> through the Flask test client with no
+compression, gzip and brotli, and prints the bytes on the wire, the ratio
+and the time spent per request.
+
+Usage:
+    python bench_compression.py
+    python bench_compression.py --invoices 2000 --lines 15
+"""
+
+import argparse
+import csv
+import json
+import os
+import random
+import tempfile
+import time
+
+import app as app_module
+import money
+from database import InvoiceDatabase
+
+ENCODINGS = ['identity', 'gzip', 'br']
+
+
+def build_database(path, invoice_count, lines_per_invoice):
+    """Save invoices with catalog books for schools from unique_schools.csv"""
+    with open('books_database.json', 'r', encoding='utf-8') as f:
+        books = json.load(f)
+    with open('unique_schools.csv', 'r', encoding='utf-8') as f:
+        schools = [row for row in csv.DictReader(f)][:200]
+
+    rng = random.Random(42)
+    database = InvoiceDatabase(path)
+    for index in range(invoice_count):
+        school = schools[index % len(schools)]
+        items = [
+            {
+                'book_code': book['book_code'], 'title': book['title'], 'grade': book['grade'],
+                'subject': book['subject'], 'price': book['price'], 'quantity': rng.randint(1, 120)
+            }
+            for book in rng.sample(books, lines_per_invoice)
+        ]
+        total_quantity, gross_kobo, discount_kobo, net_kobo = money.invoice_totals(items, 10.0)
+        database.save_invoice({
+            'invoice_number': f"HO/IN/BENCH{index:06d}",
+            'invoice_type': rng.choice(['credit', 'floating', 'special']),
+            'customer_name': school['Customer_Name'].strip(),
+            'customer_phone': school['Phone_Number'].strip(),
+            'customer_address': '',
+            'sales_manager': school['SM_Name'].strip(),
+            'bank_name': 'ZENITH BANK',
+            'account_number': '1229600064',
+            'total_quantity': total_quantity,
+            'gross_total_kobo': gross_kobo,
+            'discount_percent': 10.0,
+            'discount_amount_kobo': discount_kobo,
+            'net_total_kobo': net_kobo,
+            'items': items
+        })
+    return database, schools[0]['Customer_Name'].strip()
+
+
+def wire_size(client, method, url, encoding, **kwargs):
+    """(bytes on the wire, milliseconds) for one request"""
+    started = time.perf_counter()
+    response = getattr(client, method)(url, headers={'Accept-Encoding': encoding}, **kwargs)
+    body = b''.join(response.response) if response.is_streamed else response.get_data()
+    elapsed = (time.perf_counter() - started) * 1000
+    assert response.status_code == 200, response.status_code
+    if encoding != 'identity':
+        assert response.headers.get('Content-Encoding') == encoding, response.headers
+    return len(body), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure response compression on report payloads')
+    parser.add_argument('--invoices', type=int, default=1000, help='Invoices in the synthetic month')
+    parser.add_argument('--lines', type=int, default=12, help='Line items per invoice')
+    args = parser.parse_args()
+
+    if app_module.compression.brotli is None:
+        ENCODINGS.remove('br')
+        print("brotli not installed; measuring gzip only")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        database, school_name = build_database(os.path.join(workdir, 'bench.db'), args.invoices, args.lines)
+        app_module.db = database
+        client = app_module.app.test_client()
+
+        cases = [
+            (f"/api/reports/invoices ({args.invoices} invoices)", 'post', '/api/reports/invoices',
+             {'json': {'start_date': '2000-01-01', 'end_date': '2100-01-01'}}),
+            (f"/api/schools/history ({school_name})", 'get', f"/api/schools/history/{school_name}", {}),
+        ]
+        print(f"{'payload':55} {'encoding':>9} {'bytes':>12} {'ratio':>7} {'ms':>8}")
+        for label, method, url, kwargs in cases:
+            wire_size(client, method, url, 'identity', **kwargs)  # Warm up
+            baseline = None
+            for encoding in ENCODINGS:
+                size, elapsed = wire_size(client, method, url, encoding, **kwargs)
+                baseline = baseline or size
+                print(f"{label:55} {encoding:>9} {size:>12,} {baseline / size:>6.1f}x {elapsed:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Benchmark creating discounted invoice copies of large invoices
+
+Saves N invoices of 500 lines each to a throwaway database, then times
+create_discounted_invoice on every one of them. For comparison it also times
+the previous approach (read the items into Python, insert them back one
+execute() at a time) on a second copy of the same data.
+
+Usage:
+    python bench_discounted_copy.py
+    python bench_discounted_copy.py --invoices 100 --lines 500
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+import money
+from database import InvoiceDatabase
+
+
+def build_database(path, invoice_count, lines):
+    database = InvoiceDatabase(path)
+    invoice_ids = []
+    for index in range(invoice_count):
+        items = [
+            {
+                'book_code': f"MATH/P{line % 6 + 1}/{line:04d}",
+                'title': f"PRIMARY MATHEMATICS FOR NIGERIAN SCHOOLS BK {line % 6 + 1}",
+                'grade': f"Primary {line % 6 + 1}",
+                'subject': 'Mathematics',
+                'price': 1500.0 + line,
+                'quantity': line % 40 + 1
+            }
+            for line in range(lines)
+        ]
+        total_quantity, gross_kobo, discount_kobo, net_kobo = money.invoice_totals(items, 10.0)
+        invoice_ids.append(database.save_invoice({
+            'invoice_number': f"HO/IN/BENCH{index:06d}",
+            'invoice_type': 'credit',
+            'customer_name': 'Floating Stock',
+            'sales_manager': 'PETER ETIM',
+            'bank_name': 'ZENITH BANK',
+            'account_number': '1229600064',
+            'total_quantity': total_quantity,
+            'gross_total_kobo': gross_kobo,
+            'discount_percent': 10.0,
+            'discount_amount_kobo': discount_kobo,
+            'net_total_kobo': net_kobo,
+            'items': items
+        }))
+    return invoice_ids
+
+
+def row_by_row_copy(database, original_invoice_id, discount_percent=20.0):
+    """The previous create_discounted_invoice item copy, kept for comparison"""
+    conn = database.begin_write()
+    cursor = conn.cursor()
+    try:
+        cursor.execute('SELECT * FROM invoices WHERE id = ?', (original_invoice_id,))
+        columns = [description[0] for description in cursor.description]
+        original_invoice = dict(zip(columns, cursor.fetchone()))
+        cursor.execute('SELECT * FROM invoice_items WHERE invoice_id = ? ORDER BY id', (original_invoice_id,))
+        item_columns = [description[0] for description in cursor.description]
+        original_items = [dict(zip(item_columns, row)) for row in cursor.fetchall()]
+
+        gross_kobo = original_invoice['gross_total_kobo']
+        discount_kobo = money.percent_of(gross_kobo, discount_percent)
+        cursor.execute('''
+            INSERT INTO invoices (
+                invoice_number, invoice_type, customer_name, customer_phone,
+                customer_address, sales_manager, bank_name, account_number,
+                total_quantity, gross_total_kobo, discount_percent, discount_amount_kobo, net_total_kobo,
+                original_invoice_id, is_discounted_version
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1)
+        ''', (
+            f"{original_invoice['invoice_number']}/D", original_invoice['invoice_type'],
+            original_invoice['customer_name'], original_invoice['customer_phone'],
+            original_invoice['customer_address'], original_invoice['sales_manager'],
+            original_invoice['bank_name'], original_invoice['account_number'],
+            original_invoice['total_quantity'], gross_kobo, discount_percent,
+            discount_kobo, gross_kobo - discount_kobo, original_invoice_id
+        ))
+        discounted_invoice_id = cursor.lastrowid
+        for item in original_items:
+            cursor.execute('''
+                INSERT INTO invoice_items (
+                    invoice_id, book_id, catalog_version, rate_kobo, quantity, gross_amount_kobo
+                ) VALUES (?, ?, ?, ?, ?, ?)
+            ''', (
+                discounted_invoice_id, item['book_id'], item['catalog_version'],
+                item['rate_kobo'], item['quantity'], item['gross_amount_kobo']
+            ))
+        conn.commit()
+        return discounted_invoice_id
+    finally:
+        database.end_write(conn)
+
+
+def time_copies(copy, invoice_ids):
+    timings = []
+    for invoice_id in invoice_ids:
+        started = time.perf_counter()
+        copy(invoice_id)
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark discounted invoice copies')
+    parser.add_argument('--invoices', type=int, default=50, help='Invoices to copy')
+    parser.add_argument('--lines', type=int, default=500, help='Line items per invoice')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        set_based_path = os.path.join(workdir, 'set_based.db')
+        invoice_ids = build_database(set_based_path, args.invoices, args.lines)
+        row_by_row_path = os.path.join(workdir, 'row_by_row.db')
+        shutil.copy(set_based_path, row_by_row_path)
+
+        set_based = InvoiceDatabase(set_based_path)
+        row_by_row = InvoiceDatabase(row_by_row_path)
+        results = {
+            'INSERT ... SELECT': time_copies(lambda invoice_id: set_based.create_discounted_invoice(invoice_id), invoice_ids),
+            'row by row': time_copies(lambda invoice_id: row_by_row_copy(row_by_row, invoice_id), invoice_ids),
+        }
+
+        # A second request for the same copy only runs the indexed lookup
+        results['existing copy lookup'] = time_copies(
+            lambda invoice_id: set_based.create_discounted_invoice(invoice_id), invoice_ids
+        )
+
+    print(f"Discounted copies of {args.invoices} invoices x {args.lines} lines")
+    print("=" * 60)
+    for name, timings in results.items():
+        total_seconds = sum(timings) / 1000
+        print(f"{name:22} median {statistics.median(timings):7.2f} ms  "
+              f"{len(timings) / total_seconds:8.1f} copies/s  "
+              f"{len(timings) * args.lines / total_seconds:10,.0f} items/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Benchmark the report PDF with its invoice rows fetched in the background
+
+Fills a throwaway database with a year of synthetic invoices, then times
+the report PDF with the invoice headers fetched in a background thread
+while the summary is computed, against fetching them as the PDF is built.
+
+Gains need spare cores: SQLite runs each query without holding the GIL,
+but on a single core the fetch and the summary still take turns. The core
+count is printed with the results.
+
+Usage:
+    python bench_parallel_reports.py
+    python bench_parallel_reports.py --invoices 1000000 --pdf-days 7
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import date, timedelta
+
+import analytics
+import app
+from database import InvoiceDatabase
+
+
+def build_database(path, invoices):
+    """A year of invoices spread over 5,000 customers"""
+    rng = random.Random(42)
+    start = date(2025, 1, 1)
+    InvoiceDatabase(path)
+
+    def rows():
+        for index in range(invoices):
+            quantity = rng.randint(1, 600)
+            gross_kobo = quantity * 230000
+            yield (f"HO/IN/BENCH{index:08d}", rng.choice(['credit', 'cash']), f"BENCH SCHOOL {rng.randint(0, 4999)}",
+                   quantity, gross_kobo, gross_kobo // 10, gross_kobo - gross_kobo // 10,
+                   f"{(start + timedelta(days=index * 365 // invoices)).isoformat()} 10:00:00")
+
+    conn = sqlite3.connect(path)
+    conn.executemany('''
+        INSERT INTO invoices (
+            invoice_number, invoice_type, customer_name, sales_manager, bank_name, account_number,
+            total_quantity, gross_total_kobo, discount_percent, discount_amount_kobo, net_total_kobo, created_at
+        ) VALUES (?, ?, ?, 'SALES MANAGER', 'ZENITH BANK', '1229600064', ?, ?, 10.0, ?, ?, ?)
+    ''', rows())
+    conn.commit()
+    conn.close()
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def sequential_report_pdf(database, start_date, end_date):
+    """The report PDF with the summary first and the headers fetched while building"""
+    summary = analytics.invoice_summary(database, start_date, end_date)
+    return app.create_report_pdf(summary, database.iter_invoice_headers(start_date, end_date),
+                                 start_date, end_date).getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark background invoice fetching for the report PDF')
+    parser.add_argument('--invoices', type=int, default=200000, help='Invoices to generate')
+    parser.add_argument('--pdf-days', type=int, default=3, help='Days of invoices in the benchmarked PDF')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per measurement')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, 'parallel.db')
+        build_database(path, args.invoices)
+        print(f"{args.invoices:,} invoices, {os.cpu_count()} cores")
+
+        database = InvoiceDatabase(path)
+        app.db = database
+        end_date = (date(2025, 6, 1) + timedelta(days=args.pdf_days - 1)).isoformat()
+        sequential = timed(lambda: sequential_report_pdf(database, '2025-06-01', end_date), args.repeat)
+        background = timed(lambda: app.render_report_pdf('2025-06-01', end_date), args.repeat)
+        invoices = database.get_invoice_summary('2025-06-01', end_date)['total_invoices']
+        print(f"report PDF, {invoices:,} invoices: {sequential:.0f} ms sequential, "
+              f"{background:.0f} ms with headers fetched in the background")
+
+
+if __name__ == "__main__":
+    main()
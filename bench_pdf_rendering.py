@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Benchmark PDF rendering for invoices and reports
+
+Calls create_invoice_pdf and create_report_pdf directly (no server needed)
+with synthetic invoices of 1, 20, 200 and 2,000 lines, and reports with the
+same number of invoices. For each case it records latency percentiles,
+peak traced memory and output size, then compares them with a JSON baseline
+and exits non-zero when any metric regresses beyond the threshold.
+
+The baseline is machine specific, so it is written on the first run (or with
+--update-baseline) rather than shipped with the repo.
+
+Usage:
+    python bench_pdf_rendering.py                    # compare against baseline
+    python bench_pdf_rendering.py --update-baseline  # record a new baseline
+    python bench_pdf_rendering.py --sizes 1,20 --repeat 3 --threshold 0.5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+from app import create_invoice_pdf, create_report_pdf
+
+DEFAULT_SIZES = [1, 20, 200, 2000]
+DEFAULT_BASELINE = 'pdf_benchmark_baseline.json'
+
+# Metrics compared against the baseline (latency uses the median)
+COMPARED_METRICS = ['p50_ms', 'peak_memory_kb', 'output_bytes']
+
+
+def synthetic_invoice(lines):
+    """Invoice data in the shape /api/generate-invoice receives"""
+    return {
+        'invoice_type': 'credit',
+        'customer_name': 'FEDERAL GOVERNMENT COLLEGE, KWALI',
+        'customer_phone': '08032401126',
+        'customer_address': 'KWALI, ABUJA',
+        'sales_manager': 'PETER ETIM',
+        'bank_name': 'ZENITH BANK',
+        'account_number': '1229600064',
+        'discount_percent': 10.0,
+        'items': [
+            {
+                'book_code': f"MATH/P{line % 6 + 1}/{line:04d}",
+                'title': f"PRIMARY MATHEMATICS FOR NIGERIAN SCHOOLS BK {line % 6 + 1} ({line})",
+                'grade': f"Primary {line % 6 + 1}",
+                'subject': 'Mathematics',
+                'price': 1500.0 + line,
+                'quantity': line % 40 + 1
+            }
+            for line in range(lines)
+        ]
+    }
+
+
+def synthetic_report(invoice_count):
+    """Summary and invoice header rows in the shape the report route passes"""
+    invoices = [
+        {
+            'invoice_number': f"HO/IN/25091{index:05d}",
+            'created_at': '2025-09-15 10:00:00',
+            'customer_name': f"BENCHMARK SCHOOL NUMBER {index % 300}",
+            'invoice_type': ('credit', 'floating', 'special')[index % 3],
+            'net_total_kobo': 4500000 + index * 100
+        }
+        for index in range(invoice_count)
+    ]
+    summary = {
+        'total_invoices': invoice_count,
+        'total_quantity': invoice_count * 30,
+        'total_gross_kobo': 5000000 * invoice_count,
+        'total_discount_kobo': 500000 * invoice_count,
+        'total_net_kobo': 4500000 * invoice_count,
+        'by_type': [
+            {'invoice_type': 'credit', 'count': invoice_count, 'total_amount_kobo': 4500000 * invoice_count}
+        ],
+        'top_customers': [
+            {'customer_name': f"BENCHMARK SCHOOL NUMBER {index}", 'invoice_count': 3, 'total_amount_kobo': 13500000}
+            for index in range(10)
+        ]
+    }
+    return summary, invoices
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of a list of samples"""
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def measure(render, repeat):
+    """Time `render` repeat times, then trace one extra run for peak memory"""
+    render()  # Warm up fonts, images and imports
+
+    timings = []
+    output_bytes = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        output_bytes = len(render().getvalue())
+        timings.append((time.perf_counter() - started) * 1000)
+
+    tracemalloc.start()
+    render()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'p50_ms': round(statistics.median(timings), 2),
+        'p90_ms': round(percentile(timings, 0.90), 2),
+        'p99_ms': round(percentile(timings, 0.99), 2),
+        'peak_memory_kb': round(peak / 1024, 1),
+        'output_bytes': output_bytes
+    }
+
+
+def run_benchmarks(sizes, repeat):
+    results = {}
+    for size in sizes:
+        # Large documents take seconds each; don't repeat them as often
+        runs = max(1, repeat if size < 2000 else repeat // 2)
+
+        invoice = synthetic_invoice(size)
+        results[f"invoice_{size}_lines"] = measure(
+            lambda: create_invoice_pdf(invoice, 'HO/IN/2509150000'), runs
+        )
+
+        summary, invoices = synthetic_report(size)
+        results[f"report_{size}_invoices"] = measure(
+            lambda: create_report_pdf(summary, invoices, '2025-09-01', '2025-09-30'), runs
+        )
+
+        for name in (f"invoice_{size}_lines", f"report_{size}_invoices"):
+            metrics = results[name]
+            print(f"{name:24} p50 {metrics['p50_ms']:9.1f} ms  p90 {metrics['p90_ms']:9.1f} ms  "
+                  f"p99 {metrics['p99_ms']:9.1f} ms  peak {metrics['peak_memory_kb']:9.1f} KB  "
+                  f"{metrics['output_bytes']:>9,} bytes")
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Return a list of human-readable regressions beyond threshold"""
+    regressions = []
+    for name, metrics in results.items():
+        if name not in baseline:
+            continue
+        for metric in COMPARED_METRICS:
+            before = baseline[name].get(metric)
+            after = metrics[metric]
+            if before and after > before * (1 + threshold):
+                regressions.append(
+                    f"{name} {metric}: {before} -> {after} (+{(after / before - 1) * 100:.0f}%)"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark invoice and report PDF rendering')
+    parser.add_argument('--sizes', default=','.join(str(size) for size in DEFAULT_SIZES),
+                        help='Comma separated line/invoice counts')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed runs per case')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='Baseline JSON file')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='Allowed relative regression before failing (0.25 = 25%%)')
+    parser.add_argument('--update-baseline', action='store_true', help='Overwrite the baseline with this run')
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    print("PDF Rendering Benchmark")
+    print("=" * 60)
+    results = run_benchmarks(sizes, args.repeat)
+
+    if args.update_baseline or not os.path.exists(args.baseline):
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"\n📝 Baseline written to {args.baseline}")
+        return 0
+
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"\n❌ {len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+        for regression in regressions:
+            print(f"   {regression}")
+        return 1
+
+    print(f"\n✅ No regressions beyond {args.threshold:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
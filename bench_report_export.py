@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Benchmark the streaming CSV/XLSX report export
+
+Builds a throwaway database with N invoice line items (1M by default),
+then times each export format and reports how much the process's peak RSS
+grew while exporting. With streaming exports the growth stays flat as N
+increases.
+
+Usage:
+    python bench_report_export.py
+    python bench_report_export.py --items 100000 --items-per-invoice 10
+"""
+
+import argparse
+import os
+import resource
+import sqlite3
+import tempfile
+import time
+
+from database import InvoiceDatabase
+import report_export
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (Linux reports KB)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def build_database(path, items, items_per_invoice):
+    """Fill a fresh database with synthetic invoices and line items"""
+    database = InvoiceDatabase(path)
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+
+    cursor.executemany('''
+        INSERT INTO books (book_code, title, grade, subject) VALUES (?, ?, 'Primary 1', 'Mathematics')
+    ''', [(f"MATH/P1/{line:03d}", f"PRIMARY MATHS BK {line}") for line in range(items_per_invoice)])
+    cursor.execute("SELECT id FROM books WHERE book_code LIKE 'MATH/P1/%' ORDER BY book_code")
+    book_ids = [row[0] for row in cursor.fetchall()]
+
+    invoice_count = (items + items_per_invoice - 1) // items_per_invoice
+    remaining = items
+    for invoice_index in range(invoice_count):
+        line_count = min(items_per_invoice, remaining)
+        remaining -= line_count
+        gross_kobo = 150000 * 3 * line_count
+        cursor.execute('''
+            INSERT INTO invoices (
+                invoice_number, invoice_type, customer_name, sales_manager, bank_name, account_number,
+                total_quantity, gross_total_kobo, discount_percent, discount_amount_kobo, net_total_kobo, created_at
+            ) VALUES (?, 'credit', ?, 'PETER ETIM', 'ZENITH BANK', '1229600064', ?, ?, 10.0, ?, ?, '2025-09-15 10:00:00')
+        ''', (
+            f"HO/IN/BENCH{invoice_index:08d}",
+            f"BENCH SCHOOL {invoice_index % 2000}",
+            3 * line_count,
+            gross_kobo,
+            gross_kobo // 10,
+            gross_kobo - gross_kobo // 10
+        ))
+        invoice_id = cursor.lastrowid
+        cursor.executemany('''
+            INSERT INTO invoice_items (
+                invoice_id, book_id, rate_kobo, quantity, gross_amount_kobo
+            ) VALUES (?, ?, 150000, 3, 450000)
+        ''', [(invoice_id, book_ids[line]) for line in range(line_count)])
+        if invoice_index % 1000 == 0:
+            conn.commit()
+
+    conn.commit()
+    conn.close()
+    return database
+
+
+def run_export(database, export_format, output_path):
+    """Export every row to output_path, returning (rows, seconds, bytes, rss growth MB)"""
+    counted = {'rows': 0}
+
+    def rows():
+        for row in database.iter_report_line_items('2025-01-01', '2025-12-31'):
+            counted['rows'] += 1
+            yield row
+
+    rss_before = peak_rss_mb()
+    started = time.perf_counter()
+    if export_format == 'csv':
+        with open(output_path, 'w', newline='', encoding='utf-8') as f:
+            for chunk in report_export.stream_csv(database.REPORT_EXPORT_COLUMNS, rows()):
+                f.write(chunk)
+    else:
+        report_export.write_xlsx(database.REPORT_EXPORT_COLUMNS, rows(), output_path)
+    elapsed = time.perf_counter() - started
+
+    return counted['rows'], elapsed, os.path.getsize(output_path), peak_rss_mb() - rss_before
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark streaming CSV/XLSX report export')
+    parser.add_argument('--items', type=int, default=1000000, help='Number of line items to export')
+    parser.add_argument('--items-per-invoice', type=int, default=20)
+    parser.add_argument('--formats', default='csv,xlsx')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, 'bench.db')
+        print(f"Building database with {args.items:,} line items...")
+        started = time.perf_counter()
+        database = build_database(db_path, args.items, args.items_per_invoice)
+        print(f"Built in {time.perf_counter() - started:.1f}s, peak RSS {peak_rss_mb():.1f} MB")
+
+        print("=" * 60)
+        for export_format in args.formats.split(','):
+            output_path = os.path.join(workdir, f"export.{export_format}")
+            rows, elapsed, size, rss_growth = run_export(database, export_format, output_path)
+            print(f"{export_format.upper():5} {rows:>10,} rows  {elapsed:8.1f}s  "
+                  f"{rows / elapsed:>10,.0f} rows/s  {size / 1e6:8.1f} MB  "
+                  f"peak RSS growth {rss_growth:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Benchmark the sales manager report against a scan of the invoices table
+
+Fills a throwaway database with a year of synthetic invoices (inserted
+through the normal triggers, so sales_manager_daily is maintained as it
+would be in production), then times get_sales_manager_performance against
+the same leaderboard computed straight from invoices.
+
+Usage:
+    python bench_sales_managers.py
+    python bench_sales_managers.py --invoices 1000000
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import date, timedelta
+
+from database import InvoiceDatabase
+
+MANAGERS = [f"SALES MANAGER {index}" for index in range(20)]
+
+DIRECT_QUERY = '''
+    SELECT i.sales_manager, COUNT(*), SUM(i.total_quantity), SUM(i.net_total_kobo),
+           SUM(i.school_id IS NOT NULL AND NOT EXISTS (
+               SELECT 1 FROM invoices p
+               WHERE p.school_id = i.school_id AND p.id < i.id AND COALESCE(p.is_discounted_version, 0) = 0
+           ))
+    FROM invoices i
+    WHERE DATE(i.created_at) BETWEEN ? AND ? AND COALESCE(i.is_discounted_version, 0) = 0
+    GROUP BY i.sales_manager
+'''
+
+
+def build_database(path, invoices):
+    """A year of invoices over 5,000 schools; returns (database, seconds spent inserting)"""
+    database = InvoiceDatabase(path)
+    conn = sqlite3.connect(path)
+    conn.executemany('INSERT INTO schools (school_name) VALUES (?)', [(f"BENCH SCHOOL {n}",) for n in range(5000)])
+    rng = random.Random(42)
+    start = date(2025, 1, 1)
+    started = time.perf_counter()
+
+    for index in range(invoices):
+        day = start + timedelta(days=index * 365 // invoices)
+        quantity = rng.randint(1, 600)
+        conn.execute('''
+            INSERT INTO invoices (
+                invoice_number, invoice_type, customer_name, sales_manager, bank_name, account_number,
+                total_quantity, gross_total_kobo, discount_percent, discount_amount_kobo, net_total_kobo,
+                school_id, created_at
+            ) VALUES (?, 'credit', 'BENCH SCHOOL', ?, 'ZENITH BANK', '1229600064', ?, ?, 10.0, ?, ?, ?, ?)
+        ''', (f"HO/IN/BENCH{index:08d}", rng.choice(MANAGERS), quantity, quantity * 230000,
+              quantity * 23000, quantity * 207000, rng.randint(1, 5000), f"{day.isoformat()} 10:00:00"))
+        if index % 1000 == 0:
+            conn.commit()
+
+    conn.commit()
+    elapsed = time.perf_counter() - started
+    conn.close()
+    return database, elapsed
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the sales manager report')
+    parser.add_argument('--invoices', type=int, default=200000, help='Invoices to generate')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed runs per query')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, 'managers.db')
+        database, insert_seconds = build_database(path, args.invoices)
+        print(f"{args.invoices:,} invoices inserted in {insert_seconds:.1f}s (counters maintained by triggers)")
+
+        conn = sqlite3.connect(path)
+        ranges = [('one month', '2025-03-01', '2025-03-31'), ('full year', '2025-01-01', '2025-12-31')]
+        print(f"{'range':12} {'counters ms':>12} {'weekly ms':>10} {'direct ms':>10}")
+        for label, start_date, end_date in ranges:
+            counters = timed(lambda: database.get_sales_manager_performance(start_date, end_date), args.repeat)
+            weekly = timed(lambda: database.get_sales_manager_performance(start_date, end_date, 'week'), args.repeat)
+            direct = timed(lambda: conn.execute(DIRECT_QUERY, (start_date, end_date)).fetchall(), args.repeat)
+            print(f"{label:12} {counters:>12.1f} {weekly:>10.1f} {direct:>10.1f}")
+
+            expected = {row[0]: row[1:] for row in conn.execute(DIRECT_QUERY, (start_date, end_date))}
+            actual = {row['sales_manager']: (row['invoice_count'], row['quantity'], row['net_revenue_kobo'],
+                                             row['new_schools'])
+                      for row in database.get_sales_manager_performance(start_date, end_date)['leaderboard']}
+            assert actual == expected, "counters disagree with the invoices"
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
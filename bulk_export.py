@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Bulk invoice PDF export for EDUwaves Invoice Generator
+
+Renders many stored invoices in parallel worker processes and either merges
+them into one PDF (PyMuPDF) or streams them out as a ZIP archive. Invoices
+are read from the database here; the render processes only import
+invoice_pdf, never the Flask app.
+
+Usage:
+    python bulk_export.py --start 2025-09-01 --end 2025-09-30 -o september.pdf
+    python bulk_export.py --sales-manager "PETER ETIM" --format zip -o peter.zip
+"""
+
+import argparse
+import io
+import multiprocessing
+import os
+import sys
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz  # PyMuPDF
+
+from invoice_pdf import create_invoice_pdf, invoice_record_to_pdf_data
+
+# Number of render processes; ReportLab is CPU bound so threads don't help
+BULK_EXPORT_WORKERS = int(os.environ.get('BULK_EXPORT_WORKERS', os.cpu_count() or 1))
+
+# Documents allowed in flight per worker, bounds memory for large exports
+IN_FLIGHT_PER_WORKER = 4
+
+# Report progress every this many documents
+PROGRESS_EVERY = 50
+
+
+def invoice_filename(invoice_number):
+    """Filename used for an invoice PDF, matching generated_invoices/"""
+    return f"invoice_{invoice_number.replace('/', '_')}.pdf"
+
+
+def load_invoice(invoice_number):
+    """A stored invoice as create_invoice_pdf's data (runs in the calling process)"""
+    from database import db
+
+    invoice = db.get_invoice_by_number(invoice_number)
+    if not invoice:
+        raise ValueError(f"Invoice {invoice_number} not found")
+    return invoice_record_to_pdf_data(invoice)
+
+
+def render_invoice(invoice_number, pdf_data):
+    """Render one invoice to PDF bytes (runs in a render process)"""
+    return create_invoice_pdf(pdf_data, invoice_number).getvalue()
+
+
+def print_progress(done, total):
+    """Progress reporter for the command line"""
+    if done == total or done % PROGRESS_EVERY == 0:
+        print(f"Rendered {done}/{total} invoices")
+
+
+def render_invoices(invoice_numbers, workers=None, progress=None):
+    """Yield (invoice_number, pdf_bytes) in input order, rendering in parallel"""
+    workers = workers or BULK_EXPORT_WORKERS
+    total = len(invoice_numbers)
+
+    if workers <= 1:
+        for done, invoice_number in enumerate(invoice_numbers, 1):
+            yield invoice_number, render_invoice(invoice_number, load_invoice(invoice_number))
+            if progress:
+                progress(done, total)
+        return
+
+    window = workers * IN_FLIGHT_PER_WORKER
+    # Started fresh rather than forked: this may run in a threaded web worker,
+    # whose held locks a forked child would inherit and wait on forever
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        pending = []
+        next_index = 0
+        done = 0
+        while done < total:
+            # Keep a bounded window of submitted renders
+            while next_index < total and len(pending) < window:
+                invoice_number = invoice_numbers[next_index]
+                pending.append((invoice_number, executor.submit(
+                    render_invoice, invoice_number, load_invoice(invoice_number)
+                )))
+                next_index += 1
+
+            invoice_number, future = pending.pop(0)
+            yield invoice_number, future.result()
+            done += 1
+            if progress:
+                progress(done, total)
+
+
+def merge_pdfs(invoice_numbers, workers=None, progress=None):
+    """Render invoices and merge them into a single PDF, returned as bytes"""
+    merged = fitz.open()
+    for _, pdf_bytes in render_invoices(invoice_numbers, workers, progress):
+        with fitz.open(stream=pdf_bytes, filetype='pdf') as part:
+            merged.insert_pdf(part)
+
+    # garbage=4 de-duplicates identical objects, so the logo and icons that
+    # every invoice embeds end up stored once in the merged file
+    pdf_bytes = merged.tobytes(garbage=4, deflate=True)
+    merged.close()
+    return pdf_bytes
+
+
+class _ChunkWriter(io.RawIOBase):
+    """Write-only stream that collects bytes for a streaming response"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_zip(invoice_numbers, workers=None, progress=None):
+    """Yield a ZIP archive of invoice PDFs chunk by chunk as they are rendered"""
+    writer = _ChunkWriter()
+    # PDFs are already compressed internally, so store them as-is
+    with zipfile.ZipFile(writer, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for invoice_number, pdf_bytes in render_invoices(invoice_numbers, workers, progress):
+            archive.writestr(invoice_filename(invoice_number), pdf_bytes)
+            yield writer.drain()
+    yield writer.drain()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export many invoices as one PDF or a ZIP of PDFs')
+    parser.add_argument('--start', help='Start date (YYYY-MM-DD)')
+    parser.add_argument('--end', help='End date (YYYY-MM-DD)')
+    parser.add_argument('--sales-manager', help='Only export invoices for this sales manager')
+    parser.add_argument('--format', choices=['pdf', 'zip'], default='pdf')
+    parser.add_argument('--workers', type=int, default=BULK_EXPORT_WORKERS)
+    parser.add_argument('-o', '--output', required=True, help='Output file path')
+    args = parser.parse_args()
+
+    if not (args.start and args.end) and not args.sales_manager:
+        parser.error('a date range (--start/--end) or --sales-manager is required')
+
+    from database import db
+    invoice_numbers = db.get_invoice_numbers(args.start, args.end, args.sales_manager)
+    if not invoice_numbers:
+        print("No invoices match the selection")
+        return 1
+
+    print(f"Exporting {len(invoice_numbers)} invoices with {args.workers} workers...")
+    with open(args.output, 'wb') as f:
+        if args.format == 'zip':
+            for chunk in stream_zip(invoice_numbers, args.workers, print_progress):
+                f.write(chunk)
+        else:
+            f.write(merge_pdfs(invoice_numbers, args.workers, print_progress))
+
+    print(f"✅ Wrote {args.output} ({os.path.getsize(args.output):,} bytes)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
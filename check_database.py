@@ -6,6 +6,8 @@ import sqlite3
 import os
 from datetime import datetime
 
+import money
+
 def check_database():
     """Check database status and show current data"""
     db_path = "invoices.db"
@@ -36,15 +38,15 @@ def check_database():
         if invoice_count > 0:
             print("\nRecent invoices:")
             cursor.execute("""
-                SELECT invoice_number, customer_name, created_at, net_total 
+                SELECT invoice_number, customer_name, created_at, net_total_kobo
                 FROM invoices 
                 ORDER BY created_at DESC 
                 LIMIT 5
             """)
             
             for row in cursor.fetchall():
-                invoice_num, customer, created_at, net_total = row
-                print(f"  {invoice_num} - {customer} - {created_at} - N{net_total:,.2f}")
+                invoice_num, customer, created_at, net_total_kobo = row
+                print(f"  {invoice_num} - {customer} - {created_at} - {money.format_naira(net_total_kobo)}")
         
         if school_count > 0:
             print(f"\nSample schools:")
@@ -0,0 +1,153 @@
+"""
+gzip / brotli response compression
+
+Negotiated from the request's Accept-Encoding: brotli is preferred when the
+optional ``brotli`` package is installed, otherwise gzip. Only text-like
+responses (JSON, HTML, CSV, ...) are compressed; PDFs, ZIPs and XLSX files
+are already compressed and pass through untouched.
+
+Bodies smaller than COMPRESS_MIN_SIZE go out as they are. Bodies larger
+than COMPRESS_STREAM_SIZE, and streamed responses such as the CSV export,
+are compressed chunk by chunk as they are sent, so the client starts
+receiving data straight away and the whole compressed copy is never held in
+memory.
+"""
+
+import gzip
+import os
+import zlib
+
+try:
+    import brotli
+except ImportError:  # Optional; gzip is always available
+    brotli = None
+
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+COMPRESS_STREAM_SIZE = int(os.environ.get('COMPRESS_STREAM_SIZE', 1024 * 1024))
+COMPRESS_CHUNK_SIZE = 256 * 1024
+
+# Favour speed: these levels get most of the ratio on repetitive JSON
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+COMPRESSIBLE_TYPES = (
+    'text/',
+    'application/json',
+    'application/javascript',
+    'application/xml',
+    'image/svg+xml',
+)
+
+
+def accepted_encodings(header):
+    """Encodings from an Accept-Encoding header with q > 0"""
+    encodings = set()
+    for part in (header or '').split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name and quality > 0:
+            encodings.add(name.strip().lower())
+    return encodings
+
+
+def choose_encoding(header):
+    accepted = accepted_encodings(header)
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted or '*' in accepted:
+        return 'gzip'
+    return None
+
+
+class _Compressor:
+    """Incremental gzip or brotli compressor with a common interface"""
+
+    def __init__(self, encoding):
+        if encoding == 'br':
+            self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+            self.compress = self._compressor.process
+            self.flush = self._compressor.finish
+        else:
+            self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            self.compress = self._compressor.compress
+            self.flush = self._compressor.flush
+
+
+def compress_bytes(data, encoding):
+    """Compress a whole body in one call"""
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+
+def compress_stream(chunks, encoding):
+    """Yield compressed output for an iterable of str/bytes chunks"""
+    compressor = _Compressor(encoding)
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            output = compressor.compress(chunk)
+            if output:
+                yield output
+        yield compressor.flush()
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+
+
+def _slices(data):
+    view = memoryview(data)
+    for offset in range(0, len(view), COMPRESS_CHUNK_SIZE):
+        yield view[offset:offset + COMPRESS_CHUNK_SIZE]
+
+
+def should_compress(request, response):
+    if request.method == 'HEAD' or response.status_code < 200 or response.status_code in (204, 304):
+        return False
+    if 'Content-Encoding' in response.headers or response.direct_passthrough:
+        return False
+    return (response.mimetype or '').startswith(COMPRESSIBLE_TYPES)
+
+
+def compress_response(request, response):
+    """Compress a Flask response in place if the client and body allow it"""
+    if not should_compress(request, response):
+        return response
+
+    encoding = choose_encoding(request.headers.get('Accept-Encoding'))
+    response.vary.add('Accept-Encoding')
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = compress_stream(response.response, encoding)
+    else:
+        body = response.get_data()
+        if len(body) < COMPRESS_MIN_SIZE:
+            return response
+        if len(body) > COMPRESS_STREAM_SIZE:
+            response.response = compress_stream(_slices(body), encoding)
+        else:
+            response.set_data(compress_bytes(body, encoding))
+
+    response.headers['Content-Encoding'] = encoding
+    if response.is_streamed:
+        response.headers.pop('Content-Length', None)
+    return response
+
+
+def init_app(app):
+    """Compress eligible responses of a Flask app"""
+    from flask import request
+
+    @app.after_request
+    def _compress(response):
+        return compress_response(request, response)
@@ -1,18 +1,228 @@
+import contextvars
 import sqlite3
+import logging
 import os
+import queue
+import threading
+from contextlib import contextmanager
 from datetime import datetime
-from typing import List, Dict, Optional
+from pathlib import Path
+from typing import Callable, List, Dict, Optional, Iterator
+
+import metrics
+import money
+import timeseries
+import tracing
+from query_log import TimedConnection
+
+logger = logging.getLogger(__name__)
+
+# Seconds a connection waits on a locked database before raising
+DB_BUSY_TIMEOUT = float(os.environ.get('DB_BUSY_TIMEOUT', 30))
+
+# Idle read-only connections kept open for report reads (see read_connection)
+REPORT_READ_CONNECTIONS = int(os.environ.get('REPORT_READ_CONNECTIONS', 4))
+
+# Chunks a background row stream may fetch ahead of its consumer
+BACKGROUND_PREFETCH_CHUNKS = 4
+
+# Seconds a background stream's consumer waits for a chunk before checking its producer is still running
+BACKGROUND_POLL_SECONDS = 1.0
+
+class _BackgroundRows:
+    """Iterator over rows a report thread pushes in chunks (see InvoiceDatabase.stream_in_background)"""
+
+    _DONE = object()
+
+    def __init__(self):
+        self._chunks = queue.Queue(BACKGROUND_PREFETCH_CHUNKS)
+        self._stopped = threading.Event()
+        self._current = iter(())
+        self._producer = None
+
+    def start(self, target: Callable):
+        """Run target() in a report thread
+
+        Whatever it raises, opening its connection included, is raised again
+        to the consumer, so a failed producer never leaves it waiting.
+        """
+        def run():
+            try:
+                target()
+            except BaseException as e:
+                self._put(e)
+
+        self._producer = threading.Thread(target=run, name='report-stream', daemon=True)
+        self._producer.start()
+
+    def _put(self, item) -> bool:
+        while not self._stopped.is_set():
+            try:
+                self._chunks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce(self, rows, chunk_size):
+        """Run in the report thread: hand rows over chunk by chunk until the end or close()"""
+        try:
+            chunk = []
+            for row in rows:
+                chunk.append(row)
+                if len(chunk) >= chunk_size:
+                    if not self._put(chunk):
+                        return
+                    chunk = []
+            if not chunk or self._put(chunk):
+                self._put(self._DONE)
+        finally:
+            # Finishes the cursor before its connection goes back to the pool
+            if hasattr(rows, 'close'):
+                rows.close()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        while True:
+            for row in self._current:
+                return row
+            if self._stopped.is_set():
+                raise StopIteration
+            item = self._next_chunk()
+            if item is self._DONE:
+                self.close()
+                raise StopIteration
+            if isinstance(item, BaseException):
+                self.close()
+                raise item
+            self._current = iter(item)
+
+    def _next_chunk(self):
+        while True:
+            try:
+                return self._chunks.get(timeout=BACKGROUND_POLL_SECONDS)
+            except queue.Empty:
+                # Anything it put before exiting is already queued
+                if not self._producer.is_alive() and self._chunks.empty():
+                    self.close()
+                    raise RuntimeError("Background row stream stopped without finishing")
+
+    def close(self):
+        """Stop the producer (if still running) and end the iteration"""
+        self._stopped.set()
+
+    def __del__(self):
+        self.close()
+
 
 class InvoiceDatabase:
     def __init__(self, db_path: str = "invoices.db"):
         self.db_path = db_path
+        # Serialises writers within this process; BEGIN IMMEDIATE does the same across processes
+        self.write_lock = threading.Lock()
+        # (book_code, title, grade, subject) -> books.id, see book_id()
+        self._book_ids = {}
+        # Idle read-only connections, see read_connection()
+        self._read_connections = []
+        self._read_lock = threading.Lock()
         self.init_database()
     
+    def get_connection(self) -> sqlite3.Connection:
+        """Open a connection that waits on locks instead of failing with 'database is locked'
+
+        Statements run on it are timed and plan-audited by query_log.
+        """
+        conn = sqlite3.connect(self.db_path, timeout=DB_BUSY_TIMEOUT, factory=TimedConnection)
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+    
+    def begin_write(self) -> sqlite3.Connection:
+        """Open a connection holding the database write lock (release with end_write)
+
+        Taking the write lock up front with BEGIN IMMEDIATE means concurrent
+        writers queue on the busy timeout rather than deadlocking when a read
+        transaction tries to upgrade to a write.
+        """
+        with tracing.span('db.wait_write_lock'):
+            self.write_lock.acquire()
+            try:
+                conn = self.get_connection()
+                conn.execute('BEGIN IMMEDIATE')
+                return conn
+            except Exception:
+                self.write_lock.release()
+                raise
+    
+    def end_write(self, conn: sqlite3.Connection):
+        """Close a connection from begin_write and let the next writer in"""
+        try:
+            conn.close()
+        finally:
+            self.write_lock.release()
+    
+    def get_read_connection(self) -> sqlite3.Connection:
+        """Open a read-only connection that can be passed between threads (used by one at a time)
+
+        In WAL mode it reads alongside the writer and the other readers.
+        """
+        return sqlite3.connect(f"{Path(self.db_path).resolve().as_uri()}?mode=ro", uri=True,
+                               timeout=DB_BUSY_TIMEOUT, factory=TimedConnection, check_same_thread=False)
+    
+    @contextmanager
+    def read_connection(self):
+        """Borrow a pooled read-only connection for the duration of the block"""
+        with self._read_lock:
+            conn = self._read_connections.pop() if self._read_connections else None
+        if conn is None:
+            conn = self.get_read_connection()
+        try:
+            yield conn
+        except BaseException:
+            # It may be mid-statement; don't hand it to the next caller
+            conn.close()
+            raise
+        with self._read_lock:
+            if len(self._read_connections) < REPORT_READ_CONNECTIONS:
+                self._read_connections.append(conn)
+                return
+        conn.close()
+    
+    def stream_in_background(self, section: Callable, chunk_size: int = 500) -> '_BackgroundRows':
+        """Start iterating section(conn) on a read connection now; returns an iterator over its rows
+
+        The rows are fetched in a report thread while the caller does other
+        work, at most BACKGROUND_PREFETCH_CHUNKS chunks ahead of it, so
+        memory stays bounded as with a plain cursor stream. Close the
+        iterator if it is abandoned before the end.
+        """
+        def produce():
+            with self.read_connection() as conn:
+                rows.produce(section(conn), chunk_size)
+
+        rows = _BackgroundRows()
+        # In the caller's context, so spans inside the section land on the request's trace
+        context = contextvars.copy_context()
+        rows.start(lambda: context.run(produce))
+        return rows
+    
+    def after_fork(self):
+        """Reset per-process state in a freshly forked worker"""
+        # A lock copied while held by another thread of the parent would never be released
+        self.write_lock = threading.Lock()
+        # The parent's connections must not be shared
+        self._read_lock = threading.Lock()
+        self._read_connections = []
+    
     def init_database(self):
         """Initialize the database with required tables"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.get_connection()
         cursor = conn.cursor()
         
+        # WAL lets readers run alongside the single writer
+        cursor.execute('PRAGMA journal_mode=WAL')
+        
         # Create schools table
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS schools (
@@ -40,10 +250,10 @@ class InvoiceDatabase:
                 bank_name TEXT NOT NULL,
                 account_number TEXT NOT NULL,
                 total_quantity INTEGER NOT NULL,
-                gross_total REAL NOT NULL,
+                gross_total_kobo INTEGER NOT NULL,
                 discount_percent REAL NOT NULL,
-                discount_amount REAL NOT NULL,
-                net_total REAL NOT NULL,
+                discount_amount_kobo INTEGER NOT NULL,
+                net_total_kobo INTEGER NOT NULL,
                 is_discounted_version BOOLEAN DEFAULT FALSE,
                 original_invoice_id INTEGER,
                 school_id INTEGER,
@@ -70,36 +280,637 @@ class InvoiceDatabase:
             print("Adding original_invoice_id column to invoices table...")
             cursor.execute('ALTER TABLE invoices ADD COLUMN original_invoice_id INTEGER')
         
-        # Create invoice_items table
+        # Book catalog: each load of books_database.json that changes it is a
+        # new catalog version. A book row is one code with its exact text, so
+        # a retitled book gets a new row and old invoices keep their wording.
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS catalog_versions (
+                version INTEGER PRIMARY KEY AUTOINCREMENT,
+                source TEXT NOT NULL,
+                source_hash TEXT NOT NULL,
+                book_count INTEGER NOT NULL,
+                loaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS books (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                book_code TEXT NOT NULL,
+                title TEXT NOT NULL,
+                grade TEXT NOT NULL DEFAULT '',
+                subject TEXT NOT NULL DEFAULT '',
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE (book_code, title, grade, subject)
+            )
+        ''')
+        
+        # Catalog price history: a row per book whenever a catalog version changes its price
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS book_prices (
+                book_id INTEGER NOT NULL,
+                catalog_version INTEGER NOT NULL,
+                price_kobo INTEGER NOT NULL,
+                PRIMARY KEY (book_id, catalog_version),
+                FOREIGN KEY (book_id) REFERENCES books (id),
+                FOREIGN KEY (catalog_version) REFERENCES catalog_versions (version)
+            ) WITHOUT ROWID
+        ''')
+        
+        # Create invoice_items table (catalog_version is the catalog in force
+        # when the item was sold; NULL for items from before catalog tracking)
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS invoice_items (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 invoice_id INTEGER NOT NULL,
-                book_code TEXT NOT NULL,
-                book_title TEXT NOT NULL,
-                book_grade TEXT,
-                book_subject TEXT,
-                rate REAL NOT NULL,
+                book_id INTEGER NOT NULL,
+                catalog_version INTEGER,
+                rate_kobo INTEGER NOT NULL,
                 quantity INTEGER NOT NULL,
-                gross_amount REAL NOT NULL,
-                FOREIGN KEY (invoice_id) REFERENCES invoices (id) ON DELETE CASCADE
+                gross_amount_kobo INTEGER NOT NULL,
+                FOREIGN KEY (invoice_id) REFERENCES invoices (id) ON DELETE CASCADE,
+                FOREIGN KEY (book_id) REFERENCES books (id)
             )
         ''')
         
+        # Databases created before money was stored as integer kobo
+        self.migrate_money_to_kobo(conn)
+        
+        # Databases whose items still carry the book text on every line
+        self.migrate_items_to_books(conn)
+        
+        # Per-book daily sales, kept up to date by triggers on invoice_items
+        self.create_book_sales_rollup(conn)
+
+        # Idempotency keys for invoice generation: a retried request returns
+        # the stored invoice number and PDF instead of creating another invoice
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS idempotency_keys (
+                idempotency_key TEXT PRIMARY KEY,
+                request_hash TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                invoice_number TEXT,
+                pdf_data BLOB,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                expires_at TIMESTAMP NOT NULL,
+                lease_expires_at TIMESTAMP
+            )
+        ''')
+
+        # A pending claim's owner may be killed mid-request; once its lease
+        # runs out the key can be claimed again (see claim_idempotency_key)
+        cursor.execute("PRAGMA table_info(idempotency_keys)")
+        if 'lease_expires_at' not in [column[1] for column in cursor.fetchall()]:
+            print("Adding lease_expires_at column to idempotency_keys table...")
+            cursor.execute('ALTER TABLE idempotency_keys ADD COLUMN lease_expires_at TIMESTAMP')
+        
         # Create indexes for better performance
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_idempotency_expires ON idempotency_keys(expires_at)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_schools_name ON schools(school_name)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_invoices_date ON invoices(created_at)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_invoices_type ON invoices(invoice_type)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_invoices_customer ON invoices(customer_name)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_invoices_school ON invoices(school_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_invoices_original ON invoices(original_invoice_id)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_items_invoice ON invoice_items(invoice_id)')
         
+        # Per-manager and per-invoice-type daily counters, kept up to date by triggers on
+        # invoices (after the indexes: the backfill looks up each school's first invoice)
+        self.create_sales_manager_rollup(conn)
+        self.create_invoice_type_rollup(conn)
+        self.create_rollup_guards(conn)
+        
+        # The whole-table version counter that per-day versions replaced
+        for event in ('insert', 'update', 'delete'):
+            cursor.execute(f'DROP TRIGGER IF EXISTS trg_invoices_version_{event}')
+        cursor.execute('DROP TABLE IF EXISTS data_versions')
+        
+        # Per-day versions: a write only bumps the day(s) it lands on, so a
+        # cached report for a range stays valid until one of its own days changes
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS invoice_day_versions (
+                day TEXT PRIMARY KEY,
+                version INTEGER NOT NULL
+            ) WITHOUT ROWID
+        ''')
+        bump_day = '''
+            INSERT INTO invoice_day_versions (day, version) VALUES (DATE({row}.created_at), 1)
+            ON CONFLICT (day) DO UPDATE SET version = version + 1;
+        '''
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_invoices_day_version_insert AFTER INSERT ON invoices
+            BEGIN
+                {bump_day.format(row='NEW')}
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_invoices_day_version_update AFTER UPDATE ON invoices
+            BEGIN
+                {bump_day.format(row='OLD')}
+                {bump_day.format(row='NEW')}
+            END
+        ''')
+        # Deleting a school's first invoice also changes the day of its next
+        # invoice, which takes over the acquisition in sales_manager_daily
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_invoices_day_version_delete AFTER DELETE ON invoices
+            BEGIN
+                {bump_day.format(row='OLD')}
+                INSERT INTO invoice_day_versions (day, version)
+                SELECT DATE(n.created_at), 1 FROM invoices n
+                WHERE COALESCE(OLD.is_discounted_version, 0) = 0 AND {self.FIRST_SCHOOL_INVOICE_SQL.format(inv='OLD')}
+                  AND n.school_id = OLD.school_id AND n.id > OLD.id AND COALESCE(n.is_discounted_version, 0) = 0
+                ORDER BY n.id LIMIT 1
+                ON CONFLICT (day) DO UPDATE SET version = version + 1;
+            END
+        ''')
+        
         conn.commit()
         conn.close()
-    
+
+    # Money columns that used to be REAL naira, per table; each is now <name>_kobo
+    KOBO_COLUMNS = {
+        'invoices': ('gross_total', 'discount_amount', 'net_total'),
+        'invoice_items': ('rate', 'gross_amount'),
+    }
+
+    def migrate_money_to_kobo(self, conn: sqlite3.Connection, chunk_size: int = 10000):
+        """Move REAL naira money columns onto INTEGER kobo columns
+
+        Each old column gets a <name>_kobo twin, filled with money.to_kobo of
+        the old value (so 0.285 becomes 29 kobo, not 28), and is then dropped.
+        Everything runs in one transaction, so other workers never see a
+        half-migrated table. DROP COLUMN needs SQLite 3.35 or later.
+        """
+        def legacy_columns(table):
+            columns = [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+            return [name for name in self.KOBO_COLUMNS[table] if name in columns]
+
+        if not any(legacy_columns(table) for table in self.KOBO_COLUMNS):
+            return
+
+        conn.commit()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Checked again under the write lock: another worker may have migrated meanwhile
+            for table in self.KOBO_COLUMNS:
+                legacy = legacy_columns(table)
+                if not legacy:
+                    continue
+
+                print(f"Converting {table} money columns to integer kobo...")
+                for name in legacy:
+                    conn.execute(f'ALTER TABLE {table} ADD COLUMN {name}_kobo INTEGER NOT NULL DEFAULT 0')
+
+                assignments = ', '.join(f'{name}_kobo = ?' for name in legacy)
+                last_id = 0
+                while True:
+                    rows = conn.execute(f'''
+                        SELECT id, {', '.join(legacy)} FROM {table}
+                        WHERE id > ? ORDER BY id LIMIT ?
+                    ''', (last_id, chunk_size)).fetchall()
+                    if not rows:
+                        break
+                    conn.executemany(
+                        f'UPDATE {table} SET {assignments} WHERE id = ?',
+                        [[money.to_kobo(value or 0) for value in row[1:]] + [row[0]] for row in rows]
+                    )
+                    last_id = rows[-1][0]
+
+                for name in legacy:
+                    conn.execute(f'ALTER TABLE {table} DROP COLUMN {name}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    # Text columns every invoice_items row used to repeat; now in books
+    LEGACY_ITEM_BOOK_COLUMNS = ('book_code', 'book_title', 'book_grade', 'book_subject')
+
+    def migrate_items_to_books(self, conn: sqlite3.Connection):
+        """Replace the book text on each invoice_items row with a books id
+
+        Every distinct (code, title, grade, subject) seen on an item becomes a
+        books row, items are pointed at it, and the text columns are dropped.
+        Migrated items have no catalog_version. One transaction, like
+        migrate_money_to_kobo.
+        """
+        def has_book_text():
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(invoice_items)')]
+            return 'book_title' in columns
+
+        if not has_book_text():
+            return
+
+        conn.commit()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if has_book_text():
+                print("Moving invoice_items book details into the books table...")
+                conn.execute('''
+                    INSERT OR IGNORE INTO books (book_code, title, grade, subject)
+                    SELECT DISTINCT book_code, book_title, COALESCE(book_grade, ''), COALESCE(book_subject, '')
+                    FROM invoice_items
+                ''')
+                conn.execute('ALTER TABLE invoice_items ADD COLUMN book_id INTEGER NOT NULL DEFAULT 0')
+                conn.execute('ALTER TABLE invoice_items ADD COLUMN catalog_version INTEGER')
+                conn.execute('''
+                    UPDATE invoice_items SET book_id = (
+                        SELECT b.id FROM books b
+                        WHERE b.book_code = invoice_items.book_code
+                          AND b.title = invoice_items.book_title
+                          AND b.grade = COALESCE(invoice_items.book_grade, '')
+                          AND b.subject = COALESCE(invoice_items.book_subject, '')
+                    )
+                ''')
+                for name in self.LEGACY_ITEM_BOOK_COLUMNS:
+                    conn.execute(f'ALTER TABLE invoice_items DROP COLUMN {name}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    # Net amount of one line: its gross less the invoice's discount, rounded per line
+    LINE_NET_SQL = '{item}.gross_amount_kobo - CAST(ROUND({item}.gross_amount_kobo * i.discount_percent / 100.0) AS INTEGER)'
+
+    # Per-book sales rollups and their keys. The plain daily one serves whole
+    # reports; the per-manager one leads with sales_manager so a manager's
+    # drill-down is a primary key range instead of a filter over every row.
+    BOOK_SALES_ROLLUPS = {
+        'book_sales_daily': ('day', 'book_id'),
+        'book_sales_manager_daily': ('sales_manager', 'day', 'book_id'),
+    }
+
+    def create_book_sales_rollup(self, conn: sqlite3.Connection):
+        """Create the BOOK_SALES_ROLLUPS tables and their triggers, backfilled from existing items
+
+        Each row holds quantity, gross and net kobo and the number of lines,
+        so book reports read a few rows per day instead of every line item
+        in the range. Triggers on invoice_items keep them current for every
+        writer in every worker. Discounted copies are left out: they re-issue
+        a sale already counted on the original.
+        """
+        def missing():
+            existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            return [table for table in self.BOOK_SALES_ROLLUPS if table not in existing]
+
+        if not missing():
+            return
+
+        conn.commit()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for table in missing():
+                print(f"Creating {table} rollup...")
+                self._create_rollup(conn, table, self.BOOK_SALES_ROLLUPS[table])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    def _create_rollup(self, conn: sqlite3.Connection, table: str, key: tuple):
+        """One book sales rollup table, its insert/delete triggers and its backfill"""
+        def key_values(item):
+            values = {'day': 'DATE(i.created_at)', 'book_id': f'{item}.book_id', 'sales_manager': 'i.sales_manager'}
+            return ', '.join(values[column] for column in key)
+
+        columns = ', '.join(key)
+        key_definitions = ', '.join(f"{column} {'INTEGER' if column == 'book_id' else 'TEXT'} NOT NULL" for column in key)
+        counted = 'i.id = {item}.invoice_id AND COALESCE(i.is_discounted_version, 0) = 0'
+
+        conn.execute(f'''
+            CREATE TABLE {table} (
+                {key_definitions},
+                quantity INTEGER NOT NULL,
+                gross_kobo INTEGER NOT NULL,
+                net_kobo INTEGER NOT NULL,
+                line_count INTEGER NOT NULL,
+                PRIMARY KEY ({columns})
+            ) WITHOUT ROWID
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER trg_items_{table}_insert AFTER INSERT ON invoice_items
+            BEGIN
+                INSERT INTO {table} ({columns}, quantity, gross_kobo, net_kobo, line_count)
+                SELECT {key_values('NEW')}, NEW.quantity, NEW.gross_amount_kobo,
+                       {self.LINE_NET_SQL.format(item='NEW')}, 1
+                FROM invoices i
+                WHERE {counted.format(item='NEW')}
+                ON CONFLICT ({columns}) DO UPDATE SET
+                    quantity = quantity + excluded.quantity,
+                    gross_kobo = gross_kobo + excluded.gross_kobo,
+                    net_kobo = net_kobo + excluded.net_kobo,
+                    line_count = line_count + 1;
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER trg_items_{table}_delete AFTER DELETE ON invoice_items
+            BEGIN
+                UPDATE {table} SET
+                    quantity = quantity - OLD.quantity,
+                    gross_kobo = gross_kobo - OLD.gross_amount_kobo,
+                    net_kobo = net_kobo - (
+                        SELECT {self.LINE_NET_SQL.format(item='OLD')} FROM invoices i WHERE i.id = OLD.invoice_id
+                    ),
+                    line_count = line_count - 1
+                WHERE ({columns}) = (
+                    SELECT {key_values('OLD')} FROM invoices i WHERE {counted.format(item='OLD')}
+                );
+            END
+        ''')
+        conn.execute(f'''
+            INSERT INTO {table} ({columns}, quantity, gross_kobo, net_kobo, line_count)
+            SELECT {key_values('ii')}, SUM(ii.quantity), SUM(ii.gross_amount_kobo),
+                   SUM({self.LINE_NET_SQL.format(item='ii')}), COUNT(*)
+            FROM invoice_items ii
+            JOIN invoices i ON {counted.format(item='ii')}
+            GROUP BY {key_values('ii')}
+        ''')
+
+    # Whether invoice {inv} is the first counted invoice of its school, i.e. the sale that acquired it
+    FIRST_SCHOOL_INVOICE_SQL = '''({inv}.school_id IS NOT NULL AND NOT EXISTS (
+        SELECT 1 FROM invoices p
+        WHERE p.school_id = {inv}.school_id AND p.id < {inv}.id AND COALESCE(p.is_discounted_version, 0) = 0
+    ))'''
+
+    def _create_table_once(self, conn: sqlite3.Connection, table: str, statements: List[str]):
+        """Run the statements creating (and backfilling) table, in one write transaction, unless it exists"""
+        def exists():
+            return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+
+        if exists():
+            return
+
+        conn.commit()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Another worker may have created it while this one waited for the lock
+            if exists():
+                conn.rollback()
+                return
+            print(f"Creating {table} rollup...")
+            for statement in statements:
+                conn.execute(statement)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    def create_sales_manager_rollup(self, conn: sqlite3.Connection):
+        """Create the sales_manager_daily counters and their triggers, backfilled from existing invoices
+
+        One row per sales manager and day with the invoices raised, books
+        sold, gross and net kobo, and the schools acquired, i.e. schools
+        whose first invoice it was. Discounted copies are not counted.
+        Only inserts and deletes are followed; create_rollup_guards refuses
+        updates to the columns counted here.
+        """
+        first_new = self.FIRST_SCHOOL_INVOICE_SQL.format(inv='NEW')
+        first_old = self.FIRST_SCHOOL_INVOICE_SQL.format(inv='OLD')
+
+        self._create_table_once(conn, 'sales_manager_daily', [
+            '''
+            CREATE TABLE sales_manager_daily (
+                sales_manager TEXT NOT NULL,
+                day TEXT NOT NULL,
+                invoice_count INTEGER NOT NULL,
+                quantity INTEGER NOT NULL,
+                gross_kobo INTEGER NOT NULL,
+                net_kobo INTEGER NOT NULL,
+                new_schools INTEGER NOT NULL,
+                PRIMARY KEY (sales_manager, day)
+            ) WITHOUT ROWID
+            ''',
+            f'''
+            CREATE TRIGGER trg_invoices_sales_manager_daily_insert AFTER INSERT ON invoices
+            WHEN COALESCE(NEW.is_discounted_version, 0) = 0
+            BEGIN
+                INSERT INTO sales_manager_daily (
+                    sales_manager, day, invoice_count, quantity, gross_kobo, net_kobo, new_schools
+                ) VALUES (
+                    NEW.sales_manager, DATE(NEW.created_at), 1, NEW.total_quantity,
+                    NEW.gross_total_kobo, NEW.net_total_kobo, {first_new}
+                )
+                ON CONFLICT (sales_manager, day) DO UPDATE SET
+                    invoice_count = invoice_count + 1,
+                    quantity = quantity + excluded.quantity,
+                    gross_kobo = gross_kobo + excluded.gross_kobo,
+                    net_kobo = net_kobo + excluded.net_kobo,
+                    new_schools = new_schools + excluded.new_schools;
+            END
+            ''',
+            # Deleting a school's first invoice hands the acquisition on to its next invoice, if any
+            f'''
+            CREATE TRIGGER trg_invoices_sales_manager_daily_delete AFTER DELETE ON invoices
+            WHEN COALESCE(OLD.is_discounted_version, 0) = 0
+            BEGIN
+                UPDATE sales_manager_daily SET
+                    invoice_count = invoice_count - 1,
+                    quantity = quantity - OLD.total_quantity,
+                    gross_kobo = gross_kobo - OLD.gross_total_kobo,
+                    net_kobo = net_kobo - OLD.net_total_kobo,
+                    new_schools = new_schools - {first_old}
+                WHERE sales_manager = OLD.sales_manager AND day = DATE(OLD.created_at);
+                UPDATE sales_manager_daily SET new_schools = new_schools + 1
+                WHERE {first_old} AND (sales_manager, day) = (
+                    SELECT n.sales_manager, DATE(n.created_at) FROM invoices n
+                    WHERE n.school_id = OLD.school_id AND n.id > OLD.id
+                      AND COALESCE(n.is_discounted_version, 0) = 0
+                    ORDER BY n.id LIMIT 1
+                );
+            END
+            ''',
+            f'''
+            INSERT INTO sales_manager_daily (
+                sales_manager, day, invoice_count, quantity, gross_kobo, net_kobo, new_schools
+            )
+            SELECT i.sales_manager, DATE(i.created_at), COUNT(*), SUM(i.total_quantity),
+                   SUM(i.gross_total_kobo), SUM(i.net_total_kobo),
+                   SUM({self.FIRST_SCHOOL_INVOICE_SQL.format(inv='i')})
+            FROM invoices i
+            WHERE COALESCE(i.is_discounted_version, 0) = 0
+            GROUP BY i.sales_manager, DATE(i.created_at)
+            ''',
+        ])
+
+    def create_invoice_type_rollup(self, conn: sqlite3.Connection):
+        """Create the invoice_type_daily totals and their triggers, backfilled from existing invoices
+
+        One row per day and invoice type with the invoice count, quantity and
+        gross, discount and net kobo. Like get_invoice_summary it counts every
+        invoice, discounted copies included, so a series adds up to the summary.
+        """
+        self._create_table_once(conn, 'invoice_type_daily', [
+            '''
+            CREATE TABLE invoice_type_daily (
+                day TEXT NOT NULL,
+                invoice_type TEXT NOT NULL,
+                invoice_count INTEGER NOT NULL,
+                quantity INTEGER NOT NULL,
+                gross_kobo INTEGER NOT NULL,
+                discount_kobo INTEGER NOT NULL,
+                net_kobo INTEGER NOT NULL,
+                PRIMARY KEY (day, invoice_type)
+            ) WITHOUT ROWID
+            ''',
+            '''
+            CREATE TRIGGER trg_invoices_invoice_type_daily_insert AFTER INSERT ON invoices
+            BEGIN
+                INSERT INTO invoice_type_daily (
+                    day, invoice_type, invoice_count, quantity, gross_kobo, discount_kobo, net_kobo
+                ) VALUES (
+                    DATE(NEW.created_at), NEW.invoice_type, 1, NEW.total_quantity,
+                    NEW.gross_total_kobo, NEW.discount_amount_kobo, NEW.net_total_kobo
+                )
+                ON CONFLICT (day, invoice_type) DO UPDATE SET
+                    invoice_count = invoice_count + 1,
+                    quantity = quantity + excluded.quantity,
+                    gross_kobo = gross_kobo + excluded.gross_kobo,
+                    discount_kobo = discount_kobo + excluded.discount_kobo,
+                    net_kobo = net_kobo + excluded.net_kobo;
+            END
+            ''',
+            '''
+            CREATE TRIGGER trg_invoices_invoice_type_daily_delete AFTER DELETE ON invoices
+            BEGIN
+                UPDATE invoice_type_daily SET
+                    invoice_count = invoice_count - 1,
+                    quantity = quantity - OLD.total_quantity,
+                    gross_kobo = gross_kobo - OLD.gross_total_kobo,
+                    discount_kobo = discount_kobo - OLD.discount_amount_kobo,
+                    net_kobo = net_kobo - OLD.net_total_kobo
+                WHERE day = DATE(OLD.created_at) AND invoice_type = OLD.invoice_type;
+            END
+            ''',
+            '''
+            INSERT INTO invoice_type_daily (
+                day, invoice_type, invoice_count, quantity, gross_kobo, discount_kobo, net_kobo
+            )
+            SELECT DATE(created_at), invoice_type, COUNT(*), SUM(total_quantity),
+                   SUM(gross_total_kobo), SUM(discount_amount_kobo), SUM(net_total_kobo)
+            FROM invoices
+            GROUP BY DATE(created_at), invoice_type
+            ''',
+        ])
+
+    # Columns the rollups above are computed from, per table. Their triggers
+    # follow inserts and deletes only, so these are never changed in place.
+    ROLLED_UP_COLUMNS = {
+        'invoices': ('id', 'invoice_type', 'sales_manager', 'school_id', 'is_discounted_version', 'created_at',
+                     'total_quantity', 'gross_total_kobo', 'discount_percent', 'discount_amount_kobo',
+                     'net_total_kobo'),
+        'invoice_items': ('invoice_id', 'book_id', 'quantity', 'gross_amount_kobo'),
+    }
+
+    def create_rollup_guards(self, conn: sqlite3.Connection):
+        """Create triggers refusing an UPDATE that changes any ROLLED_UP_COLUMNS value
+
+        Such an update would leave the rollups counting the old values. To
+        correct an invoice, delete it and insert it again.
+        """
+        for table, columns in self.ROLLED_UP_COLUMNS.items():
+            changed = ' OR '.join(f'NEW.{column} IS NOT OLD.{column}' for column in columns)
+            conn.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_rollup_guard BEFORE UPDATE OF {', '.join(columns)} ON {table}
+                WHEN {changed}
+                BEGIN
+                    SELECT RAISE(ABORT, '{table} rows are rolled up on insert and delete; delete and re-insert instead');
+                END
+            ''')
+
+    def book_id(self, cursor: sqlite3.Cursor, book_code: str, title: str, grade: str = '', subject: str = '',
+                new_books: Optional[Dict] = None) -> int:
+        """Id of the books row for this exact book, inserting it if it is new
+
+        Runs on the caller's (write) cursor. Ids are remembered per process,
+        but only once the caller has committed: pass a dict as new_books and
+        merge it with remember_books after the commit. Books are never
+        deleted, so a remembered id stays valid.
+        """
+        key = (book_code, title, grade or '', subject or '')
+        found = self._book_ids.get(key)
+        if found is not None:
+            return found
+        cursor.execute('INSERT OR IGNORE INTO books (book_code, title, grade, subject) VALUES (?, ?, ?, ?)', key)
+        cursor.execute('SELECT id FROM books WHERE book_code = ? AND title = ? AND grade = ? AND subject = ?', key)
+        found = cursor.fetchone()[0]
+        if new_books is not None:
+            new_books[key] = found
+        return found
+
+    def remember_books(self, new_books: Dict):
+        """Cache book ids collected by book_id once their transaction has committed"""
+        self._book_ids.update(new_books)
+
+    @metrics.track_query
+    def sync_book_catalog(self, json_path: str = 'books_database.json') -> int:
+        """Load the catalog file into books/book_prices if it changed; returns the catalog version
+
+        An unchanged file (same SHA-256 as the latest version) is a no-op, so
+        every worker start can call this. Prices are only written for books
+        whose price differs from their latest recorded one.
+        """
+        import hashlib
+        import json
+
+        with open(json_path, 'rb') as f:
+            raw = f.read()
+        source_hash = hashlib.sha256(raw).hexdigest()
+        catalog = json.loads(raw.decode('utf-8'))
+
+        conn = self.begin_write()
+        cursor = conn.cursor()
+        new_books = {}
+        try:
+            cursor.execute('SELECT version, source_hash FROM catalog_versions ORDER BY version DESC LIMIT 1')
+            latest = cursor.fetchone()
+            if latest and latest[1] == source_hash:
+                conn.rollback()
+                return latest[0]
+
+            cursor.execute('INSERT INTO catalog_versions (source, source_hash, book_count) VALUES (?, ?, ?)',
+                           (os.path.basename(json_path), source_hash, len(catalog)))
+            version = cursor.lastrowid
+
+            prices_changed = 0
+            for book in catalog:
+                book_id = self.book_id(cursor, book['book_code'], book['title'], book.get('grade', ''),
+                                       book.get('subject', ''), new_books)
+                price_kobo = money.to_kobo(book['price'])
+                cursor.execute('''
+                    SELECT price_kobo FROM book_prices WHERE book_id = ?
+                    ORDER BY catalog_version DESC LIMIT 1
+                ''', (book_id,))
+                previous = cursor.fetchone()
+                if previous is None or previous[0] != price_kobo:
+                    cursor.execute('INSERT INTO book_prices (book_id, catalog_version, price_kobo) VALUES (?, ?, ?)',
+                                   (book_id, version, price_kobo))
+                    prices_changed += 1
+
+            conn.commit()
+            self.remember_books(new_books)
+            logger.info("Book catalog loaded", extra={
+                'catalog_version': version, 'book_count': len(catalog), 'prices_changed': prices_changed
+            })
+            return version
+        except Exception as e:
+            conn.rollback()
+            raise e
+        finally:
+            self.end_write(conn)
+
+    # invoice_items joined to their books row, with the column names items have always had
+    ITEM_SELECT = '''
+        SELECT ii.id, ii.invoice_id, b.book_code, b.title AS book_title, b.grade AS book_grade,
+               b.subject AS book_subject, ii.rate_kobo, ii.quantity, ii.gross_amount_kobo,
+               ii.book_id, ii.catalog_version
+        FROM invoice_items ii
+        JOIN books b ON b.id = ii.book_id
+    '''
+
+    @metrics.track_query
     def add_or_update_school(self, school_name: str, phone_number: str = '', address: str = '', sales_manager: str = '') -> int:
         """Add a new school or update existing school information"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.begin_write()
         cursor = conn.cursor()
         
         try:
@@ -133,11 +944,12 @@ class InvoiceDatabase:
             conn.rollback()
             raise e
         finally:
-            conn.close()
+            self.end_write(conn)
     
+    @metrics.track_query
     def get_school_by_name(self, school_name: str) -> Optional[Dict]:
         """Get school information by name"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.get_connection()
         cursor = conn.cursor()
         
         cursor.execute('SELECT * FROM schools WHERE school_name = ?', (school_name,))
@@ -152,9 +964,10 @@ class InvoiceDatabase:
         conn.close()
         return None
     
+    @metrics.track_query
     def get_school_invoice_history(self, school_name: str, limit: int = 50) -> List[Dict]:
         """Get invoice history for a specific school"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.get_connection()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -173,10 +986,7 @@ class InvoiceDatabase:
         
         # Get items for each invoice
         for invoice in invoices:
-            cursor.execute('''
-                SELECT * FROM invoice_items WHERE invoice_id = ?
-                ORDER BY id
-            ''', (invoice['id'],))
+            cursor.execute(self.ITEM_SELECT + 'WHERE ii.invoice_id = ? ORDER BY ii.id', (invoice['id'],))
             
             item_columns = [description[0] for description in cursor.description]
             invoice['items'] = [dict(zip(item_columns, row)) for row in cursor.fetchall()]
@@ -184,6 +994,7 @@ class InvoiceDatabase:
         conn.close()
         return invoices
     
+    @metrics.track_query
     def import_schools_from_csv(self, csv_path: str) -> int:
         """Import schools from CSV file"""
         import csv
@@ -192,7 +1003,7 @@ class InvoiceDatabase:
         print(f"Looking for CSV file: {csv_path}")
         print(f"File exists: {os.path.exists(csv_path)}")
         
-        conn = sqlite3.connect(self.db_path)
+        conn = self.begin_write()
         cursor = conn.cursor()
         
         imported_count = 0
@@ -239,12 +1050,14 @@ class InvoiceDatabase:
             print(f"Import failed: {e}")
             raise e
         finally:
-            conn.close()
+            self.end_write(conn)
     
+    @metrics.track_query
     def save_invoice(self, invoice_data: Dict) -> int:
         """Save invoice and its items to database"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.begin_write()
         cursor = conn.cursor()
+        new_books = {}
         
         try:
             # First, handle school information (unless it's Floating Stock or Special Market)
@@ -287,14 +1100,14 @@ class InvoiceDatabase:
                         invoice_data['sales_manager']
                     ))
                     school_id = cursor.lastrowid
-                    print(f"✅ New school added to database: {customer_name} (ID: {school_id})")
+                    logger.info("New school added", extra={'school_name': customer_name, 'school_id': school_id})
             
             # Insert invoice
             cursor.execute('''
                 INSERT INTO invoices (
                     invoice_number, invoice_type, customer_name, customer_phone,
                     customer_address, sales_manager, bank_name, account_number,
-                    total_quantity, gross_total, discount_percent, discount_amount, net_total,
+                    total_quantity, gross_total_kobo, discount_percent, discount_amount_kobo, net_total_kobo,
                     is_discounted_version, original_invoice_id, school_id
                 ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             ''', (
@@ -307,10 +1120,10 @@ class InvoiceDatabase:
                 invoice_data['bank_name'],
                 invoice_data['account_number'],
                 invoice_data['total_quantity'],
-                invoice_data['gross_total'],
+                invoice_data['gross_total_kobo'],
                 invoice_data['discount_percent'],
-                invoice_data['discount_amount'],
-                invoice_data['net_total'],
+                invoice_data['discount_amount_kobo'],
+                invoice_data['net_total_kobo'],
                 invoice_data.get('is_discounted_version', False),
                 invoice_data.get('original_invoice_id', None),
                 school_id
@@ -318,41 +1131,47 @@ class InvoiceDatabase:
             
             invoice_id = cursor.lastrowid
             
-            # Insert invoice items
-            for item in invoice_data['items']:
-                cursor.execute('''
-                    INSERT INTO invoice_items (
-                        invoice_id, book_code, book_title, book_grade, book_subject,
-                        rate, quantity, gross_amount
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    invoice_id,
-                    item['book_code'],
-                    item['title'],
-                    item.get('grade', ''),
-                    item.get('subject', ''),
-                    item['price'],
-                    item['quantity'],
-                    item['price'] * item['quantity']
-                ))
+            # Insert invoice items (prices arrive in naira, stored in kobo)
+            with tracing.span('db.insert_items'):
+                cursor.execute('SELECT MAX(version) FROM catalog_versions')
+                catalog_version = cursor.fetchone()[0]
+                for item in invoice_data['items']:
+                    book_id = self.book_id(cursor, item['book_code'], item['title'], item.get('grade', ''),
+                                           item.get('subject', ''), new_books)
+                    rate_kobo = money.to_kobo(item['price'])
+                    cursor.execute('''
+                        INSERT INTO invoice_items (
+                            invoice_id, book_id, catalog_version, rate_kobo, quantity, gross_amount_kobo
+                        ) VALUES (?, ?, ?, ?, ?, ?)
+                    ''', (
+                        invoice_id,
+                        book_id,
+                        catalog_version,
+                        rate_kobo,
+                        item['quantity'],
+                        rate_kobo * item['quantity']
+                    ))
             
-            conn.commit()
+            with tracing.span('db.commit'):
+                conn.commit()
+            self.remember_books(new_books)
             return invoice_id
             
         except Exception as e:
             conn.rollback()
             raise e
         finally:
-            conn.close()
+            self.end_write(conn)
     
+    @metrics.track_query
     def get_invoices_by_date_range(self, start_date: str, end_date: str) -> List[Dict]:
         """Get invoices within date range"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.get_connection()
         cursor = conn.cursor()
         
         cursor.execute('''
             SELECT * FROM invoices 
-            WHERE DATE(created_at) BETWEEN ? AND ?
+            WHERE created_at >= ? AND created_at < DATE(?, '+1 day')
             ORDER BY created_at DESC
         ''', (start_date, end_date))
         
@@ -361,20 +1180,122 @@ class InvoiceDatabase:
         
         # Get items for each invoice
         for invoice in invoices:
-            cursor.execute('''
-                SELECT * FROM invoice_items WHERE invoice_id = ?
-                ORDER BY id
-            ''', (invoice['id'],))
+            cursor.execute(self.ITEM_SELECT + 'WHERE ii.invoice_id = ? ORDER BY ii.id', (invoice['id'],))
             
             item_columns = [description[0] for description in cursor.description]
             invoice['items'] = [dict(zip(item_columns, row)) for row in cursor.fetchall()]
         
         conn.close()
         return invoices
-    
+
+    @metrics.track_query
+    def iter_invoice_headers(self, start_date: str, end_date: str, chunk_size: int = 500) -> Iterator[Dict]:
+        """Stream invoice header rows for a date range without loading items.
+
+        Rows are pulled from the cursor ``chunk_size`` at a time so memory
+        stays flat no matter how many invoices fall inside the range.
+        """
+        conn = self.get_connection()
+        try:
+            yield from self.invoice_header_rows(conn, start_date, end_date, chunk_size)
+        finally:
+            conn.close()
+
+    def invoice_header_rows(self, conn: sqlite3.Connection, start_date: str, end_date: str,
+                            chunk_size: int = 500) -> Iterator[Dict]:
+        """iter_invoice_headers on a given connection (e.g. for stream_in_background)"""
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT invoice_number, created_at, customer_name, invoice_type, net_total_kobo
+            FROM invoices
+            WHERE created_at >= ? AND created_at < DATE(?, '+1 day')
+            ORDER BY created_at DESC
+        ''', (start_date, end_date))
+
+        columns = [description[0] for description in cursor.description]
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            for row in rows:
+                yield dict(zip(columns, row))
+
+    # Column order of the rows yielded by iter_report_line_items (amounts in naira)
+    REPORT_EXPORT_COLUMNS = [
+        'invoice_number', 'invoice_date', 'invoice_type', 'customer_name', 'sales_manager',
+        'gross_total', 'discount_percent', 'discount_amount', 'net_total',
+        'book_code', 'book_title', 'book_grade', 'book_subject', 'rate', 'quantity', 'gross_amount'
+    ]
+
+    @metrics.track_query
+    def iter_report_line_items(self, start_date: str, end_date: str, chunk_size: int = 1000) -> Iterator[tuple]:
+        """Stream one row per invoice line item (invoice columns repeated) for a date range
+
+        Rows are plain tuples in REPORT_EXPORT_COLUMNS order, fetched from the
+        cursor ``chunk_size`` at a time so exports run in constant memory.
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute('''
+                SELECT i.invoice_number, DATE(i.created_at), i.invoice_type, i.customer_name, i.sales_manager,
+                       i.gross_total_kobo / 100.0, i.discount_percent,
+                       i.discount_amount_kobo / 100.0, i.net_total_kobo / 100.0,
+                       b.book_code, b.title, b.grade, b.subject,
+                       ii.rate_kobo / 100.0, ii.quantity, ii.gross_amount_kobo / 100.0
+                FROM invoices i
+                LEFT JOIN invoice_items ii ON ii.invoice_id = i.id
+                LEFT JOIN books b ON b.id = ii.book_id
+                WHERE i.created_at >= ? AND i.created_at < DATE(?, '+1 day')
+                ORDER BY i.created_at, i.id, ii.id
+            ''', (start_date, end_date))
+
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            conn.close()
+
+    @metrics.track_query
+    def get_invoice_numbers(self, start_date: Optional[str] = None, end_date: Optional[str] = None,
+                            sales_manager: Optional[str] = None) -> List[str]:
+        """Get invoice numbers filtered by date range and/or sales manager, oldest first"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        conditions = []
+        params = []
+        if start_date and end_date:
+            conditions.append("created_at >= ? AND created_at < DATE(?, '+1 day')")
+            params.extend([start_date, end_date])
+        if sales_manager:
+            conditions.append('sales_manager = ?')
+            params.append(sales_manager)
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        cursor.execute(f'''
+            SELECT invoice_number FROM invoices
+            {where}
+            ORDER BY created_at, id
+        ''', params)
+
+        invoice_numbers = [row[0] for row in cursor.fetchall()]
+        conn.close()
+        return invoice_numbers
+
+    @metrics.track_query
     def get_invoice_summary(self, start_date: str, end_date: str) -> Dict:
-        """Get summary statistics for date range"""
-        conn = sqlite3.connect(self.db_path)
+        """Get summary statistics for date range
+
+        The totals, by-type and top-customer queries run one after another on
+        one connection. The report PDF overlaps its sections instead: its
+        invoice rows stream from another connection (stream_in_background)
+        while its summary is computed.
+        """
+        conn = self.get_connection()
         cursor = conn.cursor()
         
         # Get basic counts and totals
@@ -382,11 +1303,11 @@ class InvoiceDatabase:
             SELECT 
                 COUNT(*) as total_invoices,
                 SUM(total_quantity) as total_quantity,
-                SUM(gross_total) as total_gross,
-                SUM(discount_amount) as total_discount,
-                SUM(net_total) as total_net
+                SUM(gross_total_kobo) as total_gross_kobo,
+                SUM(discount_amount_kobo) as total_discount_kobo,
+                SUM(net_total_kobo) as total_net_kobo
             FROM invoices 
-            WHERE DATE(created_at) BETWEEN ? AND ?
+            WHERE created_at >= ? AND created_at < DATE(?, '+1 day')
         ''', (start_date, end_date))
         
         summary = dict(zip([desc[0] for desc in cursor.description], cursor.fetchone()))
@@ -396,14 +1317,14 @@ class InvoiceDatabase:
             SELECT 
                 invoice_type,
                 COUNT(*) as count,
-                SUM(net_total) as total_amount
+                SUM(net_total_kobo) as total_amount_kobo
             FROM invoices 
-            WHERE DATE(created_at) BETWEEN ? AND ?
+            WHERE created_at >= ? AND created_at < DATE(?, '+1 day')
             GROUP BY invoice_type
         ''', (start_date, end_date))
         
         summary['by_type'] = [
-            dict(zip(['invoice_type', 'count', 'total_amount'], row))
+            dict(zip(['invoice_type', 'count', 'total_amount_kobo'], row))
             for row in cursor.fetchall()
         ]
         
@@ -412,25 +1333,189 @@ class InvoiceDatabase:
             SELECT 
                 customer_name,
                 COUNT(*) as invoice_count,
-                SUM(net_total) as total_amount
+                SUM(net_total_kobo) as total_amount_kobo
             FROM invoices 
-            WHERE DATE(created_at) BETWEEN ? AND ?
+            WHERE created_at >= ? AND created_at < DATE(?, '+1 day')
             GROUP BY customer_name
-            ORDER BY total_amount DESC
+            ORDER BY total_amount_kobo DESC
             LIMIT 10
         ''', (start_date, end_date))
         
         summary['top_customers'] = [
-            dict(zip(['customer_name', 'invoice_count', 'total_amount'], row))
+            dict(zip(['customer_name', 'invoice_count', 'total_amount_kobo'], row))
             for row in cursor.fetchall()
         ]
         
         conn.close()
         return summary
     
+    @metrics.track_query
+    def get_book_sales(self, start_date: str, end_date: str, sales_manager: Optional[str] = None,
+                       by_sales_manager: bool = False) -> List[Dict]:
+        """Quantity and revenue per book code, grade and subject for a date range, best sellers first
+
+        Read from the book sales rollups. With sales_manager, only that
+        manager's sales; with by_sales_manager, one row per book and manager.
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        conditions = ['r.day BETWEEN ? AND ?']
+        params = [start_date, end_date]
+        rollup = 'book_sales_manager_daily' if sales_manager or by_sales_manager else 'book_sales_daily'
+        if sales_manager:
+            conditions.append('r.sales_manager = ?')
+            params.append(sales_manager)
+        group_by = 'b.book_code, b.grade, b.subject'
+        if by_sales_manager:
+            group_by += ', r.sales_manager'
+
+        # A bare column next to MAX() comes from the row holding the maximum,
+        # so a retitled book is reported under its newest title
+        cursor.execute(f'''
+            SELECT b.book_code, b.title, MAX(b.id) AS latest_book_id, b.grade, b.subject,
+                   {'r.sales_manager,' if by_sales_manager else ''}
+                   SUM(r.quantity) AS quantity,
+                   SUM(r.gross_kobo) AS gross_revenue_kobo,
+                   SUM(r.net_kobo) AS net_revenue_kobo,
+                   SUM(r.line_count) AS line_count
+            FROM {rollup} r
+            JOIN books b ON b.id = r.book_id
+            WHERE {' AND '.join(conditions)}
+            GROUP BY {group_by}
+            HAVING SUM(r.line_count) > 0
+            ORDER BY net_revenue_kobo DESC, quantity DESC, b.book_code
+        ''', params)
+
+        columns = [description[0] for description in cursor.description]
+        books = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        for book in books:
+            del book['latest_book_id']
+
+        conn.close()
+        return books
+
+    @metrics.track_query
+    def get_sales_manager_performance(self, start_date: str, end_date: str, interval: str = 'day',
+                                      sales_manager: Optional[str] = None) -> Dict:
+        """Sales manager leaderboard and per-manager time series for a date range
+
+        Read from the sales_manager_daily counters. The leaderboard ranks
+        managers by net revenue; each manager's series has one entry per
+        day, week or month of the range, zero where nothing was invoiced.
+        With sales_manager, only that manager.
+        """
+        bucket = timeseries.bucket_sql(interval, 'day')
+        conditions = ['day BETWEEN ? AND ?']
+        params = [start_date, end_date]
+        if sales_manager:
+            conditions.append('sales_manager = ?')
+            params.append(sales_manager)
+        where = ' AND '.join(conditions)
+        totals = '''
+            SUM(invoice_count) AS invoice_count,
+            SUM(quantity) AS quantity,
+            SUM(gross_kobo) AS gross_revenue_kobo,
+            SUM(net_kobo) AS net_revenue_kobo,
+            SUM(new_schools) AS new_schools
+        '''
+
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute(f'''
+            SELECT sales_manager, {totals}
+            FROM sales_manager_daily
+            WHERE {where}
+            GROUP BY sales_manager
+            HAVING SUM(invoice_count) > 0
+            ORDER BY net_revenue_kobo DESC, invoice_count DESC, sales_manager
+        ''', params)
+        columns = [description[0] for description in cursor.description]
+        leaderboard = [dict(zip(columns, row), rank=rank) for rank, row in enumerate(cursor.fetchall(), 1)]
+
+        cursor.execute(f'''
+            SELECT sales_manager, {bucket} AS period, {totals}
+            FROM sales_manager_daily
+            WHERE {where}
+            GROUP BY sales_manager, period
+        ''', params)
+        columns = [description[0] for description in cursor.description]
+        by_manager = {}
+        for row in cursor.fetchall():
+            point = dict(zip(columns, row))
+            by_manager.setdefault(point.pop('sales_manager'), []).append(point)
+
+        conn.close()
+
+        fields = [column for column in columns if column not in ('sales_manager', 'period')]
+        return {
+            'leaderboard': leaderboard,
+            'series': {
+                entry['sales_manager']: timeseries.zero_fill(
+                    by_manager.get(entry['sales_manager'], []), start_date, end_date, interval, fields
+                )
+                for entry in leaderboard
+            },
+        }
+
+    @metrics.track_query
+    def get_revenue_series(self, start_date: str, end_date: str, interval: str = 'day',
+                           invoice_type: Optional[str] = None) -> Dict:
+        """Invoice count, quantity and gross, discount and net kobo per day, week or month
+
+        Read from the invoice_type_daily rollup in one query. Returns a
+        zero-filled series per invoice type and one for all types together;
+        with invoice_type, only that type.
+        """
+        fields = ['count', 'quantity', 'gross_kobo', 'discount_kobo', 'net_kobo']
+        conditions = ['day BETWEEN ? AND ?']
+        params = [start_date, end_date]
+        if invoice_type:
+            conditions.append('invoice_type = ?')
+            params.append(invoice_type)
+
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT invoice_type, {timeseries.bucket_sql(interval, 'day')} AS period,
+                   SUM(invoice_count) AS count,
+                   SUM(quantity) AS quantity,
+                   SUM(gross_kobo) AS gross_kobo,
+                   SUM(discount_kobo) AS discount_kobo,
+                   SUM(net_kobo) AS net_kobo
+            FROM invoice_type_daily
+            WHERE {' AND '.join(conditions)}
+            GROUP BY invoice_type, period
+            HAVING SUM(invoice_count) > 0
+        ''', params)
+        columns = [description[0] for description in cursor.description]
+        rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        conn.close()
+
+        by_type = {}
+        totals = {}
+        for row in rows:
+            by_type.setdefault(row.pop('invoice_type'), []).append(row)
+            total = totals.setdefault(row['period'], dict.fromkeys(fields, 0))
+            for field in fields:
+                total[field] += row[field]
+
+        return {
+            'periods': timeseries.periods(start_date, end_date, interval),
+            'by_type': {
+                name: timeseries.zero_fill(points, start_date, end_date, interval, fields)
+                for name, points in sorted(by_type.items())
+            },
+            'totals': timeseries.zero_fill(
+                [dict(total, period=period) for period, total in totals.items()], start_date, end_date, interval, fields
+            ),
+        }
+
+    @metrics.track_query
     def get_all_invoices(self, limit: int = 100, offset: int = 0) -> List[Dict]:
         """Get all invoices with pagination"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.get_connection()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -445,9 +1530,10 @@ class InvoiceDatabase:
         conn.close()
         return invoices
     
+    @metrics.track_query
     def get_invoice_by_number(self, invoice_number: str) -> Optional[Dict]:
         """Get specific invoice by invoice number"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.get_connection()
         cursor = conn.cursor()
         
         cursor.execute('SELECT * FROM invoices WHERE invoice_number = ?', (invoice_number,))
@@ -458,10 +1544,7 @@ class InvoiceDatabase:
             invoice = dict(zip(columns, row))
             
             # Get items
-            cursor.execute('''
-                SELECT * FROM invoice_items WHERE invoice_id = ?
-                ORDER BY id
-            ''', (invoice['id'],))
+            cursor.execute(self.ITEM_SELECT + 'WHERE ii.invoice_id = ? ORDER BY ii.id', (invoice['id'],))
             
             item_columns = [description[0] for description in cursor.description]
             invoice['items'] = [dict(zip(item_columns, row)) for row in cursor.fetchall()]
@@ -472,9 +1555,10 @@ class InvoiceDatabase:
         conn.close()
         return None
     
+    @metrics.track_query
     def get_invoice_by_id(self, invoice_id: int) -> Optional[Dict]:
         """Get specific invoice by ID"""
-        conn = sqlite3.connect(self.db_path)
+        conn = self.get_connection()
         cursor = conn.cursor()
         
         cursor.execute('SELECT * FROM invoices WHERE id = ?', (invoice_id,))
@@ -489,105 +1573,167 @@ class InvoiceDatabase:
         conn.close()
         return None
     
+    @metrics.track_query
     def create_discounted_invoice(self, original_invoice_id: int, discount_percent: float = 20.0) -> int:
-        """Create a discounted version of an existing invoice"""
-        conn = sqlite3.connect(self.db_path)
+        """Create a discounted version of an existing invoice, or return the existing one"""
+        conn = self.begin_write()
         cursor = conn.cursor()
         
         try:
-            # Check if a discounted version already exists
+            # Check if a discounted version already exists (idx_invoices_original)
             cursor.execute('''
                 SELECT id FROM invoices 
-                WHERE original_invoice_id = ? AND is_discounted = 1
+                WHERE original_invoice_id = ? AND is_discounted_version = 1
+                LIMIT 1
             ''', (original_invoice_id,))
             existing_discounted = cursor.fetchone()
             
             if existing_discounted:
-                print(f"Discounted invoice already exists with ID: {existing_discounted[0]}")
+                logger.debug("Discounted invoice already exists", extra={'invoice_id': existing_discounted[0]})
                 return existing_discounted[0]
             
-            # Get original invoice
-            cursor.execute('SELECT * FROM invoices WHERE id = ?', (original_invoice_id,))
-            original_row = cursor.fetchone()
-            
-            if not original_row:
-                raise ValueError(f"Invoice with ID {original_invoice_id} not found")
-            
-            columns = [description[0] for description in cursor.description]
-            original_invoice = dict(zip(columns, original_row))
-            
-            # Get original invoice items
-            cursor.execute('''
-                SELECT * FROM invoice_items WHERE invoice_id = ?
-                ORDER BY id
-            ''', (original_invoice_id,))
-            
-            item_columns = [description[0] for description in cursor.description]
-            original_items = [dict(zip(item_columns, row)) for row in cursor.fetchall()]
-            
-            # Calculate new totals - same gross total, fixed 20% discount
-            gross_total = original_invoice['gross_total']
-            discount_amount = gross_total * (discount_percent / 100)
-            net_total = gross_total - discount_amount
-            
             # Generate new invoice number with a unique suffix
-            from datetime import datetime
             import time
             timestamp = int(time.time() * 1000)  # Use milliseconds for uniqueness
             new_invoice_number = f"HO/IN/{datetime.now().strftime('%y%m%d%H%M')}{timestamp % 10000:04d}"
             
-            # Insert new discounted invoice
+            cursor.execute('SELECT gross_total_kobo FROM invoices WHERE id = ?', (original_invoice_id,))
+            original = cursor.fetchone()
+            if not original:
+                raise ValueError(f"Invoice with ID {original_invoice_id} not found")
+            discount_kobo = money.percent_of(original[0], discount_percent)
+            
+            # Copy the invoice row with the new discount - same gross total.
+            # The copy is made on demand, possibly long after the original, so
+            # it keeps the original's date and school: the daily rollups,
+            # range versions and closed months see it on the original's day
             cursor.execute('''
                 INSERT INTO invoices (
                     invoice_number, invoice_type, customer_name, customer_phone,
                     customer_address, sales_manager, bank_name, account_number,
-                    total_quantity, gross_total, discount_percent, discount_amount, net_total,
-                    original_invoice_id, is_discounted
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                new_invoice_number,
-                original_invoice['invoice_type'],
-                original_invoice['customer_name'],
-                original_invoice.get('customer_phone', ''),
-                original_invoice.get('customer_address', ''),
-                original_invoice['sales_manager'],
-                original_invoice['bank_name'],
-                original_invoice['account_number'],
-                original_invoice['total_quantity'],
-                gross_total, # Same gross total as original
-                discount_percent, # Fixed 20% discount
-                discount_amount,
-                net_total,
-                original_invoice_id,
-                1 # Mark as discounted
-            ))
+                    total_quantity, gross_total_kobo, discount_percent, discount_amount_kobo, net_total_kobo,
+                    original_invoice_id, is_discounted_version, created_at, school_id
+                )
+                SELECT ?, invoice_type, customer_name, customer_phone,
+                       customer_address, sales_manager, bank_name, account_number,
+                       total_quantity, gross_total_kobo, ?, ?, gross_total_kobo - ?,
+                       id, 1, created_at, school_id
+                FROM invoices WHERE id = ?
+            ''', (new_invoice_number, discount_percent, discount_kobo, discount_kobo, original_invoice_id))
             discounted_invoice_id = cursor.lastrowid
             
-            # Insert items for the discounted invoice (exact same items)
-            for item in original_items:
-                cursor.execute('''
-                    INSERT INTO invoice_items (
-                        invoice_id, book_code, book_title, book_grade, book_subject, rate, quantity, gross_amount
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    discounted_invoice_id,
-                    item['book_code'],
-                    item['book_title'],
-                    item.get('book_grade', ''),
-                    item.get('book_subject', ''),
-                    item['rate'],
-                    item['quantity'],
-                    item['gross_amount']
-                ))
+            # Copy the items (exact same items) in one statement
+            cursor.execute('''
+                INSERT INTO invoice_items (
+                    invoice_id, book_id, catalog_version, rate_kobo, quantity, gross_amount_kobo
+                )
+                SELECT ?, book_id, catalog_version, rate_kobo, quantity, gross_amount_kobo
+                FROM invoice_items WHERE invoice_id = ?
+                ORDER BY id
+            ''', (discounted_invoice_id, original_invoice_id))
             
             conn.commit()
             return discounted_invoice_id
-            
+
         except Exception as e:
             conn.rollback()
             raise e
         finally:
-            conn.close()
+            self.end_write(conn)
+
+    def get_range_version(self, start_date: str, end_date: str) -> int:
+        """Data version of a date range; rises whenever any worker writes an invoice dated inside it"""
+        conn = self.get_connection()
+        row = conn.execute('''
+            SELECT COALESCE(SUM(version), 0) FROM invoice_day_versions WHERE day BETWEEN ? AND ?
+        ''', (start_date, end_date)).fetchone()
+        conn.close()
+        return row[0]
+
+    @metrics.track_query
+    def claim_idempotency_key(self, idempotency_key: str, request_hash: str, ttl_seconds: int,
+                              lease_seconds: int) -> Optional[Dict]:
+        """Claim a key for a new request, or return the existing record for it
+
+        Returns None when this caller now owns the key (and must complete or
+        release it); otherwise the existing record, whose status is 'pending'
+        while the first request is still running. A pending claim holds the
+        key for lease_seconds only: a request whose worker was killed never
+        completes or releases it, so after the lease the next claim takes it
+        over. Expired keys are purged here.
+        """
+        conn = self.begin_write()
+        cursor = conn.cursor()
+
+        try:
+            cursor.execute("DELETE FROM idempotency_keys WHERE expires_at < datetime('now')")
+            cursor.execute('''
+                INSERT INTO idempotency_keys (idempotency_key, request_hash, expires_at, lease_expires_at)
+                VALUES (?, ?, datetime('now', ?), datetime('now', ?))
+                ON CONFLICT (idempotency_key) DO UPDATE SET
+                    request_hash = excluded.request_hash,
+                    created_at = CURRENT_TIMESTAMP,
+                    expires_at = excluded.expires_at,
+                    lease_expires_at = excluded.lease_expires_at
+                WHERE status = 'pending' AND (lease_expires_at IS NULL OR lease_expires_at < datetime('now'))
+            ''', (idempotency_key, request_hash, f'+{int(ttl_seconds)} seconds', f'+{int(lease_seconds)} seconds'))
+            claimed = cursor.rowcount == 1
+            conn.commit()
+            if claimed:
+                return None
+            return self.get_idempotency_key(idempotency_key)
+        except Exception as e:
+            conn.rollback()
+            raise e
+        finally:
+            self.end_write(conn)
+
+    def get_idempotency_key(self, idempotency_key: str) -> Optional[Dict]:
+        """Get the stored record for an idempotency key"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            SELECT idempotency_key, request_hash, status, invoice_number, pdf_data
+            FROM idempotency_keys WHERE idempotency_key = ?
+        ''', (idempotency_key,))
+        row = cursor.fetchone()
+        columns = [description[0] for description in cursor.description]
+        conn.close()
+
+        return dict(zip(columns, row)) if row else None
+
+    @metrics.track_query
+    def complete_idempotency_key(self, idempotency_key: str, invoice_number: str, pdf_data: bytes):
+        """Store the result of the request that owns the key"""
+        conn = self.begin_write()
+
+        try:
+            conn.execute('''
+                UPDATE idempotency_keys SET status = 'done', invoice_number = ?, pdf_data = ?
+                WHERE idempotency_key = ?
+            ''', (invoice_number, pdf_data, idempotency_key))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            raise e
+        finally:
+            self.end_write(conn)
+
+    @metrics.track_query
+    def release_idempotency_key(self, idempotency_key: str):
+        """Forget a pending key whose request failed, so a retry can run it again"""
+        conn = self.begin_write()
+
+        try:
+            conn.execute("DELETE FROM idempotency_keys WHERE idempotency_key = ? AND status = 'pending'",
+                         (idempotency_key,))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            raise e
+        finally:
+            self.end_write(conn)
 
 # Initialize database instance
 db = InvoiceDatabase()
@@ -596,7 +1742,7 @@ db = InvoiceDatabase()
 def initialize_schools_from_csv():
     """Import schools from unique_schools.csv if database is empty"""
     try:
-        conn = sqlite3.connect('invoices.db')
+        conn = db.get_connection()
         cursor = conn.cursor()
         cursor.execute('SELECT COUNT(*) FROM schools')
         count = cursor.fetchone()[0]
@@ -611,9 +1757,18 @@ def initialize_schools_from_csv():
     except Exception as e:
         print(f"Could not import schools from CSV: {e}")
 
+def initialize_book_catalog():
+    """Load books_database.json into the books table if it has changed"""
+    try:
+        version = db.sync_book_catalog('books_database.json')
+        print(f"Book catalog at version {version}")
+    except Exception as e:
+        print(f"Could not load book catalog: {e}")
+
 # Run initialization
 try:
     initialize_schools_from_csv()
+    initialize_book_catalog()
     print("Database initialization completed successfully")
 except Exception as e:
     print(f"Database initialization failed: {e}")
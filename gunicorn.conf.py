@@ -1,18 +1,56 @@
 # Gunicorn configuration file for EDUwaves Invoice Generator
 
+import glob
+import multiprocessing
 import os
+import tempfile
 
 # Server socket
 bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
 backlog = 2048
 
-# Worker processes
-workers = 1  # Single worker for Railway
-worker_class = "sync"
+# Rough resident memory of one worker rendering PDFs, used to cap the worker count
+MEMORY_PER_WORKER_MB = int(os.environ.get('MEMORY_PER_WORKER_MB', 256))
+
+def available_memory_mb():
+    """Memory available to this container (cgroup limit) or host, in MB"""
+    for path in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+            if value != 'max' and int(value) < 1 << 50:
+                return int(value) // (1024 * 1024)
+        except (OSError, ValueError):
+            pass
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) // 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+def default_workers():
+    """One worker per core (PDF rendering is CPU bound), capped by memory"""
+    workers = multiprocessing.cpu_count() + 1
+    memory_mb = available_memory_mb()
+    if memory_mb:
+        workers = min(workers, memory_mb // MEMORY_PER_WORKER_MB)
+    return max(1, workers)
+
+# Worker processes - override with WEB_CONCURRENCY / GUNICORN_WORKER_CLASS / GUNICORN_THREADS
+workers = int(os.environ.get('WEB_CONCURRENCY', default_workers()))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', "gthread")
+threads = int(os.environ.get('GUNICORN_THREADS', 4))  # Requests in flight per worker (gthread)
 worker_connections = 1000
 timeout = 120  # 2 minutes for PDF generation
 keepalive = 2
 
+# Workers share their metrics through this directory so whichever one a
+# scrape reaches can serve the totals at /metrics (a fresh one per start unless set)
+METRICS_DIR = os.environ.setdefault('METRICS_DIR', tempfile.mkdtemp(prefix='eduwaves-metrics-'))
+
 # Restart workers after this many requests, to help prevent memory leaks
 max_requests = 1000
 max_requests_jitter = 50
@@ -40,5 +78,21 @@ certfile = None
 # Preload the application for better performance
 preload_app = True
 
+def on_starting(server):
+    """Start the metrics from zero rather than from a previous run's files"""
+    for path in glob.glob(os.path.join(METRICS_DIR, '*.json')):
+        os.remove(path)
+
+def post_fork(server, worker):
+    """Give each worker its own locks and caches instead of the master's copies"""
+    from app import reset_process_state
+    reset_process_state()
+    server.log.info("Worker %s ready (%s threads)", worker.pid, threads)
+
+def child_exit(server, worker):
+    """Keep an exited worker's counters in the /metrics totals"""
+    import metrics
+    metrics.mark_process_dead(worker.pid)
+
 # Worker timeout for graceful shutdown
 graceful_timeout = 30
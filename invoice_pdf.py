@@ -0,0 +1,466 @@
+"""
+Invoice PDF rendering for EDUwaves Invoice Generator
+
+create_invoice_pdf lays out one invoice with ReportLab. It lives apart from
+app.py so bulk_export's render processes can import it without the Flask
+app, its database setup or its logging thread.
+"""
+
+import io
+import os
+from datetime import datetime
+
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER, TA_LEFT
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image
+
+import metrics
+import money
+
+def invoice_number_text(invoice_number):
+    """Invoice number line shown in the invoice header"""
+    return f"Invoice No.: {invoice_number}"
+
+def invoice_totals_text(invoice_number, gross_kobo, discount_percent):
+    """Text on an invoice that changes between the original and its discounted copy"""
+    discount_kobo = money.percent_of(gross_kobo, discount_percent)
+    net_kobo = gross_kobo - discount_kobo
+    return {
+        'invoice_number': invoice_number_text(invoice_number),
+        'discount_label': f"LESS DISCOUNT {discount_percent}%",
+        'discount_amount': money.format_naira(discount_kobo),
+        'net_total': money.format_naira(net_kobo),
+        'net_payable': f"NET Amount Payable (Naira): {money.format_naira(net_kobo)}",
+        'amount_words': f"Naira: {amount_to_words(net_kobo)}"
+    }
+
+def invoice_record_to_pdf_data(invoice):
+    """Convert a stored invoice (with items) into the dict create_invoice_pdf expects"""
+    # Format items for PDF generation
+    formatted_items = []
+    for item in invoice.get('items', []):
+        formatted_items.append({
+            'book_code': item['book_code'],
+            'title': item['book_title'],
+            'grade': item.get('book_grade', ''),
+            'subject': item.get('book_subject', ''),
+            'price': money.naira(item['rate_kobo']),
+            'quantity': int(item['quantity'])
+        })
+    
+    return {
+        'customer_name': invoice['customer_name'],
+        'customer_phone': invoice.get('customer_phone', ''),
+        'customer_address': invoice.get('customer_address', ''),
+        'sales_manager': invoice['sales_manager'],
+        'bank_name': invoice['bank_name'],
+        'account_number': invoice['account_number'],
+        'discount_percent': invoice['discount_percent'],
+        'invoice_type': invoice['invoice_type'],
+        'items': formatted_items
+    }
+
+def create_invoice_pdf(data, invoice_number):
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=0.3*inch, bottomMargin=0.3*inch)
+    
+    # Styles
+    styles = getSampleStyleSheet()
+    
+    # Custom styles to match the original design
+    title_style = ParagraphStyle(
+        'InvoiceTitle',
+        parent=styles['Heading1'],
+        fontSize=28,
+        textColor=colors.black,
+        alignment=TA_CENTER,
+        spaceAfter=15,
+        fontName='Helvetica-Bold'
+    )
+    
+    company_style = ParagraphStyle(
+        'CompanyInfo',
+        parent=styles['Normal'],
+        fontSize=11,
+        textColor=colors.black,
+        alignment=TA_LEFT,
+        fontName='Helvetica-Bold'
+    )
+    
+    normal_style = ParagraphStyle(
+        'NormalText',
+        parent=styles['Normal'],
+        fontSize=10,
+        textColor=colors.black,
+        alignment=TA_LEFT,
+        fontName='Helvetica'
+    )
+    
+    # Story (content)
+    story = []
+    
+    # Logo and Company Header
+    logo_path = "WhatsApp_Image_2025-08-01_at_12.46.28_e1c96073-removebg-preview.png"
+    if os.path.exists(logo_path):
+        logo = Image(logo_path, width=1.5*inch, height=0.8*inch)
+        story.append(logo)
+        story.append(Spacer(1, 5))
+    
+    # Company Slogan
+    slogan_style = ParagraphStyle(
+        'Slogan',
+        parent=styles['Normal'],
+        fontSize=9,
+        textColor=colors.grey,
+        alignment=TA_CENTER,
+        fontName='Helvetica-Oblique',
+        spaceAfter=10
+    )
+    story.append(Paragraph("...global positioning for the african child", slogan_style))
+    
+    # Invoice Title
+    story.append(Paragraph("INVOICE", title_style))
+    story.append(Spacer(1, 15))
+    
+    # Company Information Table
+    company_data = [
+        ["EDUWAVES PUBLISHERS LTD", "", f"Date: {datetime.now().strftime('%d-%b-%Y')}"],
+        ["14 Onitsha Crescent, Area 11", "", invoice_number_text(invoice_number)],
+        ["Garki, Abuja-FCT, Nigeria", "", f"Order No.: HO/OR/{datetime.now().strftime('%y%m%d')}"]
+    ]
+    
+    company_table = Table(company_data, colWidths=[3.5*inch, 0.5*inch, 2.5*inch])
+    company_table.setStyle(TableStyle([
+        ('ALIGN', (0, 0), (0, -1), 'LEFT'),
+        ('ALIGN', (2, 0), (2, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+        ('FONTNAME', (2, 0), (2, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('LEFTPADDING', (0, 0), (-1, -1), 0),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 0),
+        ('TOPPADDING', (0, 0), (-1, -1), 2),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 2),
+    ]))
+    
+    story.append(company_table)
+    story.append(Spacer(1, 15))
+    
+    # Sales Manager (top right)
+    sm_name = data.get('sales_manager', 'DANIEL MMEYENE')
+    sm_para = Paragraph(f"<para align='right'><b>{sm_name}</b></para>", normal_style)
+    story.append(sm_para)
+    story.append(Spacer(1, 10))
+    
+    # Customer Information
+    customer_name = data.get('customer_name', '')
+    customer_address = data.get('customer_address', '')
+    customer_phone = data.get('customer_phone', '')
+    
+    customer_data = [
+        ["To:", f"{customer_name}"],
+        ["", f"{customer_address}"],
+        ["", f"{customer_phone}"]
+    ]
+    
+    customer_table = Table(customer_data, colWidths=[0.8*inch, 5.5*inch])
+    customer_table.setStyle(TableStyle([
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+        ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('LEFTPADDING', (0, 0), (-1, -1), 0),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 0),
+        ('TOPPADDING', (0, 0), (-1, -1), 2),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 2),
+    ]))
+    
+    story.append(customer_table)
+    story.append(Spacer(1, 20))
+    
+    # Items Table
+    items_data = [["S.No.", "TITLE", "RATE", "QTY.", "GROSS AMT.", "NET AMOUNT"]]
+    
+    total_gross = 0
+    total_quantity = 0
+    
+    for i, item in enumerate(data.get('items', []), 1):
+        rate = money.to_kobo(item['price'])
+        gross_amount = item['quantity'] * rate
+        total_gross += gross_amount
+        total_quantity += item['quantity']
+        items_data.append([
+            str(i),
+            item['title'],
+            money.format_naira(rate),
+            str(item['quantity']),
+            money.format_naira(gross_amount),
+            money.format_naira(gross_amount)
+        ])
+    
+    # Add discount row if applicable
+    discount_percent = data.get('discount_percent', 0)
+    totals_text = invoice_totals_text(invoice_number, total_gross, discount_percent)
+    
+    if discount_percent > 0:
+        # Add total before discount
+        items_data.append([
+            "", "", "", "", money.format_naira(total_gross), money.format_naira(total_gross)
+        ])
+        # Add discount line
+        items_data.append([
+            "", totals_text['discount_label'], "", "", totals_text['discount_amount'], totals_text['net_total']
+        ])
+    
+    # Add final total row
+    items_data.append([
+        "", "Total:", "", str(total_quantity), money.format_naira(total_gross), totals_text['net_total']
+    ])
+    
+    items_table = Table(items_data, colWidths=[0.5*inch, 3.8*inch, 0.8*inch, 0.5*inch, 1*inch, 1*inch])
+    items_table.setStyle(TableStyle([
+        # Header row
+        ('BACKGROUND', (0, 0), (-1, 0), colors.black),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 10),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
+        ('TOPPADDING', (0, 0), (-1, 0), 8),
+        
+        # Data rows
+        ('ALIGN', (0, 1), (-1, -1), 'CENTER'),
+        ('ALIGN', (1, 1), (1, -1), 'LEFT'),  # Title column left-aligned
+        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 1), (-1, -1), 9),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('LEFTPADDING', (0, 0), (-1, -1), 4),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 4),
+        ('TOPPADDING', (0, 0), (-1, -1), 4),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
+        
+        # Total row styling
+        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, -1), (-1, -1), 10),
+    ]))
+    
+    story.append(items_table)
+    story.append(Spacer(1, 20))
+    
+    # Net Amount Payable
+    net_para = Paragraph(f"<para><b>{totals_text['net_payable']}</b></para>", normal_style)
+    story.append(net_para)
+    story.append(Spacer(1, 10))
+    
+    # Amount in words
+    words_para = Paragraph(totals_text['amount_words'], normal_style)
+    story.append(words_para)
+    story.append(Spacer(1, 20))
+    
+    # Bank Details
+    bank_text = "Please make your payment into any of the designated account details below."
+    bank_para = Paragraph(bank_text, normal_style)
+    story.append(bank_para)
+    story.append(Spacer(1, 10))
+    
+    # Get bank details from form data
+    bank_name = data.get('bank_name', 'ZENITH BANK')
+    account_number = data.get('account_number', '1229600064')
+    
+    bank_data = [
+        ["ACCOUNT NAME:", "EDUWAVES PUBLISHERS LTD"],
+        ["BANK NAME:", bank_name],
+        ["ACCOUNT NUMBER:", account_number]
+    ]
+    
+    bank_table = Table(bank_data, colWidths=[1.5*inch, 3*inch])
+    bank_table.setStyle(TableStyle([
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+        ('FONTNAME', (1, 0), (1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('LEFTPADDING', (0, 0), (-1, -1), 0),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 0),
+        ('TOPPADDING', (0, 0), (-1, -1), 2),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 2),
+    ]))
+    
+    story.append(bank_table)
+    story.append(Spacer(1, 20))
+    
+    # Terms and Conditions
+    terms_text = "I/We have received the above books in good condition and promise to pay the bill within a month, failing which I/We will be liable to pay an interest of 20% per annum."
+    terms_style = ParagraphStyle(
+        'TermsStyle',
+        parent=normal_style,
+        fontSize=10,
+        textColor=colors.black,
+        alignment=TA_LEFT,
+        fontName='Helvetica',
+        spaceAfter=10,
+        leftIndent=0,
+        rightIndent=0
+    )
+    terms_para = Paragraph(terms_text, terms_style)
+    story.append(terms_para)
+    story.append(Spacer(1, 10))
+    
+    # Customer Signature
+    signature_text = "Customer's Signature."
+    signature_para = Paragraph(signature_text, normal_style)
+    story.append(signature_para)
+    story.append(Spacer(1, 10))
+    
+    # Note
+    note_text = "Note: The delivery should be taken after checking the Books, we shall not be responsible for any shortage."
+    note_para = Paragraph(note_text, normal_style)
+    story.append(note_para)
+    story.append(Spacer(1, 20))
+    
+    # Contact Information Footer - Beautiful Design
+    contact_footer_style = ParagraphStyle(
+        'ContactFooter',
+        parent=styles['Normal'],
+        fontSize=9,
+        textColor=colors.black,
+        alignment=TA_CENTER,
+        fontName='Helvetica',
+        spaceAfter=5
+    )
+    
+    # Create a horizontal line separator
+    story.append(Spacer(1, 10))
+    line = Table([['']], colWidths=[7*inch])
+    line.setStyle(TableStyle([
+        ('LINEABOVE', (0, 0), (0, 0), 1, colors.grey),
+        ('LINEBELOW', (0, 0), (0, 0), 1, colors.grey),
+    ]))
+    story.append(line)
+    story.append(Spacer(1, 10))
+    
+    # Contact information in a neat table layout
+    contact_data = []
+    contact_row = []
+    
+    # WhatsApp
+    whatsapp_path = "images/whatsapp.png"
+    if os.path.exists(whatsapp_path):
+        whatsapp_icon = Image(whatsapp_path, width=0.2*inch, height=0.2*inch)
+        contact_row.append([whatsapp_icon, Paragraph("09025977776", contact_footer_style)])
+    else:
+        contact_row.append([Paragraph("📱", contact_footer_style), Paragraph("09025977776", contact_footer_style)])
+    
+    # Phone
+    contact_row.append([Paragraph("📞", contact_footer_style), Paragraph("+234 803 086 7910<br/>07066483007", contact_footer_style)])
+    
+    # Website
+    web_path = "images/web.png"
+    if os.path.exists(web_path):
+        web_icon = Image(web_path, width=0.2*inch, height=0.2*inch)
+        contact_row.append([web_icon, Paragraph("www.eduwavespublishers.com", contact_footer_style)])
+    else:
+        contact_row.append([Paragraph("Web", contact_footer_style), Paragraph("www.eduwavespublishers.com", contact_footer_style)])
+    
+    # Email
+    gmail_path = "images/gmail-logo.png"
+    if os.path.exists(gmail_path):
+        gmail_icon = Image(gmail_path, width=0.2*inch, height=0.2*inch)
+        contact_row.append([gmail_icon, Paragraph("eduwavespl@gmail.com", contact_footer_style)])
+    else:
+        contact_row.append([Paragraph("Email", contact_footer_style), Paragraph("eduwavespl@gmail.com", contact_footer_style)])
+    
+    contact_data.append(contact_row)
+    
+    # Create contact table
+    contact_table = Table(contact_data, colWidths=[1.75*inch, 1.75*inch, 1.75*inch, 1.75*inch])
+    contact_table.setStyle(TableStyle([
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('FONTSIZE', (0, 0), (-1, -1), 9),
+        ('LEFTPADDING', (0, 0), (-1, -1), 5),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 5),
+        ('TOPPADDING', (0, 0), (-1, -1), 5),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 5),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.lightgrey),
+    ]))
+    
+    story.append(contact_table)
+    story.append(Spacer(1, 15))
+    
+    # Footer
+    footer_data = [
+        ["Prepared By", "", "Checked By", "", f"Page No.: Page 1 of 1"]
+    ]
+    
+    footer_table = Table(footer_data, colWidths=[1.5*inch, 1*inch, 1.5*inch, 1*inch, 1.5*inch])
+    footer_table.setStyle(TableStyle([
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('LEFTPADDING', (0, 0), (-1, -1), 0),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 0),
+        ('TOPPADDING', (0, 0), (-1, -1), 2),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 2),
+    ]))
+    
+    story.append(footer_table)
+    
+    # Build PDF
+    doc.build(story)
+    metrics.record_pdf('invoice', buffer.tell())
+    buffer.seek(0)
+    return buffer
+
+def number_to_words(num):
+    """Convert number to words (simplified version)"""
+    return integer_to_words(num) + " NAIRA ONLY"
+
+def amount_to_words(kobo):
+    """Amount in kobo in words, with the kobo spelt out when there are any"""
+    naira_part, kobo_part = divmod(kobo, 100)
+    if not kobo_part:
+        return number_to_words(naira_part)
+    return f"{integer_to_words(naira_part)} NAIRA {integer_to_words(kobo_part)} KOBO ONLY"
+
+def integer_to_words(num):
+    """Whole number in words, e.g. ONE THOUSAND TWO HUNDRED"""
+    ones = ["", "ONE", "TWO", "THREE", "FOUR", "FIVE", "SIX", "SEVEN", "EIGHT", "NINE"]
+    tens = ["", "", "TWENTY", "THIRTY", "FORTY", "FIFTY", "SIXTY", "SEVENTY", "EIGHTY", "NINETY"]
+    teens = ["TEN", "ELEVEN", "TWELVE", "THIRTEEN", "FOURTEEN", "FIFTEEN", "SIXTEEN", "SEVENTEEN", "EIGHTEEN", "NINETEEN"]
+    
+    if num == 0:
+        return "ZERO"
+    
+    def convert_hundreds(n):
+        result = ""
+        if n >= 100:
+            result += ones[n // 100] + " HUNDRED "
+            n %= 100
+        if n >= 20:
+            result += tens[n // 10] + " "
+            n %= 10
+        elif n >= 10:
+            result += teens[n - 10] + " "
+            return result
+        if n > 0:
+            result += ones[n] + " "
+        return result
+    
+    result = ""
+    if num >= 1000000:
+        result += convert_hundreds(num // 1000000) + "MILLION "
+        num %= 1000000
+    if num >= 1000:
+        result += convert_hundreds(num // 1000) + "THOUSAND "
+        num %= 1000
+    if num > 0:
+        result += convert_hundreds(num)
+    
+    return result.strip()
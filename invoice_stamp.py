@@ -0,0 +1,129 @@
+"""
+Derive an invoice's discounted copy from the original's rendered PDF
+
+Only the invoice number and the totals block differ between an invoice and
+its discounted copy, so instead of re-running ReportLab we redact those text
+spans in the original PDF and write the new values in the same place.
+"""
+
+import fitz  # PyMuPDF
+
+# ReportLab base-14 font names -> PyMuPDF built-in font aliases
+FONT_ALIASES = {
+    'Helvetica': 'helv',
+    'Helvetica-Bold': 'hebo',
+}
+
+# Keys of invoice_totals_text() that sit in centred table cells
+CENTERED_KEYS = ('discount_amount', 'net_total')
+
+# Default SimpleDocTemplate side margin plus frame padding, in points
+PAGE_SIDE_MARGIN = 72 + 6
+
+
+def _page_spans(doc):
+    """Yield (page_number, span) for every text span in the document"""
+    for page_number, page in enumerate(doc):
+        for block in page.get_text('dict', flags=fitz.TEXTFLAGS_TEXT)['blocks']:
+            for line in block.get('lines', []):
+                for span in line['spans']:
+                    yield page_number, span
+
+
+def _single(matches):
+    return matches[0] if len(matches) == 1 else None
+
+
+def _same_line(span, other):
+    return abs(span['origin'][1] - other['origin'][1]) < 1
+
+
+def _find_targets(spans, original_text):
+    """Locate the span for every value that changes, or None if any is ambiguous"""
+    by_text = {}
+    for page_number, span in spans:
+        by_text.setdefault(span['text'].strip(), []).append((page_number, span))
+
+    label = _single([
+        entry for text, entries in by_text.items() if text.startswith('LESS DISCOUNT ')
+        for entry in entries
+    ])
+    total = _single(by_text.get('Total:', []))
+    if label is None or total is None:
+        return None
+
+    targets = {'discount_label': label}
+    for key in ('invoice_number', 'net_payable', 'amount_words'):
+        entry = _single(by_text.get(original_text[key], []))
+        if entry is None:
+            return None
+        targets[key] = entry
+
+    # The discount amount and net total repeat elsewhere in the table, so
+    # pick them out by the row they share with the discount label / total
+    discount_row = [
+        entry for entry in by_text.get(original_text['discount_amount'], [])
+        if entry[0] == label[0] and _same_line(entry[1], label[1])
+    ]
+    net_cells = [
+        entry for entry in by_text.get(original_text['net_total'], [])
+        if (entry[0] == label[0] and _same_line(entry[1], label[1]))
+        or (entry[0] == total[0] and _same_line(entry[1], total[1]))
+    ]
+    # At a 50% discount the amount and net cells hold the same text; that
+    # (rare) case is left to a full re-render
+    if len(discount_row) != 1 or len(net_cells) != 2:
+        return None
+
+    targets['discount_amount'] = discount_row[0]
+    targets['net_total'] = net_cells
+    return targets
+
+
+def stamp_invoice_text(original_pdf, original_text, new_text):
+    """Return PDF bytes with original_text values replaced by new_text values
+
+    Both text dicts come from invoice_totals_text(). Returns None when the
+    original layout can't be stamped safely (missing discount rows, wrapped
+    lines, unexpected fonts), in which case the caller should re-render.
+    """
+    doc = fitz.open(stream=original_pdf, filetype='pdf')
+    try:
+        targets = _find_targets(list(_page_spans(doc)), original_text)
+        if targets is None:
+            return None
+
+        replacements = []
+        for key, entries in targets.items():
+            if not isinstance(entries, list):
+                entries = [entries]
+            for page_number, span in entries:
+                fontname = FONT_ALIASES.get(span['font'])
+                if fontname is None:
+                    return None
+                replacements.append((page_number, span, fontname, new_text[key], key in CENTERED_KEYS))
+
+        # Redact the old text without touching images or table lines
+        for page_number, span, _, _, _ in replacements:
+            x0, _, x1, _ = span['bbox']
+            baseline = span['origin'][1]
+            band = fitz.Rect(x0, baseline - span['size'] * 0.7, x1, baseline - span['size'] * 0.2)
+            doc[page_number].add_redact_annot(band, fill=False)
+        for page in doc:
+            page.apply_redactions(images=fitz.PDF_REDACT_IMAGE_NONE, graphics=fitz.PDF_REDACT_LINE_ART_NONE)
+
+        for page_number, span, fontname, text, centered in replacements:
+            page = doc[page_number]
+            width = fitz.get_text_length(text, fontname=fontname, fontsize=span['size'])
+            x0, _, x1, _ = span['bbox']
+            if centered:
+                x = (x0 + x1 - width) / 2
+            else:
+                x = x0
+                if x + width > page.rect.width - PAGE_SIDE_MARGIN:
+                    return None  # Would need re-wrapping
+            page.insert_text((x, span['origin'][1]), text, fontname=fontname, fontsize=span['size'])
+
+        return doc.tobytes(garbage=3, deflate=True)
+    finally:
+        doc.close()
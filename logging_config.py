@@ -0,0 +1,122 @@
+"""
+Structured, leveled logging for the invoice app
+
+Log records are put on an in-memory queue by the request threads and written
+to stderr by a single listener thread, so a slow terminal or log shipper never
+blocks a request. Output is one JSON object per line (LOG_FORMAT=text for
+local reading) and includes any keyword fields passed via ``extra``.
+
+High-volume events can be sampled: pass ``extra={'sample_rate': 0.01}`` and
+only about 1 in 100 of them is emitted. Full request/invoice dumps are logged
+at DEBUG, which is off unless LOG_LEVEL=DEBUG.
+"""
+
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json').lower()
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+
+# LogRecord attributes that are not user-supplied fields
+_RESERVED = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'sample_rate'}
+
+_listener = None
+_listener_pid = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with extra fields flattened in"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Drop records whose ``sample_rate`` extra loses the dice roll"""
+
+    def filter(self, record):
+        rate = getattr(record, 'sample_rate', None)
+        return rate is None or random.random() < rate
+
+
+class DropWhenFullQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that drops records instead of blocking when the queue is full"""
+
+    def prepare(self, record):
+        # Resolve the message and traceback now, but keep them separate so
+        # the JSON output can put the traceback in its own field
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+
+def configure_logging(level=None):
+    """Route all logging through a queue to a single stderr writer thread
+
+    Safe to call again (e.g. after a fork): the previous listener is stopped
+    and a new queue and thread are created for this process.
+    """
+    global _listener, _listener_pid
+
+    # A listener inherited across fork has no thread here; just drop it
+    if _listener is not None and _listener_pid == os.getpid():
+        _listener.stop()
+    _listener = None
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    if LOG_FORMAT == 'text':
+        stream_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    else:
+        stream_handler.setFormatter(JsonFormatter())
+
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    queue_handler = DropWhenFullQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, logging.handlers.QueueHandler):
+            root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level or LOG_LEVEL)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    _listener.start()
+    _listener_pid = os.getpid()
+
+
+@atexit.register
+def _stop_listener():
+    """Flush queued records before the interpreter exits"""
+    if _listener is not None and _listener_pid == os.getpid():
+        _listener.stop()
@@ -0,0 +1,358 @@
+"""
+In-process metrics exposed at /metrics in Prometheus text format
+
+Counters, gauges and histograms are plain dicts guarded by one lock each,
+so recording a value costs a dict lookup and an add - cheap enough to leave
+on under load.
+
+Each gunicorn worker records into its own registry, but a scrape of the
+shared port reaches just one of them. So with METRICS_DIR set (gunicorn.conf.py
+does this), every worker writes its series to a file there every
+METRICS_FLUSH_SECONDS, and /metrics serves the sum over all workers: its
+own live values plus the others' latest files. Counters and histograms of
+workers that have exited are folded into an archive file by the master
+(mark_process_dead), so totals don't drop when a worker is recycled.
+"""
+
+import atexit
+import bisect
+import functools
+import glob
+import inspect
+import json
+import os
+import threading
+import time
+
+# Latency buckets in seconds; the tail covers multi-second PDF renders
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# Directory shared by the worker processes of one server; unset, /metrics
+# only reports the process that serves it
+METRICS_DIR = os.environ.get('METRICS_DIR')
+
+# Seconds between a worker writing out its series: how stale the other
+# workers' figures in a scrape can be
+METRICS_FLUSH_SECONDS = float(os.environ.get('METRICS_FLUSH_SECONDS', 5))
+
+ARCHIVE_FILE = 'archive.json'
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(label_names, label_values, extra=None):
+    pairs = list(zip(label_names, label_values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(labels.get(name, '') for name in self.label_names)
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def samples(self):
+        with self._lock:
+            return list(self._values.items())
+
+    @staticmethod
+    def combine(value, other):
+        """Sum of two processes' values for one series"""
+        return value + other
+
+    def render(self, samples=None):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in sorted(self.samples() if samples is None else samples):
+            lines.append(f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket (non-cumulative) counts, then sum and count
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @staticmethod
+    def combine(value, other):
+        return [[a + b for a, b in zip(value[0], other[0])], value[1] + other[1], value[2] + other[2]]
+
+    def render(self, samples=None):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, (counts, total, count) in sorted(self.samples() if samples is None else samples):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.label_names, key, ('le', _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+    def samples(self):
+        with self._lock:
+            return [(key, (list(state[0]), state[1], state[2])) for key, state in self._values.items()]
+
+
+def _worker_file(pid):
+    return os.path.join(METRICS_DIR, f"worker-{pid}.json")
+
+
+def _snapshot():
+    """This process's series as {metric name: [[label values, value], ...]}"""
+    return {metric.name: [[list(key), value] for key, value in metric.samples()] for metric in _registry}
+
+
+def _write_json(path, data):
+    # Written aside and renamed, so a scrape never reads half a file
+    partial = f"{path}.{os.getpid()}.tmp"
+    with open(partial, 'w') as f:
+        json.dump(data, f)
+    os.replace(partial, path)
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def flush():
+    """Write this process's series to METRICS_DIR for the other workers' scrapes"""
+    if METRICS_DIR:
+        _write_json(_worker_file(os.getpid()), _snapshot())
+
+
+def _flush_loop():
+    while True:
+        time.sleep(METRICS_FLUSH_SECONDS)
+        try:
+            flush()
+        except OSError:
+            pass
+
+
+def after_fork():
+    """Start a freshly forked worker's series from zero and begin writing them out
+
+    The values copied from the parent would otherwise be counted once per worker.
+    """
+    for metric in _registry:
+        metric._lock = threading.Lock()
+        metric.reset()
+    if METRICS_DIR:
+        threading.Thread(target=_flush_loop, name='metrics-flush', daemon=True).start()
+        # The last few seconds' counts, for mark_process_dead to archive
+        atexit.register(flush)
+
+
+def mark_process_dead(pid):
+    """Fold an exited worker's counters and histograms into the archive (run by the master)
+
+    Its gauges describe a process that no longer exists, so they are dropped.
+    """
+    if not METRICS_DIR:
+        return
+    path = _worker_file(pid)
+    worker = _read_json(path)
+    if worker:
+        archive_path = os.path.join(METRICS_DIR, ARCHIVE_FILE)
+        archive = _merge([_read_json(archive_path), worker], kinds=('counter', 'histogram'))
+        _write_json(archive_path, {
+            name: [[list(key), value] for key, value in samples.items()] for name, samples in archive.items()
+        })
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _merge(snapshots, kinds=None):
+    """{metric name: {label values: summed value}} over several snapshots"""
+    merged = {}
+    for metric in _registry:
+        if kinds is not None and metric.kind not in kinds:
+            continue
+        series = merged[metric.name] = {}
+        for snapshot in snapshots:
+            for key, value in snapshot.get(metric.name, ()):
+                key = tuple(key)
+                series[key] = metric.combine(series[key], value) if key in series else value
+    return merged
+
+
+def render_latest():
+    """All registered metrics in Prometheus text exposition format, summed over workers"""
+    lines = []
+    if METRICS_DIR:
+        own = _worker_file(os.getpid())
+        others = [_read_json(path) for path in glob.glob(os.path.join(METRICS_DIR, '*.json')) if path != own]
+        merged = _merge([_snapshot()] + others)
+        for metric in _registry:
+            lines.extend(metric.render(list(merged[metric.name].items())))
+    else:
+        for metric in _registry:
+            lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+# --- Application metrics ---
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Time spent handling a request, by Flask endpoint',
+    labels=('endpoint', 'method')
+)
+REQUESTS = Counter('http_requests_total', 'Requests handled, by Flask endpoint and status', labels=('endpoint', 'method', 'status'))
+REQUESTS_IN_FLIGHT = Gauge('http_requests_in_flight', 'Requests currently being handled')
+
+PDFS_RENDERED = Counter('pdf_rendered_total', 'PDF documents produced', labels=('kind',))
+PDF_BYTES = Counter('pdf_bytes_total', 'Bytes of PDF output produced', labels=('kind',))
+
+DB_QUERIES = Counter('db_queries_total', 'InvoiceDatabase method calls', labels=('method',))
+DB_QUERY_SECONDS = Counter('db_query_seconds_total', 'Time spent in InvoiceDatabase methods', labels=('method',))
+
+CACHE_REQUESTS = Counter('cache_requests_total', 'Cache lookups by cache and result (hit/miss)', labels=('cache', 'result'))
+
+
+def record_pdf(kind, size):
+    """Count one rendered PDF of `size` bytes"""
+    PDFS_RENDERED.inc(kind=kind)
+    PDF_BYTES.inc(size, kind=kind)
+
+
+def record_cache(cache, hit):
+    CACHE_REQUESTS.inc(cache=cache, result='hit' if hit else 'miss')
+
+
+def track_query(method):
+    """Decorator counting calls and time for an InvoiceDatabase method
+
+    Generator methods are timed across their whole iteration, since that is
+    where the cursor actually does its work.
+    """
+    name = method.__name__
+
+    if inspect.isgeneratorfunction(method):
+        @functools.wraps(method)
+        def generator_wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                yield from method(*args, **kwargs)
+            finally:
+                DB_QUERIES.inc(method=name)
+                DB_QUERY_SECONDS.inc(time.perf_counter() - started, method=name)
+        return generator_wrapper
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            DB_QUERIES.inc(method=name)
+            DB_QUERY_SECONDS.inc(time.perf_counter() - started, method=name)
+    return wrapper
+
+
+def init_app(app):
+    """Register request timing hooks and the /metrics endpoint on a Flask app"""
+    from flask import Response, g, request
+
+    @app.before_request
+    def _start_request_timer():
+        g.metrics_started = time.perf_counter()
+        REQUESTS_IN_FLIGHT.inc()
+
+    @app.teardown_request
+    def _record_request(error=None):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return
+        REQUESTS_IN_FLIGHT.dec()
+        endpoint = request.endpoint or 'unmatched'
+        REQUEST_LATENCY.observe(time.perf_counter() - started, endpoint=endpoint, method=request.method)
+
+    @app.after_request
+    def _count_response(response):
+        REQUESTS.inc(endpoint=request.endpoint or 'unmatched', method=request.method, status=str(response.status_code))
+        return response
+
+    @app.route('/metrics')
+    def metrics_endpoint():
+        """Prometheus scrape endpoint"""
+        return Response(render_latest(), mimetype='text/plain; version=0.0.4')
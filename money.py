@@ -0,0 +1,67 @@
+"""
+Money amounts as integer kobo (1/100 naira)
+
+Prices arrive from the catalog and the invoice form as decimal naira. They
+are converted to kobo once, at the edge, and from then on every total,
+discount and aggregate is integer arithmetic, both in Python and in SQLite.
+Converting back to naira only happens when a response or a PDF is built,
+so the API keeps its decimal amounts.
+"""
+
+from decimal import Decimal, ROUND_HALF_UP
+
+KOBO_SUFFIX = '_kobo'
+
+
+def to_kobo(amount) -> int:
+    """Naira amount (number or string) to kobo, rounding half a kobo up"""
+    # str() first so 0.1 is the decimal 0.1, not the nearest binary float
+    return int((Decimal(str(amount)) * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def naira(kobo):
+    """Kobo to a naira number for JSON responses (None stays None)"""
+    if kobo is None:
+        return None
+    return kobo / 100
+
+
+def format_naira(kobo) -> str:
+    """Kobo as printed on invoices and reports, e.g. N1,234.50"""
+    kobo = kobo or 0
+    sign = '-' if kobo < 0 else ''
+    whole, fraction = divmod(abs(kobo), 100)
+    return f"{sign}N{whole:,}.{fraction:02d}"
+
+
+def percent_of(kobo: int, percent) -> int:
+    """`percent` per cent of a kobo amount, rounded to the nearest kobo"""
+    share = Decimal(kobo) * Decimal(str(percent)) / 100
+    return int(share.quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def invoice_totals(items, discount_percent):
+    """(total_quantity, gross_kobo, discount_kobo, net_kobo) for items priced in naira"""
+    total_quantity = sum(item['quantity'] for item in items)
+    gross_kobo = sum(to_kobo(item['price']) * item['quantity'] for item in items)
+    discount_kobo = percent_of(gross_kobo, discount_percent)
+    return total_quantity, gross_kobo, discount_kobo, gross_kobo - discount_kobo
+
+
+def as_naira(record):
+    """Copy of a row, or rows, with each `<name>_kobo` field turned into `<name>` in naira
+
+    Nested lists and dicts (e.g. an invoice's items) are converted too, so
+    database results can be handed to jsonify in the API's decimal shape.
+    """
+    if isinstance(record, list):
+        return [as_naira(value) for value in record]
+    if not isinstance(record, dict):
+        return record
+    converted = {}
+    for key, value in record.items():
+        if key.endswith(KOBO_SUFFIX):
+            converted[key[:-len(KOBO_SUFFIX)]] = naira(value)
+        else:
+            converted[key] = as_naira(value)
+    return converted
@@ -0,0 +1,187 @@
+"""
+Opt-in cProfile / tracemalloc capture of single requests
+
+Disabled unless PROFILING_ENABLED=1. When enabled, a request asks to be
+profiled with an ``X-Profile: cpu|memory`` header or a ``?profile=cpu|memory``
+query flag (plus ``X-Profile-Token`` matching PROFILE_TOKEN, if one is set):
+
+- cpu:    the request runs under cProfile and a ``.prof`` file is written
+          (open it with ``python -m pstats`` or snakeviz)
+- memory: tracemalloc snapshots are taken around the request and the top
+          allocation differences are written to a ``.txt`` file
+
+Captures go to PROFILE_DIR, which keeps only the newest PROFILE_MAX_FILES.
+They are listed at /api/debug/profiles and downloaded from
+/api/debug/profiles/<name>. Both profilers are process wide, so only one
+request per worker is captured at a time; others run normally.
+"""
+
+import cProfile
+import os
+import re
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', '').lower() in ('1', 'true', 'yes')
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN', '')
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+PROFILE_MAX_FILES = int(os.environ.get('PROFILE_MAX_FILES', 20))
+
+# Frames kept per tracemalloc allocation; more is slower but more useful
+TRACEMALLOC_FRAMES = 10
+# Allocation sites listed in a memory capture
+MEMORY_TOP_STATS = 50
+
+PROFILE_KINDS = ('cpu', 'memory')
+
+_capture_lock = threading.Lock()
+_local = threading.local()
+
+
+def requested_kind(request):
+    """The profile kind this request asked for (and is allowed), or None"""
+    kind = request.headers.get('X-Profile') or request.args.get('profile')
+    if not PROFILING_ENABLED or kind not in PROFILE_KINDS:
+        return None
+    if PROFILE_TOKEN and request.headers.get('X-Profile-Token') != PROFILE_TOKEN:
+        return None
+    return kind
+
+
+def capture_filename(endpoint, kind):
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+    endpoint = re.sub(r'[^A-Za-z0-9_]+', '_', endpoint or 'unmatched')
+    extension = 'prof' if kind == 'cpu' else 'txt'
+    return f"{stamp}_{os.getpid()}_{endpoint}_{kind}.{extension}"
+
+
+def list_captures():
+    """Capture files, newest first"""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    captures = []
+    for name in os.listdir(PROFILE_DIR):
+        path = os.path.join(PROFILE_DIR, name)
+        if os.path.isfile(path) and name.endswith(('.prof', '.txt')):
+            stat = os.stat(path)
+            captures.append({'name': name, 'size': stat.st_size, 'modified': stat.st_mtime})
+    captures.sort(key=lambda capture: capture['modified'], reverse=True)
+    return captures
+
+
+def prune_captures():
+    """Delete the oldest captures beyond PROFILE_MAX_FILES"""
+    for capture in list_captures()[PROFILE_MAX_FILES:]:
+        try:
+            os.remove(os.path.join(PROFILE_DIR, capture['name']))
+        except OSError:
+            pass  # Another worker got there first
+
+
+def write_memory_report(path, before, after, peak, duration, label):
+    stats = after.compare_to(before, 'lineno')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(f"{label}\n")
+        f.write(f"Duration: {duration * 1000:.1f} ms, traced peak: {peak / 1024:.1f} KB\n")
+        f.write(f"Top {MEMORY_TOP_STATS} allocation sites still live at the end of the request:\n\n")
+        for stat in stats[:MEMORY_TOP_STATS]:
+            f.write(f"{stat}\n")
+            for line in stat.traceback.format()[-4:]:
+                f.write(f"    {line}\n")
+
+
+def start_capture(kind):
+    """Start profiling this thread's request; False if another capture is running"""
+    if not _capture_lock.acquire(blocking=False):
+        return False
+    try:
+        if kind == 'cpu':
+            profiler = cProfile.Profile()
+            profiler.enable()
+            _local.capture = (kind, profiler, time.perf_counter())
+        else:
+            if tracemalloc.is_tracing():
+                # Someone is already tracing (e.g. a benchmark); don't disturb it
+                _capture_lock.release()
+                return False
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            _local.capture = (kind, tracemalloc.take_snapshot(), time.perf_counter())
+        return True
+    except Exception:
+        _capture_lock.release()
+        raise
+
+
+def finish_capture(endpoint, label):
+    """Stop the running capture and write it out; returns the file name"""
+    kind, state, started = _local.__dict__.pop('capture')
+    try:
+        duration = time.perf_counter() - started
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        name = capture_filename(endpoint, kind)
+        path = os.path.join(PROFILE_DIR, name)
+        if kind == 'cpu':
+            state.disable()
+            state.dump_stats(path)
+        else:
+            after = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            write_memory_report(path, state, after, peak, duration, label)
+        prune_captures()
+        return name
+    finally:
+        if kind == 'cpu':
+            state.disable()
+        elif tracemalloc.is_tracing():
+            tracemalloc.stop()
+        _capture_lock.release()
+
+
+def init_app(app):
+    """Register the per-request profiling hooks and the capture admin endpoints"""
+    from flask import abort, g, jsonify, request, send_from_directory
+
+    @app.before_request
+    def _start_profile():
+        kind = requested_kind(request)
+        if kind is None:
+            return
+        g.profile_status = 'captured' if start_capture(kind) else 'busy'
+
+    @app.after_request
+    def _finish_profile(response):
+        if getattr(g, 'profile_status', None) == 'captured':
+            name = finish_capture(request.endpoint, f"{request.method} {request.full_path}")
+            response.headers['X-Profile-Capture'] = name
+        elif getattr(g, 'profile_status', None) == 'busy':
+            response.headers['X-Profile-Capture'] = 'busy'
+        return response
+
+    @app.teardown_request
+    def _abandon_profile(error=None):
+        # after_request doesn't run for unhandled errors; stop the profiler anyway
+        if getattr(_local, 'capture', None) is not None:
+            finish_capture(request.endpoint, f"{request.method} {request.full_path} (failed)")
+
+    def check_admin():
+        if not PROFILING_ENABLED:
+            abort(404)
+        if PROFILE_TOKEN and request.headers.get('X-Profile-Token', request.args.get('token')) != PROFILE_TOKEN:
+            abort(403)
+
+    @app.route('/api/debug/profiles')
+    def list_profiles():
+        """List captured profiles, newest first"""
+        check_admin()
+        return jsonify({'success': True, 'directory': PROFILE_DIR, 'profiles': list_captures()})
+
+    @app.route('/api/debug/profiles/<name>')
+    def download_profile(name):
+        """Download one capture file"""
+        check_admin()
+        if name not in {capture['name'] for capture in list_captures()}:
+            abort(404)
+        return send_from_directory(os.path.abspath(PROFILE_DIR), name, as_attachment=True)
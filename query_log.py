@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Slow-query log and query-plan auditor for InvoiceDatabase
+
+InvoiceDatabase opens its connections with TimedConnection, so every
+statement it runs is timed (execute plus the fetches that follow it) and
+aggregated per distinct SQL text. Statements slower than SLOW_QUERY_MS are
+logged with the shapes (types, not values) of their parameters.
+
+The first time each distinct SELECT/UPDATE/DELETE is seen, its
+EXPLAIN QUERY PLAN is checked and a warning is logged if it does a full
+table scan of invoices or invoice_items.
+
+Run as a script for a report of the top statements by total time, either
+from a running worker's /api/debug/queries or by exercising the report and
+lookup paths against a local database:
+
+    python query_log.py                         # against ./invoices.db
+    python query_log.py --db other.db --top 20
+    python query_log.py --url http://localhost:5000
+"""
+
+import argparse
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 100))
+QUERY_PLAN_AUDIT = os.environ.get('QUERY_PLAN_AUDIT', '1').lower() not in ('0', 'false', 'no')
+
+# Tables large enough that an unindexed scan is worth a warning
+AUDITED_TABLES = ('invoices', 'invoice_items')
+# SCAN (as opposed to SEARCH) visits every row of the table or of an index on
+# it; scans of a covering index or cut short by LIMIT are not reported
+FULL_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(?!.*COVERING INDEX)')
+HAS_LIMIT = re.compile(r'\bLIMIT\b', re.IGNORECASE)
+# Plans name aliased tables by their alias, e.g. 'FROM invoices i' -> 'SCAN i'
+TABLE_ALIAS = re.compile(r'\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?', re.IGNORECASE)
+EXPLAINABLE = ('SELECT', 'UPDATE', 'DELETE', 'WITH')
+
+_stats = {}
+_audited = set()
+_plan_warnings = {}
+_lock = threading.Lock()
+
+
+def normalize(sql):
+    """Collapse whitespace so the same statement always aggregates together"""
+    return ' '.join(sql.split())
+
+
+def parameter_shape(parameters):
+    """Types of the bound parameters, without their values"""
+    if parameters is None:
+        return []
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    return [type(value).__name__ for value in parameters]
+
+
+def record(sql, seconds, parameters=None, phase='execute'):
+    """Add one execution (or fetch) to the statement's totals"""
+    with _lock:
+        entry = _stats.get(sql)
+        if entry is None:
+            entry = _stats[sql] = {'calls': 0, 'total_seconds': 0.0, 'max_seconds': 0.0}
+        if phase == 'execute':
+            entry['calls'] += 1
+        entry['total_seconds'] += seconds
+        entry['max_seconds'] = max(entry['max_seconds'], seconds)
+
+    if seconds * 1000 >= SLOW_QUERY_MS:
+        logger.warning("Slow query", extra={
+            'sql': sql, 'phase': phase, 'duration_ms': round(seconds * 1000, 2),
+            'parameter_shape': parameter_shape(parameters)
+        })
+
+
+def audit_plan(conn, sql, parameters):
+    """EXPLAIN QUERY PLAN a statement the first time it is seen"""
+    with _lock:
+        if sql in _audited:
+            return
+        _audited.add(sql)
+    if not sql.upper().startswith(EXPLAINABLE) or HAS_LIMIT.search(sql):
+        return
+
+    try:
+        plan = sqlite3.Connection.execute(conn, f'EXPLAIN QUERY PLAN {sql}', parameters or ()).fetchall()
+    except sqlite3.Error:
+        return  # e.g. temp objects or statements EXPLAIN can't take
+
+    aliases = {alias: table for table, alias in TABLE_ALIAS.findall(sql) if alias}
+    scans = []
+    for row in plan:
+        match = FULL_SCAN.match(row[-1])
+        if match and aliases.get(match.group(1), match.group(1)) in AUDITED_TABLES:
+            scans.append(aliases.get(match.group(1), match.group(1)))
+    if scans:
+        with _lock:
+            _plan_warnings[sql] = [row[-1] for row in plan]
+        logger.warning("Full table scan in query plan", extra={
+            'sql': sql, 'tables': scans, 'plan': [row[-1] for row in plan]
+        })
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that times statements and the fetches that follow them"""
+
+    _sql = None
+
+    def execute(self, sql, parameters=()):
+        self._sql = normalize(sql)
+        if QUERY_PLAN_AUDIT:
+            audit_plan(self.connection, self._sql, parameters)
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            record(self._sql, time.perf_counter() - started, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._sql = normalize(sql)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            record(self._sql, time.perf_counter() - started)
+
+    def _timed_fetch(self, fetch, *args):
+        started = time.perf_counter()
+        try:
+            return fetch(*args)
+        finally:
+            if self._sql is not None:
+                record(self._sql, time.perf_counter() - started, phase='fetch')
+
+    def fetchone(self):
+        return self._timed_fetch(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._timed_fetch(super().fetchmany, self.arraysize if size is None else size)
+
+    def fetchall(self):
+        return self._timed_fetch(super().fetchall)
+
+
+class TimedConnection(sqlite3.Connection):
+    """Connection whose cursors (including conn.execute shortcuts) are timed"""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def query_stats(top=None):
+    """Statements ordered by total time, with any plan warnings attached"""
+    with _lock:
+        rows = [
+            {
+                'sql': sql,
+                'calls': entry['calls'],
+                'total_ms': round(entry['total_seconds'] * 1000, 2),
+                'mean_ms': round(entry['total_seconds'] * 1000 / max(entry['calls'], 1), 3),
+                'max_ms': round(entry['max_seconds'] * 1000, 2),
+                'full_scan_plan': _plan_warnings.get(sql)
+            }
+            for sql, entry in _stats.items()
+        ]
+    rows.sort(key=lambda row: row['total_ms'], reverse=True)
+    return rows[:top] if top else rows
+
+
+def reset_stats():
+    with _lock:
+        _stats.clear()
+        _audited.clear()
+        _plan_warnings.clear()
+
+
+def print_report(rows):
+    print(f"{'total ms':>10} {'calls':>7} {'mean ms':>9} {'max ms':>9}  statement")
+    for row in rows:
+        sql = row['sql'] if len(row['sql']) <= 100 else row['sql'][:97] + '...'
+        print(f"{row['total_ms']:>10.1f} {row['calls']:>7} {row['mean_ms']:>9.2f} {row['max_ms']:>9.1f}  {sql}")
+        if row['full_scan_plan']:
+            print(f"{'':>39}⚠️  full scan: {' | '.join(row['full_scan_plan'])}")
+
+
+def exercise_database(db_path):
+    """Run the app's common read paths once against db_path"""
+    from database import InvoiceDatabase
+
+    database = InvoiceDatabase(db_path)
+    conn = database.get_connection()
+    first, last = conn.execute('SELECT MIN(created_at), MAX(created_at) FROM invoices').fetchone()
+    conn.close()
+    if first is None:
+        print("Database has no invoices; nothing to exercise")
+        return
+    start_date, end_date = first[:10], last[:10]
+
+    database.get_invoice_summary(start_date, end_date)
+    for _ in database.iter_invoice_headers(start_date, end_date):
+        pass
+    for _ in database.iter_report_line_items(start_date, end_date):
+        pass
+    database.get_all_invoices(limit=100)
+    for invoice_number in database.get_invoice_numbers(start_date, end_date)[:20]:
+        invoice = database.get_invoice_by_number(invoice_number)
+        database.get_school_invoice_history(invoice['customer_name'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Top SQL statements by total time')
+    parser.add_argument('--db', default='invoices.db', help='Database to exercise locally')
+    parser.add_argument('--url', help='Fetch live statistics from a running server instead')
+    parser.add_argument('--top', type=int, default=15, help='Statements to list')
+    args = parser.parse_args()
+
+    if args.url:
+        import requests
+        response = requests.get(f"{args.url.rstrip('/')}/api/debug/queries", params={'top': args.top}, timeout=30)
+        response.raise_for_status()
+        data = response.json()
+        print(f"Top statements in worker {data['pid']} of {args.url}")
+        print_report(data['queries'])
+        return 0
+
+    if not os.path.exists(args.db):
+        print(f"❌ {args.db} not found")
+        return 1
+    # database.py records into the imported module, not this __main__ copy
+    import query_log
+    exercise_database(args.db)
+    print(f"Top statements exercising {args.db}")
+    print_report(query_log.query_stats(args.top))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+"""
+Streaming spreadsheet exports for invoice reports
+
+Both writers consume rows lazily (e.g. straight from a SQLite cursor) so
+memory use does not depend on how many rows are exported.
+"""
+
+import csv
+import io
+import os
+import tempfile
+
+from openpyxl import Workbook
+
+# Rows buffered before a CSV chunk is handed to the response
+CSV_ROWS_PER_CHUNK = 1000
+
+# Excel's hard limit is 1,048,576 rows per sheet (one is the header)
+XLSX_MAX_ROWS_PER_SHEET = 1048575
+
+# Bytes per chunk when streaming a finished XLSX file back to the client
+FILE_CHUNK_SIZE = 64 * 1024
+
+
+def stream_csv(columns, rows):
+    """Yield CSV text chunks for a header row followed by ``rows``"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+
+    pending = 0
+    for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending >= CSV_ROWS_PER_CHUNK:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+
+    yield buffer.getvalue()
+
+
+def write_xlsx(columns, rows, path, sheet_title='Invoices', summary_rows=None):
+    """Write rows to an XLSX file using openpyxl's write-only mode
+
+    Write-only worksheets stream rows to disk as they are appended; a new
+    sheet is started whenever Excel's per-sheet row limit is reached.
+    ``summary_rows``, if given, go on a Summary sheet in front.
+    """
+    workbook = Workbook(write_only=True)
+    if summary_rows is not None:
+        summary_sheet = workbook.create_sheet('Summary')
+        for row in summary_rows:
+            summary_sheet.append(row)
+
+    sheet = None
+    sheet_rows = XLSX_MAX_ROWS_PER_SHEET
+    sheet_count = 0
+
+    for row in rows:
+        if sheet_rows >= XLSX_MAX_ROWS_PER_SHEET:
+            sheet_count += 1
+            title = sheet_title if sheet_count == 1 else f"{sheet_title} {sheet_count}"
+            sheet = workbook.create_sheet(title)
+            sheet.append(columns)
+            sheet_rows = 0
+        sheet.append(row)
+        sheet_rows += 1
+
+    if sheet is None:
+        workbook.create_sheet(sheet_title).append(columns)
+
+    workbook.save(path)
+
+
+def stream_xlsx(columns, rows, sheet_title='Invoices', summary_rows=None):
+    """Build an XLSX in a temporary file and yield it back in chunks"""
+    fd, path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(fd)
+    try:
+        write_xlsx(columns, rows, path, sheet_title, summary_rows)
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(FILE_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        os.remove(path)
@@ -0,0 +1,173 @@
+"""
+Request coalescing and a short-lived result cache for report endpoints
+
+When several managers open the same month's report at once, the first
+request computes it and the others wait for and share that result instead
+of running the same queries and render in parallel. Results are then kept
+for REPORT_CACHE_SECONDS.
+
+Keys include the data version of the report's date range, the sum of the
+per-day versions that invoice writes (in any worker) bump on the days they
+land on. A new invoice makes earlier results for ranges holding its day
+unreachable instead of serving them stale, and leaves other ranges cached.
+
+Ranges that end before the current month are closed: new invoices are
+dated today, so they do not change, and their results are kept without
+expiry, up to REPORT_CACHE_CLOSED_SIZE of them and REPORT_CACHE_CLOSED_BYTES
+in all (invoice lists of a whole year are megabytes each). Results that are
+not a pure function of the data, such as report PDFs stamped with the time
+they were generated, opt out and are only kept for REPORT_CACHE_SECONDS.
+Both the coalescing and the caches are per worker.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+import metrics
+
+REPORT_CACHE_SECONDS = float(os.environ.get('REPORT_CACHE_SECONDS', 30))
+REPORT_CACHE_SIZE = int(os.environ.get('REPORT_CACHE_SIZE', 32))
+REPORT_CACHE_CLOSED_SIZE = int(os.environ.get('REPORT_CACHE_CLOSED_SIZE', 256))
+REPORT_CACHE_CLOSED_BYTES = int(os.environ.get('REPORT_CACHE_CLOSED_BYTES', 64 * 1024 * 1024))
+
+COALESCED = metrics.Counter(
+    'singleflight_coalesced_total', 'Requests that shared another request\'s computation', labels=('endpoint',)
+)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Run fn once per key at a time; concurrent callers with the key share the outcome"""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """Return (result, shared) where shared is True if another caller computed it"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+            return call.result, False
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+def result_size(value):
+    """Approximate memory held by a cached result: its length if bytes, else that of its JSON"""
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    return len(json.dumps(value, default=str))
+
+
+class ResultCache:
+    """Small LRU of results that expire after ttl seconds (never, if ttl is None)
+
+    With max_bytes set, the least recently used results are also evicted to
+    keep their result_size total under it, and a larger result isn't kept.
+    """
+
+    def __init__(self, ttl, size, max_bytes=None):
+        self.ttl = ttl
+        self.size = size
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value, _ = entry
+            if expires is not None and expires < time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def _remove(self, key):
+        self._bytes -= self._entries.pop(key)[2]
+
+    def put(self, key, value):
+        size = result_size(value) if self.max_bytes is not None else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            expires = None if self.ttl is None else time.monotonic() + self.ttl
+            self._entries[key] = (expires, value, size)
+            self._bytes += size
+            while len(self._entries) > self.size or (self.max_bytes is not None and self._bytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+_flight = SingleFlight()
+_cache = ResultCache(REPORT_CACHE_SECONDS, REPORT_CACHE_SIZE)
+_closed_cache = ResultCache(None, REPORT_CACHE_CLOSED_SIZE, REPORT_CACHE_CLOSED_BYTES)
+
+
+def is_closed(end_date):
+    """Whether a range ending on end_date (YYYY-MM-DD) lies wholly before the current month"""
+    # created_at defaults to CURRENT_TIMESTAMP, which is UTC
+    return end_date < datetime.now(timezone.utc).strftime('%Y-%m-01')
+
+
+def cached_report(endpoint, start_date, end_date, range_version, compute, keep_closed=True):
+    """compute() for these report inputs, shared with concurrent callers and cached
+
+    range_version is the data version of start_date..end_date (see
+    InvoiceDatabase.get_range_version). With keep_closed=False a closed
+    range's result expires like an open range's instead of being kept.
+    """
+    key = (endpoint, start_date, end_date, range_version)
+    closed = keep_closed and is_closed(end_date)
+    cache = _closed_cache if closed else _cache
+    result = cache.get(key)
+    metrics.record_cache('closed_report_results' if closed else 'report_results', result is not None)
+    if result is not None:
+        return result
+
+    def compute_and_store():
+        value = compute()
+        if closed or REPORT_CACHE_SECONDS > 0:
+            cache.put(key, value)
+        return value
+
+    result, shared = _flight.do(key, compute_and_store)
+    if shared:
+        COALESCED.inc(endpoint=endpoint)
+    return result
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Tests for render admission control
+
+Runs locally against a throwaway Flask app (no server needed): requests
+beyond the render slots and queue get a 503 with Retry-After, and a
+streamed response holds its slot until the body has been sent.
+"""
+
+import threading
+
+from flask import Flask, Response
+
+import admission
+
+
+class small_controller:
+    """Swap in a one-slot controller for the duration of a test"""
+
+    def __init__(self, queue_size=0, max_wait=0.2):
+        self.controller = admission.AdmissionController(1, {'invoice': 1, 'report': 1}, queue_size, max_wait)
+
+    def __enter__(self):
+        self._previous = admission.controller
+        admission.controller = self.controller
+        return self.controller
+
+    def __exit__(self, *exc_info):
+        admission.controller = self._previous
+
+
+def limited_app(seen_running):
+    app = Flask(__name__)
+
+    @app.route('/invoice')
+    @admission.limit('invoice')
+    def invoice():
+        return {'success': True}
+
+    @app.route('/export')
+    @admission.limit('report')
+    def export():
+        def chunks():
+            for index in range(3):
+                seen_running.append(admission.controller.running['report'])
+                yield f"chunk {index}\n"
+        return Response(chunks(), mimetype='text/plain')
+
+    return app
+
+
+def test_full_pool_returns_503():
+    """With every slot taken, requests are turned away with a Retry-After hint"""
+    client = limited_app([]).test_client()
+
+    with small_controller(queue_size=0) as controller:
+        controller.acquire('invoice')
+        response = client.get('/invoice')
+        assert response.status_code == 503
+        assert response.get_json()['reason'] == 'queue_full'
+        assert int(response.headers['Retry-After']) >= 1
+
+        controller.release('invoice', 1.0)
+        assert client.get('/invoice').status_code == 200
+        assert controller.running == {'invoice': 0, 'report': 0}
+
+    # Room to queue, but the slot isn't freed within ADMISSION_MAX_WAIT
+    with small_controller(queue_size=4, max_wait=0.2) as controller:
+        controller.acquire('report')
+        response = client.get('/invoice')
+        assert response.status_code == 503
+        assert response.get_json()['reason'] == 'timeout'
+        assert int(response.headers['Retry-After']) >= 1
+        assert controller._waiters == []
+        controller.release('report', 1.0)
+
+    # slot() raises instead, for views that build their own response
+    with small_controller(queue_size=0) as controller:
+        controller.acquire('report')
+        try:
+            with admission.slot('report'):
+                raise AssertionError('slot should not have been granted')
+        except admission.Overloaded as e:
+            assert e.reason == 'queue_full' and e.retry_after >= 1
+        controller.release('report', 1.0)
+    print("✅ A full render pool answers 503 with Retry-After")
+
+
+def test_streamed_response_releases_on_close():
+    """A streamed body keeps its slot while being sent and frees it on close"""
+    seen_running = []
+    client = limited_app(seen_running).test_client()
+
+    with small_controller(queue_size=0) as controller:
+        response = client.get('/export', buffered=False)
+        assert response.status_code == 200
+        # The view has returned but the body hasn't been sent yet
+        assert controller.running['report'] == 1
+        assert client.get('/invoice').status_code == 503
+
+        assert response.get_data(as_text=True) == 'chunk 0\nchunk 1\nchunk 2\n'
+        assert seen_running == [1, 1, 1]
+        response.close()
+        assert controller.running['report'] == 0
+        assert client.get('/invoice').status_code == 200
+
+        # A client that disconnects early releases the slot too
+        response = client.get('/export', buffered=False)
+        next(iter(response.response))
+        response.close()
+        assert controller.running['report'] == 0
+
+    # Queued requests are admitted as soon as the streamed slot is released
+    with small_controller(queue_size=4, max_wait=5) as controller:
+        response = client.get('/export', buffered=False)
+        waiting = []
+        thread = threading.Thread(target=lambda: waiting.append(client.get('/invoice').status_code))
+        thread.start()
+        response.get_data()
+        response.close()
+        thread.join()
+        assert waiting == [200]
+        assert controller.running == {'invoice': 0, 'report': 0}
+    print("✅ Streamed responses hold their render slot until closed")
+
+
+if __name__ == "__main__":
+    print("🧪 Testing render admission control...")
+    print("=" * 50)
+    test_full_pool_returns_503()
+    test_streamed_response_releases_on_close()
+    print("=" * 50)
+    print("🎉 Admission testing completed!")
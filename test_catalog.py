@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Tests for the normalised book catalog
+
+Runs locally against throwaway databases (no server needed): loading
+books_database.json-style files into catalog versions with price history,
+and invoice items stored as book ids.
+"""
+
+import json
+import os
+import tempfile
+
+from database import InvoiceDatabase
+
+
+def write_catalog(path, books):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(books, f)
+
+
+def sample_invoice(invoice_number, items):
+    return {
+        'invoice_number': invoice_number,
+        'invoice_type': 'credit',
+        'customer_name': 'CATALOG TEST SCHOOL',
+        'sales_manager': 'Test Manager',
+        'bank_name': 'ZENITH BANK',
+        'account_number': '1229600064',
+        'total_quantity': sum(item['quantity'] for item in items),
+        'gross_total_kobo': 0,
+        'discount_percent': 0,
+        'discount_amount_kobo': 0,
+        'net_total_kobo': 0,
+        'items': items
+    }
+
+
+def test_catalog_versions_and_price_history():
+    with tempfile.TemporaryDirectory() as workdir:
+        database = InvoiceDatabase(os.path.join(workdir, 'catalog.db'))
+        catalog_path = os.path.join(workdir, 'books.json')
+        books = [
+            {'book_code': 'MATH/P1', 'title': 'MATHS BK 1', 'grade': 'Primary 1', 'subject': 'Mathematics', 'price': 2300.0},
+            {'book_code': 'ENG/P1', 'title': 'ENGLISH BK 1', 'grade': 'Primary 1', 'subject': 'English', 'price': 2100.0},
+        ]
+        write_catalog(catalog_path, books)
+
+        first = database.sync_book_catalog(catalog_path)
+        assert database.sync_book_catalog(catalog_path) == first, "unchanged file made a new version"
+
+        books[0]['price'] = 2500.0
+        write_catalog(catalog_path, books)
+        second = database.sync_book_catalog(catalog_path)
+        assert second == first + 1
+
+        conn = database.get_connection()
+        history = conn.execute('''
+            SELECT b.book_code, p.catalog_version, p.price_kobo
+            FROM book_prices p JOIN books b ON b.id = p.book_id
+            ORDER BY b.book_code, p.catalog_version
+        ''').fetchall()
+        book_count = conn.execute('SELECT COUNT(*) FROM books').fetchone()[0]
+        conn.close()
+        assert book_count == 2
+        assert history == [
+            ('ENG/P1', first, 210000), ('MATH/P1', first, 230000), ('MATH/P1', second, 250000)
+        ], history
+        print("✅ Catalog versions record only changed prices")
+
+
+def test_items_reference_books():
+    with tempfile.TemporaryDirectory() as workdir:
+        database = InvoiceDatabase(os.path.join(workdir, 'catalog.db'))
+        catalog_path = os.path.join(workdir, 'books.json')
+        write_catalog(catalog_path, [
+            {'book_code': 'MATH/P1', 'title': 'MATHS BK 1', 'grade': 'Primary 1', 'subject': 'Mathematics', 'price': 2300.0}
+        ])
+        version = database.sync_book_catalog(catalog_path)
+
+        items = [
+            {'book_code': 'MATH/P1', 'title': 'MATHS BK 1', 'grade': 'Primary 1', 'subject': 'Mathematics',
+             'price': 2000.0, 'quantity': 4},
+            # Not in the catalog: gets its own books row
+            {'book_code': 'CUSTOM/1', 'title': 'CUSTOM BOOK', 'price': 500.0, 'quantity': 1},
+        ]
+        database.save_invoice(sample_invoice('HO/IN/CAT1', items))
+        database.save_invoice(sample_invoice('HO/IN/CAT2', items))
+
+        invoice = database.get_invoice_by_number('HO/IN/CAT2')
+        saved = [(item['book_code'], item['book_title'], item['book_grade'], item['rate_kobo'], item['catalog_version'])
+                 for item in invoice['items']]
+        assert saved == [
+            ('MATH/P1', 'MATHS BK 1', 'Primary 1', 200000, version),
+            ('CUSTOM/1', 'CUSTOM BOOK', '', 50000, version),
+        ], saved
+
+        conn = database.get_connection()
+        book_count = conn.execute('SELECT COUNT(*) FROM books').fetchone()[0]
+        conn.close()
+        assert book_count == 2
+        print("✅ Invoice items store book ids and the catalog version")
+
+
+
+def test_book_sales_rollup():
+    """book_sales_daily matches the line items, without discounted copies"""
+    with tempfile.TemporaryDirectory() as workdir:
+        database = InvoiceDatabase(os.path.join(workdir, 'catalog.db'))
+        maths = {'book_code': 'MATH/P1', 'title': 'MATHS BK 1', 'grade': 'Primary 1', 'subject': 'Mathematics', 'price': 1000.0}
+        english = {'book_code': 'ENG/P1', 'title': 'ENGLISH BK 1', 'grade': 'Primary 1', 'subject': 'English', 'price': 333.33}
+
+        first = sample_invoice('HO/IN/S1', [dict(maths, quantity=3), dict(english, quantity=1)])
+        first['discount_percent'] = 10.0
+        first_id = database.save_invoice(first)
+        second = sample_invoice('HO/IN/S2', [dict(maths, quantity=2)])
+        second['sales_manager'] = 'Other Manager'
+        database.save_invoice(second)
+        database.create_discounted_invoice(first_id)
+
+        books = database.get_book_sales('2000-01-01', '2100-01-01')
+        totals = [(book['book_code'], book['quantity'], book['gross_revenue_kobo'], book['net_revenue_kobo'])
+                  for book in books]
+        assert totals == [('MATH/P1', 5, 500000, 470000), ('ENG/P1', 1, 33333, 30000)], totals
+
+        mine = database.get_book_sales('2000-01-01', '2100-01-01', sales_manager='Other Manager')
+        assert [(book['book_code'], book['quantity']) for book in mine] == [('MATH/P1', 2)]
+
+        by_manager = database.get_book_sales('2000-01-01', '2100-01-01', by_sales_manager=True)
+        assert sorted((book['book_code'], book['sales_manager'], book['quantity']) for book in by_manager) == [
+            ('ENG/P1', 'Test Manager', 1), ('MATH/P1', 'Other Manager', 2), ('MATH/P1', 'Test Manager', 3)
+        ]
+
+        # Deleting line items takes them back out of the rollup
+        conn = database.get_connection()
+        conn.execute('DELETE FROM invoice_items WHERE invoice_id = ?', (first_id,))
+        conn.commit()
+        conn.close()
+        books = database.get_book_sales('2000-01-01', '2100-01-01')
+        assert [(book['book_code'], book['quantity']) for book in books] == [('MATH/P1', 2)]
+        print("✅ Per-book daily rollup tracks inserts and deletes")
+
+
+if __name__ == "__main__":
+    print("🧪 Testing the book catalog...")
+    print("=" * 50)
+    test_catalog_versions_and_price_history()
+    test_items_reference_books()
+    test_book_sales_rollup()
+    print("=" * 50)
+    print("🎉 Catalog testing completed!")
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Tests for gzip / brotli response compression
+
+Runs locally against a throwaway Flask app (no server needed): encoding
+negotiation from Accept-Encoding, whole and streamed bodies, and the bodies
+that are left alone (PDFs, small responses, clients that don't ask).
+"""
+
+import gzip
+import json
+
+from flask import Flask, Response, jsonify
+
+import compression
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+PDF_BODY = b'%PDF-1.4\n' + b'0' * (compression.COMPRESS_MIN_SIZE * 4)
+
+
+def compressed_app():
+    app = Flask(__name__)
+    compression.init_app(app)
+
+    @app.route('/json')
+    def large_json():
+        return jsonify([{'invoice_number': f"HO/IN/C{index}", 'net_total_kobo': index} for index in range(500)])
+
+    @app.route('/small')
+    def small_json():
+        return jsonify({'status': 'ok'})
+
+    @app.route('/csv')
+    def streamed_csv():
+        return Response((f"HO/IN/C{index},{index}\n" for index in range(2000)), mimetype='text/csv')
+
+    @app.route('/pdf')
+    def pdf():
+        return Response(PDF_BODY, mimetype='application/pdf')
+
+    return app
+
+
+def test_negotiation():
+    assert compression.accepted_encodings('gzip, deflate, br;q=0.5') == {'gzip', 'deflate', 'br'}
+    assert compression.accepted_encodings('br;q=0, gzip') == {'gzip'}
+    assert compression.choose_encoding('gzip, br') == ('br' if brotli else 'gzip')
+    assert compression.choose_encoding('br;q=0, gzip;q=0.8') == 'gzip'
+    assert compression.choose_encoding('*') == 'gzip'
+    assert compression.choose_encoding('identity') is None
+    assert compression.choose_encoding(None) is None
+
+    # Without the optional brotli package a br-first client gets gzip
+    installed = compression.brotli
+    compression.brotli = None
+    try:
+        assert compression.choose_encoding('br, gzip') == 'gzip'
+        assert compression.choose_encoding('br') is None
+    finally:
+        compression.brotli = installed
+    print("✅ Accept-Encoding negotiated to br, gzip or nothing")
+
+
+def test_compressed_responses():
+    client = compressed_app().test_client()
+
+    response = client.get('/json', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    rows = json.loads(gzip.decompress(response.data))
+    assert len(rows) == 500 and rows[-1]['invoice_number'] == 'HO/IN/C499'
+
+    if brotli is not None:
+        response = client.get('/json', headers={'Accept-Encoding': 'gzip, br'})
+        assert response.headers['Content-Encoding'] == 'br'
+        assert json.loads(brotli.decompress(response.data))[0]['invoice_number'] == 'HO/IN/C0'
+
+    # Streamed bodies are compressed chunk by chunk, with no Content-Length
+    response = client.get('/csv', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Content-Length' not in response.headers
+    lines = gzip.decompress(response.data).decode('utf-8').splitlines()
+    assert len(lines) == 2000 and lines[-1] == 'HO/IN/C1999,1999'
+    print("✅ JSON and streamed CSV compressed with the negotiated encoding")
+
+
+def test_skipped_responses():
+    client = compressed_app().test_client()
+
+    # Already-compressed formats pass through untouched
+    response = client.get('/pdf', headers={'Accept-Encoding': 'gzip, br'})
+    assert 'Content-Encoding' not in response.headers
+    assert response.data == PDF_BODY
+
+    # Bodies under COMPRESS_MIN_SIZE aren't worth the CPU
+    response = client.get('/small', headers={'Accept-Encoding': 'gzip, br'})
+    assert 'Content-Encoding' not in response.headers
+    assert response.get_json() == {'status': 'ok'}
+
+    # Clients that don't ask get the identity body, marked as varying
+    response = client.get('/json')
+    assert 'Content-Encoding' not in response.headers
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert len(response.get_json()) == 500
+
+    response = client.head('/json', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+    print("✅ PDFs, small bodies and HEAD requests are sent uncompressed")
+
+
+if __name__ == "__main__":
+    print("🧪 Testing response compression...")
+    print("=" * 50)
+    test_negotiation()
+    test_compressed_responses()
+    test_skipped_responses()
+    print("=" * 50)
+    print("🎉 Compression testing completed!")
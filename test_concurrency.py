@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+Concurrency test for InvoiceDatabase writes under threaded and multi-process serving
+
+Runs locally against a throwaway database (no server needed) and checks that
+concurrent save_invoice calls from many threads and processes all succeed
+without 'database is locked' errors.
+"""
+
+import multiprocessing
+import os
+import tempfile
+import threading
+
+import metrics
+from database import InvoiceDatabase
+
+THREADS = 8
+PROCESSES = 4
+INVOICES_PER_WORKER = 25
+
+
+def sample_invoice(invoice_number):
+    return {
+        'invoice_number': invoice_number,
+        'invoice_type': 'credit',
+        'customer_name': 'CONCURRENCY TEST SCHOOL',
+        'customer_phone': '08012345678',
+        'customer_address': 'Test Address',
+        'sales_manager': 'Test Manager',
+        'bank_name': 'ZENITH BANK',
+        'account_number': '1229600064',
+        'total_quantity': 5,
+        'gross_total_kobo': 500000,
+        'discount_percent': 10.0,
+        'discount_amount_kobo': 50000,
+        'net_total_kobo': 450000,
+        'items': [
+            {'book_code': f"TEST{line}", 'title': f"Test Book {line}", 'price': 1000.0, 'quantity': 1}
+            for line in range(5)
+        ]
+    }
+
+
+def save_invoices(db_path, prefix, errors):
+    """Save INVOICES_PER_WORKER invoices, collecting any exception messages"""
+    database = InvoiceDatabase(db_path)
+    for index in range(INVOICES_PER_WORKER):
+        try:
+            database.save_invoice(sample_invoice(f"HO/IN/{prefix}-{index}"))
+        except Exception as e:
+            errors.append(f"{prefix}-{index}: {e}")
+
+
+def _process_worker(db_path, prefix, error_queue):
+    errors = []
+    save_invoices(db_path, prefix, errors)
+    error_queue.put(errors)
+
+
+def count_rows(database, table):
+    conn = database.get_connection()
+    count = conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+    conn.close()
+    return count
+
+
+def test_threaded_writes():
+    """Many threads of one worker saving invoices at once"""
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, 'concurrency.db')
+        database = InvoiceDatabase(db_path)
+        errors = []
+
+        # Readers run alongside the writers, as report requests would
+        stop = threading.Event()
+
+        def read_summaries():
+            while not stop.is_set():
+                try:
+                    database.get_invoice_summary('2000-01-01', '2100-01-01')
+                except Exception as e:
+                    errors.append(f"reader: {e}")
+
+        reader = threading.Thread(target=read_summaries)
+        reader.start()
+        writers = [
+            threading.Thread(target=save_invoices, args=(db_path, f"T{worker}", errors))
+            for worker in range(THREADS)
+        ]
+        for thread in writers:
+            thread.start()
+        for thread in writers:
+            thread.join()
+        stop.set()
+        reader.join()
+
+        assert errors == [], errors
+        assert count_rows(database, 'invoices') == THREADS * INVOICES_PER_WORKER
+        assert count_rows(database, 'invoice_items') == THREADS * INVOICES_PER_WORKER * 5
+        print(f"✅ {THREADS} threads saved {THREADS * INVOICES_PER_WORKER} invoices without lock errors")
+
+
+def test_multiprocess_writes():
+    """Several worker processes saving invoices at once"""
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, 'concurrency.db')
+        database = InvoiceDatabase(db_path)
+
+        context = multiprocessing.get_context('spawn')
+        error_queue = context.Queue()
+        processes = [
+            context.Process(target=_process_worker, args=(db_path, f"P{worker}", error_queue))
+            for worker in range(PROCESSES)
+        ]
+        for process in processes:
+            process.start()
+        errors = []
+        for _ in processes:
+            errors.extend(error_queue.get(timeout=120))
+        for process in processes:
+            process.join()
+
+        assert errors == [], errors
+        assert count_rows(database, 'invoices') == PROCESSES * INVOICES_PER_WORKER
+        print(f"✅ {PROCESSES} processes saved {PROCESSES * INVOICES_PER_WORKER} invoices without lock errors")
+
+
+def test_writes_during_long_read():
+    """A slow report read in another worker must not block invoice saves"""
+    import sqlite3
+    import time
+
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, 'concurrency.db')
+        database = InvoiceDatabase(db_path)
+        database.save_invoice(sample_invoice("HO/IN/SEED"))
+
+        # Hold a read transaction open longer than sqlite3's default 5s timeout
+        reader = sqlite3.connect(db_path)
+        reader.execute('BEGIN')
+        reader.execute('SELECT * FROM invoices').fetchall()
+
+        errors = []
+        started = time.monotonic()
+        writer = threading.Thread(target=save_invoices, args=(db_path, "LONGREAD", errors))
+        writer.start()
+        writer.join(timeout=6)
+        finished_while_reading = not writer.is_alive()
+        reader.rollback()
+        reader.close()
+        writer.join()
+
+        assert errors == [], errors
+        assert finished_while_reading, "writes waited for the reader to finish"
+        print(f"✅ Writes completed in {time.monotonic() - started:.2f}s while a read transaction was open")
+
+
+def test_background_report_reads():
+    """Report rows stream from a background thread on pooled read-only connections"""
+    import sqlite3
+    import time
+
+    with tempfile.TemporaryDirectory() as workdir:
+        database = InvoiceDatabase(os.path.join(workdir, 'concurrency.db'))
+        for index in range(30):
+            database.save_invoice(sample_invoice(f"HO/IN/READ{index}"))
+
+        summary = database.get_invoice_summary('2000-01-01', '2100-01-01')
+        assert (summary['total_invoices'], summary['by_type'][0]['count']) == (30, 30)
+
+        headers = list(database.iter_invoice_headers('2000-01-01', '2100-01-01'))
+        streamed = list(database.stream_in_background(
+            lambda conn: database.invoice_header_rows(conn, '2000-01-01', '2100-01-01'), chunk_size=4
+        ))
+        assert streamed == headers
+
+        # Abandoning a stream part way stops its producer and frees the connection
+        rows = database.stream_in_background(
+            lambda conn: database.invoice_header_rows(conn, '2000-01-01', '2100-01-01'), chunk_size=1
+        )
+        next(rows)
+        rows.close()
+        assert list(rows) == []
+
+        # A stream whose producer fails, even before it has a connection, raises instead of hanging
+        def unopenable():
+            raise sqlite3.OperationalError("unable to open database file")
+
+        # A fresh instance, so there is no idle pooled connection to borrow instead
+        broken = InvoiceDatabase(database.db_path)
+        broken.get_read_connection = unopenable
+        started = time.monotonic()
+        try:
+            list(broken.stream_in_background(lambda conn: broken.invoice_header_rows(conn, '2000-01-01', '2100-01-01')))
+            assert False, "a failed stream ended quietly"
+        except sqlite3.OperationalError:
+            pass
+        assert time.monotonic() - started < 5
+
+        try:
+            with database.read_connection() as conn:
+                conn.execute("DELETE FROM invoices")
+            assert False, "a report connection wrote to the database"
+        except sqlite3.OperationalError:
+            pass
+        assert count_rows(database, 'invoices') == 30
+        print("✅ Report rows stream in the background through read-only connections")
+
+
+def test_idempotency_lease():
+    """A pending key whose lease ran out is taken over by the next claim"""
+    with tempfile.TemporaryDirectory() as workdir:
+        database = InvoiceDatabase(os.path.join(workdir, 'concurrency.db'))
+        assert database.claim_idempotency_key('live', 'hash', 3600, 150) is None
+        assert database.claim_idempotency_key('live', 'hash', 3600, 150)['status'] == 'pending'
+
+        # Claimed by a request whose worker died: its lease is already over
+        assert database.claim_idempotency_key('dead', 'hash', 3600, -1) is None
+        assert database.claim_idempotency_key('dead', 'hash', 3600, 150) is None
+        assert database.claim_idempotency_key('dead', 'hash', 3600, 150)['status'] == 'pending'
+
+        # A completed key is replayed, however old its lease
+        assert database.claim_idempotency_key('done', 'hash', 3600, -1) is None
+        database.complete_idempotency_key('done', 'HO/IN/LEASE', b'%PDF')
+        assert database.claim_idempotency_key('done', 'hash', 3600, 150)['invoice_number'] == 'HO/IN/LEASE'
+    print("✅ Pending idempotency keys are only held for their lease")
+
+
+def _metrics_worker(pdfs):
+    metrics.after_fork()
+    metrics.PDFS_RENDERED.inc(pdfs, kind='metrics-test')
+    metrics.REQUESTS_IN_FLIGHT.inc()
+    metrics.flush()
+
+
+def test_metrics_across_workers():
+    """/metrics sums every worker's series, and keeps exited workers' counters"""
+    with tempfile.TemporaryDirectory() as metrics_dir:
+        metrics.METRICS_DIR = metrics_dir
+        try:
+            workers = [multiprocessing.Process(target=_metrics_worker, args=(pdfs,)) for pdfs in (2, 3)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            metrics.PDFS_RENDERED.inc(kind='metrics-test')
+
+            lines = metrics.render_latest().splitlines()
+            assert 'pdf_rendered_total{kind="metrics-test"} 6' in lines, lines
+            assert 'http_requests_in_flight 2' in lines, lines
+
+            metrics.mark_process_dead(workers[0].pid)
+            lines = metrics.render_latest().splitlines()
+            assert 'pdf_rendered_total{kind="metrics-test"} 6' in lines, lines
+            assert 'http_requests_in_flight 1' in lines, lines
+        finally:
+            metrics.METRICS_DIR = None
+    print("✅ Metrics are summed across worker processes")
+
+
+if __name__ == "__main__":
+    print("🧪 Testing concurrent database writes...")
+    print("=" * 50)
+
+    print("\n1. Threaded writers...")
+    test_threaded_writes()
+
+    print("\n2. Multi-process writers...")
+    test_multiprocess_writes()
+
+    print("\n3. Writers during a long read...")
+    test_writes_during_long_read()
+
+    print("\n4. Background report reads...")
+    test_background_report_reads()
+
+    print("\n5. Idempotency key leases...")
+    test_idempotency_lease()
+
+    print("\n6. Metrics across workers...")
+    test_metrics_across_workers()
+
+    print("\n" + "=" * 50)
+    print("🎉 Concurrency testing completed!")
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Tests for Idempotency-Key handling on /api/generate-invoice
+
+Runs locally through Flask's test client against a throwaway database (no
+server needed): a retried request is replayed with the first request's
+invoice number and PDF, a key reused for a different body is refused, and
+a duplicate sent while the first request is still rendering waits for it
+instead of creating a second invoice.
+"""
+
+import os
+import tempfile
+import threading
+import time
+
+import app
+from database import InvoiceDatabase
+
+
+def invoice_request(customer_name='IDEMPOTENCY TEST SCHOOL', quantity=3):
+    return {
+        'invoice_type': 'credit',
+        'customer_name': customer_name,
+        'customer_phone': '08012345678',
+        'customer_address': 'Test Address',
+        'sales_manager': 'Test Manager',
+        'bank_name': 'ZENITH BANK',
+        'account_number': '1229600064',
+        'discount_percent': 10,
+        'items': [{'book_code': 'MATH/P1', 'title': 'MATHS BK 1', 'grade': 'Primary 1',
+                   'subject': 'Maths', 'price': 1500, 'quantity': quantity}]
+    }
+
+
+class throwaway_database:
+    """Point the app at a fresh database for the duration of a test"""
+
+    def __enter__(self):
+        self._workdir = tempfile.TemporaryDirectory()
+        self._previous = app.db
+        app.db = InvoiceDatabase(os.path.join(self._workdir.name, 'idempotency.db'))
+        return app.db
+
+    def __exit__(self, *exc_info):
+        app.db = self._previous
+        self._workdir.cleanup()
+
+
+def invoice_count(database):
+    conn = database.get_connection()
+    count = conn.execute('SELECT COUNT(*) FROM invoices').fetchone()[0]
+    conn.close()
+    return count
+
+
+def test_replay_and_mismatch():
+    """A retry replays the first result; the same key with another body is refused"""
+    with throwaway_database() as database:
+        client = app.app.test_client()
+        headers = {'Idempotency-Key': 'replay-key'}
+
+        first = client.post('/api/generate-invoice', json=invoice_request(), headers=headers)
+        assert first.status_code == 200, first.get_json()
+        assert 'Idempotent-Replayed' not in first.headers
+
+        retry = client.post('/api/generate-invoice', json=invoice_request(), headers=headers)
+        assert retry.status_code == 200
+        assert retry.headers['Idempotent-Replayed'] == 'true'
+        assert retry.get_json()['invoice_number'] == first.get_json()['invoice_number']
+        assert retry.get_json()['pdf_data'] == first.get_json()['pdf_data']
+
+        changed = client.post('/api/generate-invoice', json=invoice_request(quantity=4), headers=headers)
+        assert changed.status_code == 422
+        assert 'different request' in changed.get_json()['error']
+
+        assert invoice_count(database) == 1
+    print("✅ Retries replay the first invoice; a reused key with a new body gets 422")
+
+
+def test_concurrent_duplicate():
+    """A duplicate arriving mid-render waits for the first request and replays it"""
+    with throwaway_database() as database:
+        rendering = threading.Event()
+        create_invoice_pdf = app.create_invoice_pdf
+
+        def slow_create_invoice_pdf(data, invoice_number):
+            rendering.set()
+            time.sleep(1)
+            return create_invoice_pdf(data, invoice_number)
+
+        responses = {}
+
+        def post(name):
+            responses[name] = app.app.test_client().post(
+                '/api/generate-invoice', json=invoice_request(), headers={'Idempotency-Key': 'concurrent-key'}
+            )
+
+        app.create_invoice_pdf = slow_create_invoice_pdf
+        try:
+            first = threading.Thread(target=post, args=('first',))
+            first.start()
+            assert rendering.wait(10)
+            # The first request holds the key and is still rendering
+            duplicate = threading.Thread(target=post, args=('duplicate',))
+            duplicate.start()
+            first.join()
+            duplicate.join()
+        finally:
+            app.create_invoice_pdf = create_invoice_pdf
+
+        assert responses['first'].status_code == 200, responses['first'].get_json()
+        assert responses['duplicate'].status_code in (200, 409), responses['duplicate'].get_json()
+        if responses['duplicate'].status_code == 200:
+            assert responses['duplicate'].headers['Idempotent-Replayed'] == 'true'
+            assert responses['duplicate'].get_json()['invoice_number'] == responses['first'].get_json()['invoice_number']
+        assert invoice_count(database) == 1
+    print("✅ A concurrent duplicate waits for the first request, with one invoice created")
+
+
+if __name__ == "__main__":
+    print("🧪 Testing idempotent invoice generation...")
+    print("=" * 50)
+    test_replay_and_mismatch()
+    test_concurrent_duplicate()
+    print("=" * 50)
+    print("🎉 Idempotency testing completed!")
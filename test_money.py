@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Tests for integer-kobo money storage
+
+Runs locally against throwaway databases (no server needed): kobo rounding
+and totals, exact summary aggregates, and the migration of a database whose
+money columns are still REAL naira.
+"""
+
+import os
+import sqlite3
+import tempfile
+
+import money
+from database import InvoiceDatabase
+
+
+def invoice_with_items(invoice_number, items, discount_percent=10.0):
+    total_quantity, gross_kobo, discount_kobo, net_kobo = money.invoice_totals(items, discount_percent)
+    return {
+        'invoice_number': invoice_number,
+        'invoice_type': 'credit',
+        'customer_name': 'MONEY TEST SCHOOL',
+        'sales_manager': 'Test Manager',
+        'bank_name': 'ZENITH BANK',
+        'account_number': '1229600064',
+        'total_quantity': total_quantity,
+        'gross_total_kobo': gross_kobo,
+        'discount_percent': discount_percent,
+        'discount_amount_kobo': discount_kobo,
+        'net_total_kobo': net_kobo,
+        'items': items
+    }
+
+
+def test_kobo_arithmetic():
+    assert money.to_kobo(0.1) == 10
+    assert money.to_kobo('1500.005') == 150001
+    assert money.to_kobo(0.285) == 29
+    assert money.percent_of(12345, 10) == 1235
+    assert money.format_naira(123456789) == "N1,234,567.89"
+    assert money.format_naira(None) == "N0.00"
+    assert money.as_naira({'net_total_kobo': 450050, 'items': [{'rate_kobo': 5}]}) == {
+        'net_total': 4500.5, 'items': [{'rate': 0.05}]
+    }
+
+    items = [{'price': 0.1, 'quantity': 3}, {'price': 0.2, 'quantity': 1}]
+    assert money.invoice_totals(items, 15) == (4, 50, 8, 42)
+    print("✅ Kobo conversion, rounding and totals are exact")
+
+
+def test_summary_is_exact():
+    """Sums of many 0.1 naira amounts drift as REAL but not as kobo"""
+    with tempfile.TemporaryDirectory() as workdir:
+        database = InvoiceDatabase(os.path.join(workdir, 'money.db'))
+        for index in range(1000):
+            database.save_invoice(invoice_with_items(
+                f"HO/IN/M{index}", [{'book_code': 'B', 'title': 'Book', 'price': 0.1, 'quantity': 1}], 0
+            ))
+        summary = database.get_invoice_summary('2000-01-01', '2100-01-01')
+        assert summary['total_gross_kobo'] == 10000
+        assert summary['total_net_kobo'] == 10000
+        assert summary['by_type'][0]['total_amount_kobo'] == 10000
+        print("✅ 1000 x N0.10 sums to exactly N100.00")
+
+
+def test_migrates_real_columns():
+    """A database from before the kobo columns is converted in place"""
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, 'legacy.db')
+        conn = sqlite3.connect(db_path)
+        conn.execute('''
+            CREATE TABLE invoices (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, invoice_number TEXT UNIQUE NOT NULL,
+                invoice_type TEXT NOT NULL, customer_name TEXT NOT NULL, customer_phone TEXT,
+                customer_address TEXT, sales_manager TEXT NOT NULL, bank_name TEXT NOT NULL,
+                account_number TEXT NOT NULL, total_quantity INTEGER NOT NULL,
+                gross_total REAL NOT NULL, discount_percent REAL NOT NULL,
+                discount_amount REAL NOT NULL, net_total REAL NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE invoice_items (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, invoice_id INTEGER NOT NULL,
+                book_code TEXT NOT NULL, book_title TEXT NOT NULL, book_grade TEXT, book_subject TEXT,
+                rate REAL NOT NULL, quantity INTEGER NOT NULL, gross_amount REAL NOT NULL
+            )
+        ''')
+        conn.execute('''
+            INSERT INTO invoices (invoice_number, invoice_type, customer_name, sales_manager, bank_name,
+                                  account_number, total_quantity, gross_total, discount_percent,
+                                  discount_amount, net_total)
+            VALUES ('HO/IN/OLD', 'credit', 'OLD SCHOOL', 'Manager', 'ZENITH BANK', '1229600064',
+                    3, 4501.5, 10.0, 450.15, 4051.35)
+        ''')
+        conn.execute('''
+            INSERT INTO invoice_items (invoice_id, book_code, book_title, rate, quantity, gross_amount)
+            VALUES (1, 'B', 'Book', 1500.5, 3, 4501.5)
+        ''')
+        conn.commit()
+        conn.close()
+
+        database = InvoiceDatabase(db_path)
+        invoice = database.get_invoice_by_number('HO/IN/OLD')
+        assert 'net_total' not in invoice
+        assert (invoice['gross_total_kobo'], invoice['discount_amount_kobo'], invoice['net_total_kobo']) == (
+            450150, 45015, 405135
+        )
+        assert (invoice['items'][0]['rate_kobo'], invoice['items'][0]['gross_amount_kobo']) == (150050, 450150)
+        assert (invoice['items'][0]['book_title'], invoice['items'][0]['book_grade']) == ('Book', '')
+
+        # Opening it again finds nothing left to migrate
+        InvoiceDatabase(db_path)
+        print("✅ REAL naira columns migrated to integer kobo")
+
+
+if __name__ == "__main__":
+    print("🧪 Testing integer-kobo money...")
+    print("=" * 50)
+    test_kobo_arithmetic()
+    test_summary_is_exact()
+    test_migrates_real_columns()
+    print("=" * 50)
+    print("🎉 Money testing completed!")
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Tests for report and invoice PDFs
+
+Runs locally (no server needed) and reads the generated PDFs back with
+PyMuPDF: the report's detailed invoice table streamed in chunks over
+several pages, and discounted copies stamped from the original's PDF.
+"""
+
+import fitz  # PyMuPDF
+
+import app
+import invoice_stamp
+
+
+def report_invoices(count):
+    """Invoice header rows as the report streams them, yielded one at a time"""
+    for index in range(count):
+        yield {
+            'invoice_number': f"HO/IN/P{index:04d}",
+            'created_at': '2025-03-01 10:00:00',
+            'customer_name': f"PDF TEST SCHOOL {index}",
+            'invoice_type': 'credit',
+            'net_total_kobo': 1234500 + index,
+        }
+
+
+def test_streamed_report_pdf():
+    """Many invoices come out as several LongTable chunks across pages, every row kept"""
+    count = app.REPORT_ROWS_PER_CHUNK * 4 + 7
+    summary = {'total_invoices': count, 'total_quantity': count, 'total_gross_kobo': 0,
+               'total_discount_kobo': 0, 'total_net_kobo': 0, 'average_net_kobo': 0,
+               'net_percentiles': {'p50_kobo': 0, 'p90_kobo': 0, 'p99_kobo': 0},
+               'by_type': [], 'top_customers': []}
+    pdf_bytes = app.create_report_pdf(summary, report_invoices(count), '2025-03-01', '2025-03-31').getvalue()
+
+    with fitz.open(stream=pdf_bytes, filetype='pdf') as document:
+        pages = document.page_count
+        text = ''.join(page.get_text() for page in document)
+    assert pages > 1, pages
+    assert text.count('HO/IN/P') == count
+    assert 'HO/IN/P0000' in text and f"HO/IN/P{count - 1:04d}" in text
+    # The header row repeats on every page the table runs over
+    assert text.count('Invoice #') >= 2
+    print(f"✅ {count} invoices streamed into a {pages}-page report PDF")
+
+
+def stored_invoice(invoice_number, discount_percent):
+    """An invoice record as get_invoice_by_number returns it"""
+    items = [
+        {'book_code': 'ENG1', 'book_title': 'English Reader', 'book_grade': 'Primary 1',
+         'book_subject': 'English', 'rate_kobo': 250000, 'quantity': 12},
+        {'book_code': 'MTH1', 'book_title': 'Mathematics', 'book_grade': 'Primary 1',
+         'book_subject': 'Maths', 'rate_kobo': 312550, 'quantity': 7},
+    ]
+    return {
+        'invoice_number': invoice_number,
+        'invoice_type': 'credit',
+        'customer_name': 'STAMP TEST SCHOOL',
+        'customer_phone': '08000000000',
+        'customer_address': 'Lagos',
+        'sales_manager': 'Test Manager',
+        'bank_name': 'ZENITH BANK',
+        'account_number': '1229600064',
+        'discount_percent': discount_percent,
+        'gross_total_kobo': sum(item['rate_kobo'] * item['quantity'] for item in items),
+        'items': items,
+    }
+
+
+def pdf_text(pdf_bytes):
+    with fitz.open(stream=pdf_bytes, filetype='pdf') as document:
+        return ''.join(page.get_text() for page in document)
+
+
+def test_stamped_discounted_invoice():
+    """The stamped copy carries the new number, discount label, net total and amount in words"""
+    original = stored_invoice('HO/IN/S0001', 10.0)
+    discounted = {'invoice_number': 'HO/IN/S0002', 'discount_percent': 15.0}
+    gross_kobo = original['gross_total_kobo']
+
+    rendered = []
+    create_invoice_pdf = app.create_invoice_pdf
+    app.create_invoice_pdf = lambda data, number: rendered.append(number) or create_invoice_pdf(data, number)
+    try:
+        pdf_bytes = app.create_discounted_invoice_pdf(original, discounted)
+    finally:
+        app.create_invoice_pdf = create_invoice_pdf
+    # Only the original was rendered; the copy was stamped from it
+    assert rendered == ['HO/IN/S0001'], rendered
+
+    expected = app.invoice_totals_text('HO/IN/S0002', gross_kobo, 15.0)
+    text = pdf_text(pdf_bytes)
+    for key in ('invoice_number', 'discount_label', 'net_total', 'net_payable'):
+        assert expected[key] in text, (key, expected[key])
+    words = ' '.join(text.split())
+    assert ' '.join(expected['amount_words'].split()) in words
+    assert 'HO/IN/S0001' not in text
+    assert 'LESS DISCOUNT 10.0%' not in text
+    print("✅ Discounted copy stamped with the new number, discount and totals")
+
+
+def test_unmatched_layout_falls_back():
+    """An original without discount rows can't be stamped and is rendered in full"""
+    original = stored_invoice('HO/IN/S0003', 0)
+    discounted = {'invoice_number': 'HO/IN/S0004', 'discount_percent': 5.0}
+    gross_kobo = original['gross_total_kobo']
+
+    original_pdf = app.create_invoice_pdf(app.invoice_record_to_pdf_data(original), 'HO/IN/S0003').getvalue()
+    assert invoice_stamp.stamp_invoice_text(
+        original_pdf,
+        app.invoice_totals_text('HO/IN/S0003', gross_kobo, 0),
+        app.invoice_totals_text('HO/IN/S0004', gross_kobo, 5.0)
+    ) is None
+
+    rendered = []
+    create_invoice_pdf = app.create_invoice_pdf
+    app.create_invoice_pdf = lambda data, number: rendered.append(number) or create_invoice_pdf(data, number)
+    try:
+        pdf_bytes = app.create_discounted_invoice_pdf(original, discounted)
+    finally:
+        app.create_invoice_pdf = create_invoice_pdf
+    assert rendered == ['HO/IN/S0004'], rendered
+
+    text = pdf_text(pdf_bytes)
+    assert app.invoice_totals_text('HO/IN/S0004', gross_kobo, 5.0)['discount_label'] in text
+    print("✅ Unstampable original falls back to a full render")
+
+
+if __name__ == "__main__":
+    print("🧪 Testing PDFs...")
+    print("=" * 50)
+    test_streamed_report_pdf()
+    test_stamped_discounted_invoice()
+    test_unmatched_layout_falls_back()
+    print("=" * 50)
+    print("🎉 PDF testing completed!")
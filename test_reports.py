@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""
+Tests for the report rollups and time series
+
+Runs locally against throwaway databases (no server needed): calendar
+buckets, the sales manager and invoice type counters kept by triggers on
+invoices, the vectorised summary, the per-day versions behind the report
+cache, the date-range queries' use of idx_invoices_date, and the XLSX
+export's summary sheet.
+"""
+
+import io
+import os
+import sqlite3
+import tempfile
+
+from openpyxl import load_workbook
+
+import analytics
+import money
+import query_log
+import singleflight
+import timeseries
+from database import InvoiceDatabase
+
+
+def manager_invoice(invoice_number, customer_name, sales_manager, price, quantity, discount_percent=0):
+    items = [{'book_code': 'MATH/P1', 'title': 'MATHS BK 1', 'price': price, 'quantity': quantity}]
+    total_quantity, gross_kobo, discount_kobo, net_kobo = money.invoice_totals(items, discount_percent)
+    return {
+        'invoice_number': invoice_number,
+        'invoice_type': 'credit',
+        'customer_name': customer_name,
+        'sales_manager': sales_manager,
+        'bank_name': 'ZENITH BANK',
+        'account_number': '1229600064',
+        'total_quantity': total_quantity,
+        'gross_total_kobo': gross_kobo,
+        'discount_percent': discount_percent,
+        'discount_amount_kobo': discount_kobo,
+        'net_total_kobo': net_kobo,
+        'items': items
+    }
+
+
+def test_periods():
+    assert timeseries.periods('2025-01-30', '2025-02-02', 'day') == [
+        '2025-01-30', '2025-01-31', '2025-02-01', '2025-02-02'
+    ]
+    # 2025-01-01 is a Wednesday, so the first week starts on the Monday before
+    assert timeseries.periods('2025-01-01', '2025-01-13', 'week') == ['2024-12-30', '2025-01-06', '2025-01-13']
+    assert timeseries.periods('2025-01-31', '2025-03-01', 'month') == ['2025-01-01', '2025-02-01', '2025-03-01']
+
+    rows = [{'period': '2025-01-06', 'count': 4}]
+    assert timeseries.zero_fill(rows, '2025-01-01', '2025-01-13', 'week', ['count']) == [
+        {'period': '2024-12-30', 'count': 0}, {'period': '2025-01-06', 'count': 4}, {'period': '2025-01-13', 'count': 0}
+    ]
+    print("✅ Day, week and month periods line up and zero-fill")
+
+
+def test_sales_manager_counters():
+    """Leaderboard, series and acquired schools follow inserts and deletes"""
+    with tempfile.TemporaryDirectory() as workdir:
+        db_path = os.path.join(workdir, 'reports.db')
+        database = InvoiceDatabase(db_path)
+        first_id = database.save_invoice(manager_invoice('HO/IN/R1', 'ALPHA SCHOOL', 'ADA', 1000, 3, 10.0))
+        database.save_invoice(manager_invoice('HO/IN/R2', 'ALPHA SCHOOL', 'BAYO', 1000, 1))
+        database.save_invoice(manager_invoice('HO/IN/R3', 'BETA SCHOOL', 'BAYO', 500, 2))
+        database.save_invoice(manager_invoice('HO/IN/R4', 'Floating Stock', 'BAYO', 500, 1))
+        database.create_discounted_invoice(first_id)
+
+        conn = database.get_connection()
+        today = conn.execute('SELECT DATE(created_at) FROM invoices WHERE id = ?', (first_id,)).fetchone()[0]
+        conn.close()
+
+        performance = database.get_sales_manager_performance(today, today)
+        leaderboard = [(row['rank'], row['sales_manager'], row['invoice_count'], row['quantity'],
+                        row['net_revenue_kobo'], row['new_schools']) for row in performance['leaderboard']]
+        assert leaderboard == [(1, 'ADA', 1, 3, 270000, 1), (2, 'BAYO', 3, 4, 250000, 1)], leaderboard
+        assert [point['period'] for point in performance['series']['BAYO']] == [today]
+
+        month = database.get_sales_manager_performance(today[:8] + '01', today, 'month', 'BAYO')
+        assert list(month['series']) == ['BAYO']
+        assert month['series']['BAYO'][0]['invoice_count'] == 3
+
+        # Deleting ALPHA SCHOOL's first invoice hands its acquisition to BAYO's invoice
+        conn = database.get_connection()
+        conn.execute('DELETE FROM invoices WHERE id = ?', (first_id,))
+        conn.commit()
+        conn.close()
+        performance = database.get_sales_manager_performance(today, today)
+        assert [(row['sales_manager'], row['new_schools']) for row in performance['leaderboard']] == [('BAYO', 2)]
+
+        # A freshly built table from the backfill agrees with the trigger-maintained one
+        conn = database.get_connection()
+        conn.execute('DROP TABLE sales_manager_daily')
+        conn.execute('DROP TRIGGER trg_invoices_sales_manager_daily_insert')
+        conn.execute('DROP TRIGGER trg_invoices_sales_manager_daily_delete')
+        conn.commit()
+        conn.close()
+        assert InvoiceDatabase(db_path).get_sales_manager_performance(today, today) == performance
+
+        # Clearing every invoice brings every counter back to zero
+        conn = database.get_connection()
+        conn.execute('DELETE FROM invoices')
+        conn.commit()
+        assert conn.execute('''
+            SELECT SUM(invoice_count), SUM(quantity), SUM(net_kobo), SUM(new_schools) FROM sales_manager_daily
+        ''').fetchone() == (0, 0, 0, 0)
+        conn.close()
+        print("✅ Sales manager counters track inserts, deletes and acquired schools")
+
+
+def test_rollups_refuse_updates():
+    """Updating a rolled-up column in place is refused; other columns can change"""
+    with tempfile.TemporaryDirectory() as workdir:
+        database = InvoiceDatabase(os.path.join(workdir, 'guards.db'))
+        invoice_id = database.save_invoice(manager_invoice('HO/IN/G1', 'ALPHA SCHOOL', 'ADA', 1000, 3))
+
+        conn = database.get_connection()
+        for statement in ("UPDATE invoices SET sales_manager = 'BAYO' WHERE id = ?",
+                          "UPDATE invoices SET net_total_kobo = net_total_kobo + 1 WHERE id = ?",
+                          "UPDATE invoice_items SET quantity = 9 WHERE invoice_id = ?"):
+            try:
+                conn.execute(statement, (invoice_id,))
+                assert False, f"{statement} was allowed"
+            except sqlite3.IntegrityError:
+                conn.rollback()
+
+        # Unchanged values and columns no rollup reads are fine
+        conn.execute("UPDATE invoices SET sales_manager = 'ADA', customer_phone = '0800' WHERE id = ?", (invoice_id,))
+        conn.commit()
+        conn.close()
+        assert database.get_invoice_by_id(invoice_id)['customer_phone'] == '0800'
+        print("✅ Rolled-up invoice columns can't be updated in place")
+
+
+def test_revenue_series_matches_summary():
+    """Per-type series from invoice_type_daily add up to get_invoice_summary"""
+    with tempfile.TemporaryDirectory() as workdir:
+        database = InvoiceDatabase(os.path.join(workdir, 'series.db'))
+        first_id = database.save_invoice(manager_invoice('HO/IN/T1', 'ALPHA SCHOOL', 'ADA', 1000, 3, 10.0))
+        cash = manager_invoice('HO/IN/T2', 'BETA SCHOOL', 'ADA', 333.33, 7, 5.0)
+        cash['invoice_type'] = 'cash'
+        database.save_invoice(cash)
+        database.create_discounted_invoice(first_id)
+
+        conn = database.get_connection()
+        today = conn.execute('SELECT DATE(created_at) FROM invoices WHERE id = ?', (first_id,)).fetchone()[0]
+        conn.close()
+
+        series = database.get_revenue_series(today[:8] + '01', today, 'week')
+        summary = database.get_invoice_summary(today[:8] + '01', today)
+        assert series['periods'] == [point['period'] for point in series['totals']]
+        assert sorted(series['by_type']) == ['cash', 'credit']
+        assert sum(point['count'] for point in series['totals']) == summary['total_invoices'] == 3
+        for field, total in (('quantity', 'total_quantity'), ('gross_kobo', 'total_gross_kobo'),
+                             ('discount_kobo', 'total_discount_kobo'), ('net_kobo', 'total_net_kobo')):
+            assert sum(point[field] for point in series['totals']) == summary[total], field
+        by_type = {row['invoice_type']: row['total_amount_kobo'] for row in summary['by_type']}
+        assert {name: sum(point['net_kobo'] for point in points)
+                for name, points in series['by_type'].items()} == by_type
+
+        only_cash = database.get_revenue_series(today, today, 'day', 'cash')
+        assert list(only_cash['by_type']) == ['cash'] and only_cash['totals'][0]['count'] == 1
+
+        try:
+            database.get_revenue_series('2000-01-01', '2100-01-01', 'day')
+            assert False, "a century of days was accepted"
+        except ValueError:
+            pass
+        print("✅ Revenue series by invoice type adds up to the summary")
+
+
+def test_vectorised_summary_matches_sql():
+    """analytics.invoice_summary agrees with get_invoice_summary and adds percentiles"""
+    with tempfile.TemporaryDirectory() as workdir:
+        database = InvoiceDatabase(os.path.join(workdir, 'analytics.db'))
+        for index in range(12):
+            invoice = manager_invoice(f"HO/IN/A{index}", f"SCHOOL {index % 5}", 'ADA', 100.05 * (index + 1), index + 1,
+                                      7.5 if index % 2 else 0)
+            invoice['invoice_type'] = ('credit', 'cash', 'special_market')[index % 3]
+            database.save_invoice(invoice)
+
+        summary = analytics.invoice_summary(database, '2000-01-01', '2100-01-01')
+        expected = database.get_invoice_summary('2000-01-01', '2100-01-01')
+        for key, value in expected.items():
+            assert summary[key] == value, key
+
+        nets = sorted(invoice['net_total_kobo'] for invoice in database.get_invoices_by_date_range('2000-01-01', '2100-01-01'))
+        assert summary['average_net_kobo'] == round(sum(nets) / len(nets))
+        assert summary['net_percentiles']['p50_kobo'] == round((nets[5] + nets[6]) / 2)
+        assert money.as_naira(summary)['net_percentiles']['p99'] is not None
+
+        empty = analytics.invoice_summary(database, '1990-01-01', '1990-12-31')
+        assert (empty['total_invoices'], empty['total_net_kobo'], empty['by_type']) == (0, 0, [])
+        assert empty['net_percentiles']['p90_kobo'] is None
+        print("✅ Vectorised summary matches the SQL summary")
+
+
+def test_range_versions_and_closed_months():
+    """A write only moves the versions of ranges holding its day; closed months stay cached"""
+    with tempfile.TemporaryDirectory() as workdir:
+        database = InvoiceDatabase(os.path.join(workdir, 'versions.db'))
+        conn = database.get_connection()
+
+        def insert(invoice_number, day, school_id=None):
+            cursor = conn.execute('''
+                INSERT INTO invoices (invoice_number, invoice_type, customer_name, sales_manager, bank_name,
+                                      account_number, total_quantity, gross_total_kobo, discount_percent,
+                                      discount_amount_kobo, net_total_kobo, school_id, created_at)
+                VALUES (?, 'credit', 'VERSION SCHOOL', 'ADA', 'ZENITH BANK', '1229600064', 1, 100, 0, 0, 100, ?, ?)
+            ''', (invoice_number, school_id, f"{day} 09:30:00"))
+            conn.commit()
+            return cursor.lastrowid
+
+        first_id = insert('HO/IN/V1', '2025-01-10', school_id=7)
+        insert('HO/IN/V2', '2025-03-05', school_id=7)
+        january = database.get_range_version('2025-01-01', '2025-01-31')
+        march = database.get_range_version('2025-03-01', '2025-03-31')
+
+        insert('HO/IN/V3', '2025-01-20')
+        assert database.get_range_version('2025-01-01', '2025-01-31') > january
+        assert database.get_range_version('2025-03-01', '2025-03-31') == march
+
+        # The school's acquisition moves to its March invoice, so March changes too
+        conn.execute('DELETE FROM invoices WHERE id = ?', (first_id,))
+        conn.commit()
+        assert database.get_range_version('2025-03-01', '2025-03-31') > march
+        conn.close()
+
+    computed = []
+    for version in (1, 1, 2):
+        singleflight.cached_report('test', '2020-01-01', '2020-01-31', version, lambda: computed.append(version) or version)
+    assert singleflight.is_closed('2020-01-31') and not singleflight.is_closed('2999-01-31')
+    assert computed == [1, 2], "a closed month was recomputed without a write in it"
+
+    # The closed tier is bounded by bytes as well as entries
+    cache = singleflight.ResultCache(None, 10, max_bytes=100)
+    cache.put('a', b'x' * 60)
+    cache.put('b', {'summary': 'y' * 20})
+    cache.put('c', b'z' * 60)
+    cache.put('too big', b'!' * 101)
+    assert (cache.get('a'), cache.get('too big')) == (None, None)
+    assert cache.get('b') is not None and cache.get('c') is not None
+    print("✅ Per-day versions scope cache invalidation to the written range")
+
+
+def test_discounted_copy_keeps_original_day():
+    """A discounted copy made later is dated and attributed like its original"""
+    with tempfile.TemporaryDirectory() as workdir:
+        database = InvoiceDatabase(os.path.join(workdir, 'copies.db'))
+        conn = database.get_connection()
+        original_id = conn.execute('''
+            INSERT INTO invoices (invoice_number, invoice_type, customer_name, sales_manager, bank_name,
+                                  account_number, total_quantity, gross_total_kobo, discount_percent,
+                                  discount_amount_kobo, net_total_kobo, school_id, created_at)
+            VALUES ('HO/IN/D1', 'credit', 'COPY SCHOOL', 'ADA', 'ZENITH BANK', '1229600064', 2, 10000, 0, 0, 10000,
+                    7, '2025-01-10 09:30:00')
+        ''').lastrowid
+        conn.commit()
+        january = database.get_range_version('2025-01-01', '2025-01-31')
+        today = conn.execute("SELECT DATE('now')").fetchone()[0]
+        today_version = database.get_range_version(today, today)
+
+        copy_id = database.create_discounted_invoice(original_id, 20.0)
+        copy = conn.execute('SELECT created_at, school_id, net_total_kobo FROM invoices WHERE id = ?',
+                            (copy_id,)).fetchone()
+        assert copy == ('2025-01-10 09:30:00', 7, 8000), copy
+
+        assert conn.execute('''
+            SELECT invoice_count, net_kobo FROM invoice_type_daily WHERE day = '2025-01-10' AND invoice_type = 'credit'
+        ''').fetchone() == (2, 18000)
+        assert database.get_range_version('2025-01-01', '2025-01-31') > january
+        assert database.get_range_version(today, today) == today_version
+        assert database.get_invoice_summary(today, today)['total_invoices'] == 0
+        conn.close()
+    print("✅ Discounted copies land on their original's day and school")
+
+
+def test_date_range_queries_use_index():
+    """Report and export date filters search idx_invoices_date, end day included"""
+    with tempfile.TemporaryDirectory() as workdir:
+        database = InvoiceDatabase(os.path.join(workdir, 'plans.db'))
+        for index in range(3):
+            database.save_invoice(manager_invoice(f"HO/IN/Q{index}", 'PLAN SCHOOL', 'Ada', 100, 1))
+        conn = database.get_connection()
+        today = conn.execute('SELECT DATE(MAX(created_at)) FROM invoices').fetchone()[0]
+
+        query_log.reset_stats()
+        assert database.get_invoice_summary(today, today)['total_invoices'] == 3
+        assert len(list(database.iter_invoice_headers(today, today))) == 3
+        assert len(list(database.iter_report_line_items(today, today))) == 3
+        assert len(database.get_invoice_numbers(today, today)) == 3
+        assert len(database.get_invoices_by_date_range(today, today)) == 3
+        assert database.get_invoice_numbers('2000-01-01', '2000-01-31') == []
+
+        ranged = [row for row in query_log.query_stats() if 'created_at >= ?' in row['sql']]
+        # Summary (3 statements), headers, line items, numbers, by-date-range
+        assert len(ranged) == 7, [row['sql'] for row in ranged]
+        for row in ranged:
+            assert row['full_scan_plan'] is None, row
+            plan = [
+                step[-1] for step in
+                sqlite3.Connection.execute(conn, f"EXPLAIN QUERY PLAN {row['sql']}", (today, today)).fetchall()
+            ]
+            assert any('USING INDEX idx_invoices_date' in step for step in plan), (row['sql'], plan)
+        conn.close()
+        print("✅ Date-range report queries search idx_invoices_date")
+
+
+def test_xlsx_export_summary():
+    """The XLSX summary sheet comes from SQL aggregates, not a DataFrame of the range"""
+    import app
+
+    with tempfile.TemporaryDirectory() as workdir:
+        database = InvoiceDatabase(os.path.join(workdir, 'export.db'))
+        for index, (customer, price) in enumerate([('ALPHA SCHOOL', 100), ('BETA SCHOOL', 250), ('ALPHA SCHOOL', 50)]):
+            database.save_invoice(manager_invoice(f"HO/IN/X{index}", customer, 'Ada', price, 2, discount_percent=10))
+        conn = database.get_connection()
+        today = conn.execute('SELECT DATE(MAX(created_at)) FROM invoices').fetchone()[0]
+        conn.close()
+
+        def no_dataframe(*args, **kwargs):
+            raise AssertionError('the XLSX export loaded the whole range into a DataFrame')
+
+        previous_db, load_invoices = app.db, analytics.load_invoices
+        app.db, analytics.load_invoices = database, no_dataframe
+        try:
+            response = app.app.test_client().get(
+                f"/api/reports/export?start_date={today}&end_date={today}&format=xlsx"
+            )
+            assert response.status_code == 200
+            workbook = load_workbook(io.BytesIO(response.data), read_only=True)
+        finally:
+            app.db, analytics.load_invoices = previous_db, load_invoices
+
+        summary = {row[0]: row[1] for row in workbook['Summary'].iter_rows(values_only=True) if row and row[0]}
+        assert summary['Total Invoices'] == 3
+        assert summary['Gross Total (N)'] == 800.0
+        assert summary['Net Total (N)'] == 720.0
+        assert 'Average Invoice (N)' not in summary
+        assert summary['ALPHA SCHOOL'] == 2 and summary['BETA SCHOOL'] == 1
+        assert sum(1 for _ in workbook['Invoices'].iter_rows(min_row=2)) == 3
+        workbook.close()
+    print("✅ XLSX export summary sheet built from SQL aggregates")
+
+
+if __name__ == "__main__":
+    print("🧪 Testing report rollups...")
+    print("=" * 50)
+    test_periods()
+    test_sales_manager_counters()
+    test_rollups_refuse_updates()
+    test_revenue_series_matches_summary()
+    test_vectorised_summary_matches_sql()
+    test_range_versions_and_closed_months()
+    test_discounted_copy_keeps_original_day()
+    test_date_range_queries_use_index()
+    test_xlsx_export_summary()
+    print("=" * 50)
+    print("🎉 Report testing completed!")
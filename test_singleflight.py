@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Tests for report request coalescing and the report result cache
+
+Runs locally with threads against a throwaway database (no server needed):
+concurrent misses for the same report share one computation, open-range
+results (and report PDFs, whatever their range) expire after their TTL,
+and saving an invoice moves the range version so the next request
+recomputes instead of serving a stale result.
+"""
+
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+import singleflight
+from database import InvoiceDatabase
+from test_concurrency import sample_invoice
+
+THREADS = 8
+
+
+def run_together(target, count=THREADS):
+    """Start count threads on target at the same moment and return their results"""
+    barrier = threading.Barrier(count)
+    results = [None] * count
+    errors = []
+
+    def worker(index):
+        barrier.wait()
+        try:
+            results[index] = target()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+
+def test_concurrent_misses_coalesce():
+    """Simultaneous requests for an uncached report run its computation once"""
+    calls = []
+
+    def compute():
+        calls.append(threading.get_ident())
+        time.sleep(0.3)
+        return {'total_invoices': len(calls)}
+
+    coalesced = singleflight.COALESCED.value(endpoint='coalesce-test')
+    results, errors = run_together(
+        lambda: singleflight.cached_report('coalesce-test', '2999-01-01', '2999-01-31', 1, compute)
+    )
+    assert errors == []
+    assert len(calls) == 1, calls
+    assert results == [{'total_invoices': 1}] * THREADS
+    assert singleflight.COALESCED.value(endpoint='coalesce-test') - coalesced == THREADS - 1
+
+    # A failed computation is shared too, and not cached: the next call retries
+    failures = []
+
+    def failing():
+        failures.append(1)
+        time.sleep(0.3)
+        raise RuntimeError('report query failed')
+
+    results, errors = run_together(
+        lambda: singleflight.cached_report('coalesce-test', '2999-02-01', '2999-02-28', 1, failing)
+    )
+    assert len(failures) == 1 and len(errors) == THREADS
+    assert all(str(error) == 'report query failed' for error in errors)
+    assert singleflight.cached_report('coalesce-test', '2999-02-01', '2999-02-28', 1, lambda: 'ok') == 'ok'
+    print(f"✅ {THREADS} concurrent misses shared one computation")
+
+
+def test_results_expire():
+    """Open-range results are recomputed once REPORT_CACHE_SECONDS have passed"""
+    cache = singleflight.ResultCache(0.2, 4)
+    cache.put('report', {'total_invoices': 1})
+    assert cache.get('report') == {'total_invoices': 1}
+    time.sleep(0.3)
+    assert cache.get('report') is None
+
+    calls = []
+    previous = singleflight._cache
+    singleflight._cache = singleflight.ResultCache(0.2, 4)
+    try:
+        def report():
+            return singleflight.cached_report('ttl-test', '2999-01-01', '2999-01-31', 1, lambda: calls.append(1) or len(calls))
+
+        results, errors = run_together(report)
+        assert errors == [] and results == [1] * THREADS
+        assert report() == 1
+        time.sleep(0.3)
+        assert report() == 2
+
+        # Closed ranges are kept, unless the result opts out (e.g. timestamped PDFs)
+        def closed_report(keep_closed):
+            return singleflight.cached_report(
+                'ttl-test', '2020-01-01', '2020-01-31', 1, lambda: calls.append(1) or len(calls), keep_closed
+            )
+
+        assert closed_report(False) == 3
+        assert closed_report(False) == 3
+        time.sleep(0.3)
+        assert closed_report(False) == 4
+        assert closed_report(True) == 5
+        time.sleep(0.3)
+        assert closed_report(True) == 5
+    finally:
+        singleflight._cache = previous
+    print("✅ Cached report results expire after their TTL")
+
+
+def test_save_invalidates_range():
+    """Saving an invoice changes its day's range version, so the report is recomputed"""
+    with tempfile.TemporaryDirectory() as workdir:
+        database = InvoiceDatabase(os.path.join(workdir, 'singleflight.db'))
+        # created_at defaults to CURRENT_TIMESTAMP, which is UTC
+        today = datetime.now(timezone.utc).strftime('%Y-%m-%d')
+        computed = []
+
+        def summary(start_date, end_date):
+            def compute():
+                computed.append((start_date, end_date))
+                return database.get_invoice_summary(start_date, end_date)['total_invoices']
+            return singleflight.cached_report(
+                'invalidation-test', start_date, end_date, database.get_range_version(start_date, end_date), compute
+            )
+
+        database.save_invoice(sample_invoice('HO/IN/SF1'))
+        results, errors = run_together(lambda: summary(today, today))
+        assert errors == [] and results == [1] * THREADS
+        assert summary('2000-01-01', '2000-01-31') == 0
+        assert len(computed) == 2
+
+        # Saved from other threads, as other requests (or workers) would
+        writers = [
+            threading.Thread(target=database.save_invoice, args=(sample_invoice(f"HO/IN/SF{index}"),))
+            for index in (2, 3)
+        ]
+        for writer in writers:
+            writer.start()
+        for writer in writers:
+            writer.join()
+
+        results, errors = run_together(lambda: summary(today, today))
+        assert errors == [] and results == [3] * THREADS
+        # The range without the new invoices' day kept its cached result
+        assert summary('2000-01-01', '2000-01-31') == 0
+        assert computed == [(today, today), ('2000-01-01', '2000-01-31'), (today, today)], computed
+    print("✅ Saving an invoice invalidates cached reports for its day only")
+
+
+if __name__ == "__main__":
+    print("🧪 Testing report coalescing and caching...")
+    print("=" * 50)
+    test_concurrent_misses_coalesce()
+    test_results_expire()
+    test_save_invalidates_range()
+    print("=" * 50)
+    print("🎉 Singleflight testing completed!")
@@ -0,0 +1,71 @@
+"""
+Calendar buckets for report time series
+
+A series is reported per day, per week (starting Monday) or per month. Each
+period is labelled by its first day as YYYY-MM-DD, both in SQL (bucket_sql)
+and in Python (periods), so rows grouped by the database can be matched up
+with the full list of periods and the gaps filled with zeros. Charts then
+get one point per period even when nothing was sold.
+"""
+
+import os
+from datetime import date, timedelta
+
+INTERVALS = ('day', 'week', 'month')
+
+# Longest series a report will build; asking for more is a client error, not a slow response
+SERIES_MAX_PERIODS = int(os.environ.get('SERIES_MAX_PERIODS', 1000))
+
+_BUCKET_SQL = {
+    'day': 'DATE({column})',
+    # 'weekday 1' moves forward to a Monday, so step back six days first
+    'week': "DATE({column}, '-6 days', 'weekday 1')",
+    'month': "DATE({column}, 'start of month')",
+}
+
+
+def check_interval(interval: str) -> str:
+    if interval not in INTERVALS:
+        raise ValueError(f"Interval must be one of {', '.join(INTERVALS)}")
+    return interval
+
+
+def bucket_sql(interval: str, column: str) -> str:
+    """SQL expression giving the first day of the period a date or timestamp column falls in"""
+    return _BUCKET_SQL[check_interval(interval)].format(column=column)
+
+
+def period_start(day: date, interval: str) -> date:
+    if interval == 'week':
+        return day - timedelta(days=day.weekday())
+    if interval == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def periods(start_date: str, end_date: str, interval: str) -> list:
+    """Every period label from the one holding start_date to the one holding end_date"""
+    check_interval(interval)
+    current = period_start(date.fromisoformat(start_date), interval)
+    last = date.fromisoformat(end_date)
+    labels = []
+    while current <= last:
+        if len(labels) == SERIES_MAX_PERIODS:
+            raise ValueError(f"Range spans more than {SERIES_MAX_PERIODS} periods; use a longer interval")
+        labels.append(current.isoformat())
+        if interval == 'day':
+            current += timedelta(days=1)
+        elif interval == 'week':
+            current += timedelta(weeks=1)
+        else:
+            current = (current + timedelta(days=32)).replace(day=1)
+    return labels
+
+
+def zero_fill(rows, start_date: str, end_date: str, interval: str, fields) -> list:
+    """Rows keyed by 'period', one per period in the range, with zeros for the missing ones"""
+    by_period = {row['period']: row for row in rows}
+    return [
+        by_period.get(period) or dict({'period': period}, **{field: 0 for field in fields})
+        for period in periods(start_date, end_date, interval)
+    ]
@@ -0,0 +1,152 @@
+"""
+Lightweight per-request stage tracing
+
+Code marks stages with ``with tracing.span('create_invoice_pdf'):``. While a
+request is being handled the spans are collected on its trace; outside a
+request span() costs one context variable lookup and records nothing.
+
+Each response gets a Server-Timing header with the stage durations (visible
+in the browser dev tools), and the slowest TRACE_SLOWEST_N requests of this
+worker are kept with their full breakdown for the /debug page.
+"""
+
+import contextvars
+import heapq
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+TRACE_SLOWEST_N = int(os.environ.get('TRACE_SLOWEST_N', 20))
+
+_current_trace = contextvars.ContextVar('current_trace', default=None)
+
+
+class RequestTrace:
+    """Timed stages of one request, as (name, start offset, duration) in seconds"""
+
+    def __init__(self, method, path, endpoint):
+        self.method = method
+        self.path = path
+        self.endpoint = endpoint
+        self.started_at = datetime.now()
+        self.started = time.perf_counter()
+        self.duration = None
+        self.status = None
+        self.spans = []
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def stage_totals(self):
+        """Total seconds per stage name, in first-seen order"""
+        totals = {}
+        for name, _, duration in self.spans:
+            totals[name] = totals.get(name, 0.0) + duration
+        return totals
+
+    def to_dict(self):
+        return {
+            'method': self.method,
+            'path': self.path,
+            'endpoint': self.endpoint,
+            'status': self.status,
+            'started_at': self.started_at.isoformat(timespec='seconds'),
+            'duration_ms': round(self.duration * 1000, 2),
+            'spans': [
+                {'name': name, 'start_ms': round(offset * 1000, 2), 'duration_ms': round(duration * 1000, 2)}
+                for name, offset, duration in self.spans
+            ]
+        }
+
+
+class SlowestRequests:
+    """Thread-safe min-heap holding the N slowest finished traces"""
+
+    def __init__(self, size):
+        self.size = size
+        self._heap = []
+        self._counter = itertools.count()  # Tie-breaker so traces are never compared
+        self._lock = threading.Lock()
+
+    def add(self, trace):
+        entry = (trace.duration, next(self._counter), trace)
+        with self._lock:
+            if len(self._heap) < self.size:
+                heapq.heappush(self._heap, entry)
+            elif trace.duration > self._heap[0][0]:
+                heapq.heapreplace(self._heap, entry)
+
+    def snapshot(self):
+        """Traces slowest first"""
+        with self._lock:
+            entries = sorted(self._heap, reverse=True, key=lambda entry: entry[:2])
+        return [trace for _, _, trace in entries]
+
+    def clear(self):
+        with self._lock:
+            self._heap = []
+
+
+slowest_requests = SlowestRequests(TRACE_SLOWEST_N)
+
+
+@contextmanager
+def span(name):
+    """Time a stage of the current request (no-op outside a request)"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.spans.append((name, started - trace.started, time.perf_counter() - started))
+
+
+def server_timing(trace):
+    """Server-Timing header value: each stage's total plus the request so far"""
+    parts = [f"{name};dur={duration * 1000:.1f}" for name, duration in trace.stage_totals().items()]
+    parts.append(f"total;dur={trace.elapsed() * 1000:.1f}")
+    return ', '.join(parts)
+
+
+def init_app(app):
+    """Trace every request, add Server-Timing and expose the slowest requests"""
+    from flask import jsonify, request
+
+    @app.before_request
+    def _start_trace():
+        _current_trace.set(RequestTrace(request.method, request.path, request.endpoint))
+
+    @app.after_request
+    def _add_server_timing(response):
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.status = response.status_code
+            response.headers['Server-Timing'] = server_timing(trace)
+        return response
+
+    @app.teardown_request
+    def _finish_trace(error=None):
+        trace = _current_trace.get()
+        if trace is None:
+            return
+        _current_trace.set(None)
+        trace.duration = trace.elapsed()
+        if trace.status is None:
+            trace.status = 500
+        slowest_requests.add(trace)
+
+    @app.route('/api/debug/slow-requests')
+    def slow_requests():
+        """Slowest requests seen by this worker, with stage breakdowns"""
+        return jsonify({
+            'success': True,
+            'pid': os.getpid(),
+            'capacity': slowest_requests.size,
+            'requests': [trace.to_dict() for trace in slowest_requests.snapshot()]
+        })